@@ -0,0 +1,81 @@
+"""Final block generation and evaluation of two parties."""
+import pytest
+
+import numpy as np
+
+from blocklib import assess_blocks, assess_blocks_2party, count_candidate_pairs, generate_blocks, \
+    generate_candidate_blocks, generate_candidate_pairs, generate_reverse_blocks
+from blocklib.blocks_generator import generate_blocks_psig
+from blocklib.simmeasure import DiceSim
+
+from configs import LAMBDA_SCHEMA, PSIG_SCHEMA
+from synthetic import HEADER
+
+
+@pytest.fixture(scope='session')
+def psig_candidates(pii_pair):
+    data_a, data_b, _, _ = pii_pair
+    return [generate_candidate_blocks(data, PSIG_SCHEMA, header=HEADER) for data in (data_a, data_b)]
+
+
+@pytest.fixture(scope='session')
+def lambda_candidates(pii_pair):
+    data_a, data_b, _, _ = pii_pair
+    return [generate_candidate_blocks(data, LAMBDA_SCHEMA, header=HEADER) for data in (data_a, data_b)]
+
+
+def bench_generate_blocks_psig(run, record_postings, psig_candidates):
+    reversed_indices = [c.blocks for c in psig_candidates]
+    states = [c.state for c in psig_candidates]
+    record_postings(reversed_indices)
+    blocks = run(generate_blocks_psig, reversed_indices, states, threshold=2)
+    assert len(blocks) == 2
+
+
+def bench_generate_blocks_default(run, record_postings, lambda_candidates):
+    record_postings([c.blocks for c in lambda_candidates])
+    run(generate_blocks, lambda_candidates, K=2)
+
+
+@pytest.mark.parametrize('as_arrays', [False, True])
+def bench_generate_reverse_blocks(run, record_postings, psig_candidates, as_arrays):
+    blocks = generate_blocks(psig_candidates, K=2)
+    record_postings(blocks)
+    run(generate_reverse_blocks, blocks, as_arrays=as_arrays)
+
+
+def bench_assess_blocks_2party(run, record_postings, pii_pair, psig_candidates):
+    _, _, entities_a, entities_b = pii_pair
+    blocks = generate_blocks(psig_candidates, K=2)
+    record_postings(blocks)
+    rr, pc = run(assess_blocks_2party, blocks, [entities_a, entities_b])
+    assert 0 <= rr <= 1 and 0 <= pc <= 1
+
+
+def bench_assess_blocks(run, pii_pair, psig_candidates):
+    _, _, entities_a, entities_b = pii_pair
+    blocks = generate_blocks(psig_candidates, K=2)
+    assessment = run(assess_blocks, blocks, [entities_a, entities_b])
+    assert 0 <= assessment['f_measure'] <= 1
+
+
+def bench_candidate_pairs(run, benchmark, psig_candidates):
+    blocks = generate_blocks(psig_candidates, K=2)
+    benchmark.extra_info['num_pairs'] = run(count_candidate_pairs, blocks)
+
+
+def bench_dice_candidate_pairs(run, benchmark, pii_pair, psig_candidates):
+    data_a, data_b, _, _ = pii_pair
+    blocks = generate_blocks(psig_candidates, K=2)
+    pairs = list(generate_candidate_pairs(blocks))
+    rows_a = np.concatenate([ids_a for ids_a, _ in pairs])
+    rows_b = np.concatenate([ids_b for _, ids_b in pairs])
+    dice = DiceSim(dict(ngram_len=2, ngram_padding=True, padding_start_char='^', padding_end_char='$'))
+
+    def score():
+        names_a, names_b = ([row[1] + ' ' + row[2] for row in data] for data in (data_a, data_b))
+        return dice.sim_pairs(dice.encode(names_a), dice.encode(names_b), rows_a, rows_b)
+
+    benchmark.extra_info['num_pairs'] = len(rows_a)
+    sims = run(score)
+    assert ((0 <= sims) & (sims <= 1)).all()
@@ -0,0 +1,38 @@
+"""Building the candidate blocks of P-Sig and Lambda-fold."""
+import pytest
+
+from blocklib import PPRLIndexLambdaFold, PPRLIndexPSignature
+
+from configs import LAMBDA_CLK_SCHEMA, LAMBDA_SCHEMA, PSIG_SCHEMA
+from synthetic import HEADER
+
+
+@pytest.mark.parametrize('two_pass', [False, True])
+def bench_psig_build_reversed_index(run, record_postings, pii, two_pass):
+    def build():
+        return PPRLIndexPSignature(PSIG_SCHEMA['config']).build_reversed_index(pii, HEADER, two_pass=two_pass)
+
+    record_postings([run(build).reversed_index])
+
+
+def bench_psig_build_reversed_index_columnar(run, record_postings, pii):
+    columns = {name: [record[i] for record in pii] for i, name in enumerate(HEADER)}
+
+    def build():
+        return PPRLIndexPSignature(PSIG_SCHEMA['config']).build_reversed_index(columns)
+
+    record_postings([run(build).reversed_index])
+
+
+def bench_lambda_fold_build_reversed_index(run, record_postings, pii):
+    def build():
+        return PPRLIndexLambdaFold(LAMBDA_SCHEMA['config']).build_reversed_index(pii, HEADER)
+
+    record_postings([run(build).reversed_index])
+
+
+def bench_lambda_fold_build_reversed_index_clks(run, record_postings, clks):
+    def build():
+        return PPRLIndexLambdaFold(LAMBDA_CLK_SCHEMA['config']).build_reversed_index(clks)
+
+    record_postings([run(build).reversed_index])
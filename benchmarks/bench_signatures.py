@@ -0,0 +1,38 @@
+"""Signature generation and bloom filter hashing."""
+from blocklib import PPRLIndexPSignature, flip_bloom_filter, flip_bloom_filters, generate_signatures
+from blocklib.signature_generator import compile_signature_strategies
+
+from configs import PSIG_SCHEMA
+from synthetic import HEADER
+
+FEATURE_TO_INDEX = {name: i for i, name in enumerate(HEADER)}
+
+
+def bench_generate_signatures(run, pii):
+    state = PPRLIndexPSignature(PSIG_SCHEMA['config'])
+
+    def generate_all():
+        return [generate_signatures(state.signature_strategies, record, state.null_sentinel, FEATURE_TO_INDEX)
+                for record in pii]
+
+    run(generate_all)
+
+
+def bench_compiled_signatures(run, pii):
+    state = PPRLIndexPSignature(PSIG_SCHEMA['config'])
+
+    def generate_all():
+        generate = compile_signature_strategies(state.signature_strategies, state.null_sentinel, FEATURE_TO_INDEX)
+        return [generate(record) for record in pii]
+
+    run(generate_all)
+
+
+def bench_flip_bloom_filter(run, pii):
+    strings = ['0_{}'.format(record[2]) for record in pii]
+    run(lambda: [flip_bloom_filter(s, 2048, 20) for s in strings])
+
+
+def bench_flip_bloom_filters(run, pii):
+    strings = ['0_{}'.format(record[2]) for record in pii]
+    run(flip_bloom_filters, strings, 2048, 20)
@@ -0,0 +1,40 @@
+"""Blocking schemas used by the benchmarks, for the columns of `synthetic.HEADER`."""
+
+PSIG_SCHEMA = {
+    'type': 'p-sig',
+    'version': 1,
+    'config': {
+        'blocking-features': ['firstname', 'lastname'],
+        'filter': {'type': 'ratio', 'max': 0.02, 'min': 0.0},
+        'blocking-filter': {'type': 'bloom filter', 'number-hash-functions': 4, 'bf-len': 2048},
+        'signatureSpecs': [
+            [{'type': 'characters-at', 'feature': 'firstname', 'config': {'pos': [0]}},
+             {'type': 'characters-at', 'feature': 'lastname', 'config': {'pos': [0]}}],
+            [{'type': 'feature-value', 'feature': 'firstname'},
+             {'type': 'feature-value', 'feature': 'postcode'}],
+            [{'type': 'metaphone', 'feature': 'lastname'}],
+            [{'type': 'characters-at', 'feature': 'firstname', 'config': {'pos': [':2']}},
+             {'type': 'feature-value', 'feature': 'dob'}],
+        ],
+    },
+}
+
+LAMBDA_SCHEMA = {
+    'type': 'lambda-fold',
+    'version': 1,
+    'config': {
+        'blocking-features': ['firstname', 'lastname'],
+        'Lambda': 5,
+        'bf-len': 1024,
+        'num-hash-funcs': 20,
+        'K': 40,
+        'random_state': 0,
+        'input-clks': False,
+    },
+}
+
+LAMBDA_CLK_SCHEMA = {
+    'type': 'lambda-fold',
+    'version': 1,
+    'config': dict(LAMBDA_SCHEMA['config'], **{'blocking-features': [0], 'input-clks': True}),
+}
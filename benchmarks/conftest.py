@@ -0,0 +1,114 @@
+"""Shared options, data fixtures and measurements of the benchmark suite."""
+import resource
+import sys
+import threading
+import time
+from typing import Any, Callable, List, Mapping
+
+import pytest
+
+from synthetic import synthetic_clks, synthetic_pii, synthetic_pii_pair
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('blocklib benchmarks')
+    group.addoption('--records', default='10000',
+                    help='comma separated dataset sizes to benchmark, e.g. 10000,100000,1000000')
+    group.addoption('--rounds', type=int, default=3, help='number of timed rounds per benchmark')
+
+
+def pytest_generate_tests(metafunc):
+    if 'num_records' in metafunc.fixturenames:
+        sizes = [int(n) for n in metafunc.config.getoption('records').split(',')]
+        metafunc.parametrize('num_records', sizes, scope='session')
+
+
+@pytest.fixture(scope='session')
+def pii(num_records):
+    """num_records synthetic PII records."""
+    return synthetic_pii(num_records)
+
+
+@pytest.fixture(scope='session')
+def pii_pair(num_records):
+    """(data_a, data_b, entities_a, entities_b) with half of the entities in both datasets."""
+    return synthetic_pii_pair(num_records)
+
+
+@pytest.fixture(scope='session')
+def clks(pii):
+    """Base64 encoded 1024 bit CLKs of the synthetic PII."""
+    return synthetic_clks(pii)
+
+
+def _current_rss() -> int:
+    """Resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # no procfs, fall back to the peak of the process
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+class PeakRSSMonitor:
+    """Sample the resident set size in a background thread and keep the peak above the baseline."""
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = _current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss())
+
+    @property
+    def increase(self) -> int:
+        return self.peak - self.baseline
+
+
+@pytest.fixture
+def run(benchmark, request):
+    """Benchmark func(*args) and record the peak RSS increase of one extra call in extra_info.
+
+    Returns the result of that call, so the benchmark can add e.g. posting counts to extra_info.
+    """
+    rounds = request.config.getoption('rounds')
+
+    def run_benchmark(func: Callable, *args: Any, **kwargs: Any) -> Any:
+        with PeakRSSMonitor() as monitor:
+            result = func(*args, **kwargs)
+        benchmark.extra_info['peak_rss_increase_mb'] = round(monitor.increase / 2 ** 20, 2)
+        if 'num_records' in request.fixturenames:
+            benchmark.extra_info['num_records'] = request.getfixturevalue('num_records')
+        benchmark.pedantic(func, args=args, kwargs=kwargs, rounds=rounds, iterations=1)
+        return result
+
+    return run_benchmark
+
+
+@pytest.fixture
+def record_postings(benchmark):
+    """Record the number of blocks and record ids of reversed indices in extra_info."""
+
+    def record(reversed_indices: List[Mapping[Any, Any]]):
+        benchmark.extra_info['num_blocks'] = sum(len(blocks) for blocks in reversed_indices)
+        benchmark.extra_info['num_postings'] = sum(len(rec_ids) for blocks in reversed_indices
+                                                   for rec_ids in blocks.values())
+
+    return record
@@ -0,0 +1,115 @@
+"""Measure allocations per record of P-Sig signature generation.
+
+Compares the compiled signature plan with the previous behaviour of converting the
+whole record to strings for every signature spec. Run with::
+
+    $ poetry run python benchmarks/signature_allocations.py --records 20000 --width 30
+
+"""
+import argparse
+import random
+import string
+import time
+import tracemalloc
+from typing import Any, Callable, List, Sequence
+
+from pydantic.tools import parse_obj_as
+
+from blocklib.signature_generator import compile_signature_strategies, SIGNATURE_STRATEGIES
+from blocklib.validation import PSigSignatureModel
+
+
+SIGNATURE_SPECS = [
+    [
+        {"type": "feature-value", "feature": 1},
+        {"type": "feature-value", "feature": 2},
+    ],
+    [
+        {"type": "characters-at", "feature": 1, "config": {"pos": [":2"]}},
+        {"type": "characters-at", "feature": 2, "config": {"pos": [":2"]}},
+    ],
+    [
+        {"type": "characters-at", "feature": 1, "config": {"pos": [0]}},
+        {"type": "feature-value", "feature": 3},
+    ],
+    [
+        {"type": "feature-value", "feature": 4},
+    ],
+]
+
+
+def synthetic_records(num_records: int, width: int) -> List[tuple]:
+    """Records with an integer id, string name columns and integer filler columns."""
+    rnd = random.Random(0)
+
+    def word():
+        return ''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(3, 9)))
+
+    return [tuple([i, word(), word(), word(), rnd.randint(1000, 9999)] +
+                  [rnd.randint(0, 10 ** 6) for _ in range(width - 5)])
+            for i in range(num_records)]
+
+
+def legacy_generate_signatures(signature_strategies: List[PSigSignatureModel], dtuple: Sequence,
+                               null_sentinel: Any) -> List:
+    """Signature generation as done before the compiled plan: the whole record is stringified per spec."""
+    signatures = []
+    for i, strategy in enumerate(signature_strategies):
+        sig = []  # type: List
+        for spec in strategy:
+            attr_ind = spec.feature
+            if dtuple[attr_ind] == null_sentinel:
+                sig = []
+                break
+            args = dict(attr_ind=attr_ind, dtuple=[str(x) for x in dtuple])
+            if hasattr(spec, "config"):
+                args.update(spec.config)
+            sig.append(SIGNATURE_STRATEGIES[spec.type](**args))
+        if len(sig) > 0:
+            signatures.append((i, "{}_{}".format(i, "_".join([x for x in sig if x is not None]))))
+    return signatures
+
+
+def measure(name: str, generate: Callable[[Sequence], List], records: List[tuple]):
+    tracemalloc.start()
+    start = time.perf_counter()
+    total_bytes = 0
+    for dtuple in records:
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            # Python < 3.9 can't reset the peak, clearing the traces resets it as well
+            tracemalloc.clear_traces()
+        before, _ = tracemalloc.get_traced_memory()
+        generate(dtuple)
+        _, peak = tracemalloc.get_traced_memory()
+        total_bytes += peak - before
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+
+    # timing without tracemalloc overhead
+    start = time.perf_counter()
+    for dtuple in records:
+        generate(dtuple)
+    untraced = time.perf_counter() - start
+
+    n = len(records)
+    print(f'{name:>10}: {total_bytes / n:10.1f} peak bytes allocated per record, '
+          f'{untraced / n * 1e6:8.2f} us per record ({elapsed / n * 1e6:.2f} us traced)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--width', type=int, default=30, help='number of columns per record (at least 5)')
+    args = parser.parse_args()
+
+    records = synthetic_records(args.records, max(args.width, 5))
+    strategies = [parse_obj_as(PSigSignatureModel, s) for s in SIGNATURE_SPECS]
+    print(f'{args.records} records with {max(args.width, 5)} columns, {len(strategies)} strategies')
+    measure('legacy', lambda dtuple: legacy_generate_signatures(strategies, dtuple, ""), records)
+    measure('compiled', compile_signature_strategies(strategies, ""), records)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Synthetic PII and CLK data for the benchmarks.
+
+Names, postcodes and birth years are drawn from Zipf-like distributions over generated pools,
+so signature and block sizes are skewed like in real data. `synthetic_pii_pair` creates two
+datasets that share a fraction of their entities, with typos in the second one, which gives
+the ground truth for `assess_blocks_2party`.
+"""
+import base64
+from typing import List, Tuple
+
+import numpy as np
+
+from blocklib import generate_bloom_filters
+
+HEADER = ['id', 'firstname', 'lastname', 'dob', 'postcode', 'gender']
+
+_CONSONANTS = list('bcdfghjklmnprstvwz')
+_VOWELS = list('aeiouy')
+
+
+def name_pool(size: int, rng: np.random.Generator) -> np.ndarray:
+    """Distinct pronounceable names of 2 to 4 syllables."""
+    names = set()  # type: set
+    while len(names) < size:
+        num_syllables = rng.integers(2, 5)
+        names.add(''.join(rng.choice(_CONSONANTS) + rng.choice(_VOWELS) for _ in range(num_syllables)).title())
+    return np.array(sorted(names), dtype=object)
+
+
+def zipf_choice(pool: np.ndarray, num: int, rng: np.random.Generator, exponent: float = 1.1) -> np.ndarray:
+    """Draw num values from pool, the i-th value with a probability proportional to 1 / (i + 1) ** exponent."""
+    weights = 1.0 / np.arange(1, len(pool) + 1) ** exponent
+    return pool[rng.choice(len(pool), size=num, p=weights / weights.sum())]
+
+
+def synthetic_pii(num_records: int, seed: int = 0) -> List[Tuple[str, ...]]:
+    """Records with the columns of HEADER, the id is 'rec<i>'."""
+    rng = np.random.default_rng(seed)
+    first_names = zipf_choice(name_pool(2000, rng), num_records, rng)
+    last_names = zipf_choice(name_pool(20000, rng), num_records, rng)
+    years = rng.integers(1930, 2010, size=num_records)
+    months = rng.integers(1, 13, size=num_records)
+    days = rng.integers(1, 29, size=num_records)
+    postcodes = zipf_choice(np.arange(2000, 3000).astype(str).astype(object), num_records, rng, exponent=0.8)
+    genders = rng.choice(np.array(['M', 'F'], dtype=object), size=num_records)
+    return [('rec{}'.format(i), first, last, '{}/{:02d}/{:02d}'.format(y, m, d), pc, g)
+            for i, (first, last, y, m, d, pc, g) in enumerate(zip(
+                first_names, last_names, years.tolist(), months.tolist(), days.tolist(), postcodes, genders))]
+
+
+def _typo(value: str, rng: np.random.Generator) -> str:
+    pos = int(rng.integers(0, len(value)))
+    return value[:pos] + str(rng.choice(_VOWELS)) + value[pos + 1:]
+
+
+def synthetic_pii_pair(num_records: int, overlap: float = 0.5, typo_rate: float = 0.1,
+                       seed: int = 0) -> Tuple[List[Tuple[str, ...]], List[Tuple[str, ...]], List[int], List[int]]:
+    """Two datasets of num_records records that share overlap * num_records entities.
+
+    :return: (data_a, data_b, entities_a, entities_b) where entities_x[i] is the entity id of record i
+    """
+    rng = np.random.default_rng(seed + 1)
+    population = synthetic_pii(2 * num_records, seed)
+    num_shared = int(overlap * num_records)
+    entities_a = list(range(num_records))
+    entities_b = list(range(num_shared)) + list(range(num_records, 2 * num_records - num_shared))
+    rng.shuffle(entities_b)
+    data_a = [population[e] for e in entities_a]
+    data_b = []
+    for e in entities_b:
+        record = list(population[e])
+        if rng.random() < typo_rate:
+            field = int(rng.integers(1, 3))
+            record[field] = _typo(record[field], rng)
+        data_b.append(tuple(record))
+    return data_a, data_b, entities_a, entities_b
+
+
+def synthetic_clks(data: List[Tuple[str, ...]], bf_len: int = 1024, num_hash_funct: int = 20,
+                   batch_size: int = 10000) -> List[str]:
+    """Base64 encoded bloom filters of the bigrams of the name fields, as produced by clkhash."""
+    clks = []  # type: List[str]
+    for start in range(0, len(data), batch_size):
+        batch = data[start:start + batch_size]
+        grams = []
+        for record in batch:
+            s = record[1] + ' ' + record[2]
+            grams.append([s[i:i + 2] for i in range(len(s) - 1)])
+        packed = np.packbits(generate_bloom_filters(grams, bf_len, num_hash_funct), axis=1)
+        clks.extend(base64.b64encode(row.tobytes()).decode() for row in packed)
+    return clks
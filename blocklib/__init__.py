@@ -5,9 +5,15 @@ from .pprllambdafold import PPRLIndexLambdaFold
 from .signature_generator import generate_signatures
 from .blocks_generator import generate_blocks, generate_reverse_blocks
 from .validation import validate_blocking_schema
-from .candidate_blocks_generator import generate_candidate_blocks
-from .encoding import generate_bloom_filter, flip_bloom_filter
-from .evaluation import assess_blocks_2party
+from .candidate_blocks_generator import generate_candidate_blocks, generate_candidate_blocks_from_chunks
+from .encoding import generate_bloom_filter, flip_bloom_filter, generate_bloom_filters, flip_bloom_filters, \
+    bloom_filter_key, bloom_filter_keys, block_key_positions
+from .evaluation import assess_blocks, assess_blocks_2party
+from .candidate_pairs import generate_candidate_pairs, count_candidate_pairs
+from .compact import CompactReversedIndex, ReverseBlockArrays
+from .profiling import StageProfiler
+from .incremental import IncrementalPSigIndex, IncrementalLambdaFoldIndex
+from .storage import save_blocks, load_blocks, save_candidate_blocks, load_candidate_blocks
 
 try:
     __version__ = version('blocklib')
@@ -1,12 +1,17 @@
 """Module that implements final block generations."""
-from collections import defaultdict
-from typing import Any, Dict, Sequence, Set, List, cast
-import ast
+import logging
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Any, Dict, Optional, Sequence, Set, List, Tuple, Union, cast
 import numpy as np
 from hashlib import blake2b
 
 from blocklib import PPRLIndex
+from .compact import CompactReversedIndex, ReverseBlockArrays
+from .encoding import BLOCK_KEY_DTYPE
 from .pprlpsig import PPRLIndexPSignature
+from .profiling import StageProfiler, profile_stage, resolve_profiler
+from .utils import map_shards, resolve_n_jobs
 from .candidate_blocks_generator import CandidateBlockingResult
 
 
@@ -27,13 +32,35 @@ def check_block_object(candidate_block_objs: Sequence[CandidateBlockingResult]):
             raise TypeError('Unexpected state type found: {} where we expect: {}'.format(type(obj.state), state_type))
 
 
-def generate_blocks(candidate_block_objs: Sequence[CandidateBlockingResult], K: int) -> List[Dict[Any, List[Any]]]:
+def generate_blocks(candidate_block_objs: Sequence[CandidateBlockingResult], K: int,
+                    inplace: bool = False, profile: Union[bool, StageProfiler] = False,
+                    stats: Optional[Dict[str, Any]] = None, max_block_comparisons: Optional[int] = None,
+                    max_comparisons: Optional[int] = None
+                    ) -> List[Union[Dict[Any, List[Any]], CompactReversedIndex]]:
     """
     Generate final blocks given list of candidate block objects from 2 or more than 2 data providers.
 
     :param candidate_block_objs: A list of CandidateBlockingResult from multiple data providers
     :param K: it specifies the minimum number of occurrence for records to be included in the final blocks
-    :return: List of dictionaries, filter out records that appear in less than K parties
+    :param inplace: filter the blocks of the candidate block objects in place instead of copying them,
+        which saves memory. The returned dictionaries are then the (modified) candidate blocks, for
+        P-Sig the order of their blocks may differ from the copying version. Compact candidate blocks
+        (see `CandidateBlockingResult.compact`) are read-only and always copied.
+    :param profile: record the wall time, CPU time and peak allocated memory of the stages, for P-Sig
+        'candidate_filter', 'has_matches' and 'key_intersection', otherwise 'key_intersection'.
+        Pass a `StageProfiler` to also report them to a callback or the logging module.
+    :param stats: optional dictionary that receives statistics of the block generation. With profiling,
+        stats['profile'] holds the stage records, see `generate_candidate_blocks`. With a comparison budget,
+        'num_comparisons' is the number of comparisons of the remaining blocks, 'dropped_comparisons' the
+        number of comparisons of the dropped blocks and 'dropped_blocks' a list of
+        {'key', 'sizes', 'comparisons'} of the dropped blocks, largest first, where sizes has the size
+        of the block in every party (0 if the party doesn't have it).
+    :param max_block_comparisons: drop the blocks with more comparisons. The comparisons of a block are
+        the products of its sizes summed over all pairs of parties, i.e. |b_1| * |b_2| for 2 parties.
+    :param max_comparisons: drop the blocks with the most comparisons until the comparisons of all
+        blocks are at most this budget
+    :return: List of dictionaries, filter out records that appear in less than K parties.
+        For compact candidate blocks the result is a CompactReversedIndex.
     """
     check_block_object(candidate_block_objs)
     assert len(candidate_block_objs) >= K >= 2
@@ -43,90 +70,214 @@ def generate_blocks(candidate_block_objs: Sequence[CandidateBlockingResult], K:
     reversed_indices = [obj.blocks for obj in candidate_block_objs]
     block_states = [obj.state for obj in candidate_block_objs]  # type: Sequence[PPRLIndex]
 
-    filtered_reversed_indices = []  # type: List[Dict[Any, List[Any]]]
+    profiler = resolve_profiler(profile)
+    filtered_reversed_indices = []  # type: List[Union[Dict[Any, List[Any]], CompactReversedIndex]]
     if state_type == PPRLIndexPSignature:
         block_states = cast(Sequence[PPRLIndexPSignature], block_states)
-        filtered_reversed_indices = generate_blocks_psig(reversed_indices, block_states, threshold=K)
+        filtered_reversed_indices = generate_blocks_psig(reversed_indices, block_states, threshold=K, inplace=inplace,
+                                                         profiler=profiler)
 
     # default strategy: use key in reversed index as block keys
     else:
-        block_keys = defaultdict(int)  # type: Dict[Any, int]
-        for reversed_index in reversed_indices:
-            for key in reversed_index:
-                block_keys[key] += 1
-        final_block_keys = [key for key, count in block_keys.items() if count >= K]
-        for reversed_index in reversed_indices:
-            reversed_index = {k: v for k, v in reversed_index.items() if k in final_block_keys}
-            filtered_reversed_indices.append(reversed_index)
+        with profile_stage(profiler, 'key_intersection'):
+            # multi-way key intersection: count the parties of each key, then filter every index in one pass
+            block_counts = Counter(chain.from_iterable(reversed_indices))
+            for reversed_index in reversed_indices:
+                if isinstance(reversed_index, CompactReversedIndex):
+                    reversed_index = reversed_index.select([k for k in reversed_index if block_counts[k] >= K])
+                elif inplace:
+                    for key in [k for k in reversed_index if block_counts[k] < K]:
+                        del reversed_index[key]
+                else:
+                    reversed_index = {k: v for k, v in reversed_index.items() if block_counts[k] >= K}
+                filtered_reversed_indices.append(reversed_index)
 
+    if max_block_comparisons is not None or max_comparisons is not None:
+        with profile_stage(profiler, 'comparison_budget'):
+            filtered_reversed_indices, budget_stats = _apply_comparison_budget(
+                filtered_reversed_indices, max_block_comparisons, max_comparisons, inplace)
+        if stats is not None:
+            stats.update(budget_stats)
+
+    if stats is not None and profiler is not None:
+        stats['profile'] = profiler.report()
     return filtered_reversed_indices
 
 
-def generate_reverse_blocks(reversed_indices: Sequence[Dict]):
+def _apply_comparison_budget(reversed_indices: List[Any], max_block_comparisons: Optional[int],
+                             max_comparisons: Optional[int], inplace: bool) -> Tuple[List[Any], Dict[str, Any]]:
+    """Drop the blocks over the per block limit, then the largest blocks until the total is within the budget."""
+    if any(limit is not None and limit < 0 for limit in (max_block_comparisons, max_comparisons)):
+        raise ValueError('The comparison budget must not be negative')
+    keys = list(dict.fromkeys(chain.from_iterable(reversed_indices)))
+    sizes = np.zeros((len(reversed_indices), len(keys)), dtype=np.int64)
+    for party, reversed_index in enumerate(reversed_indices):
+        sizes[party] = np.fromiter((len(reversed_index[k]) if k in reversed_index else 0 for k in keys),
+                                   dtype=np.int64, count=len(keys))
+    # sum of |b_i| * |b_j| over all pairs of parties i < j
+    sums = sizes.sum(axis=0)
+    comparisons = (sums * sums - (sizes * sizes).sum(axis=0)) // 2
+
+    drop = np.zeros(len(keys), dtype=bool)
+    if max_block_comparisons is not None:
+        drop |= comparisons > max_block_comparisons
+    if max_comparisons is not None:
+        remaining = np.flatnonzero(~drop)
+        largest_first = remaining[np.argsort(-comparisons[remaining], kind='stable')]
+        # comparisons left after dropping the i largest blocks
+        left = int(comparisons[remaining].sum()) - np.concatenate([[0], np.cumsum(comparisons[largest_first])])
+        drop[largest_first[:int(np.argmax(left <= max_comparisons))]] = True
+
+    dropped = sorted(np.flatnonzero(drop).tolist(), key=lambda i: -comparisons[i])
+    dropped_keys = set(keys[i] for i in dropped)
+    budget_stats = {
+        'num_comparisons': int(comparisons[~drop].sum()),
+        'dropped_comparisons': int(comparisons[drop].sum()),
+        'dropped_blocks': [{'key': keys[i], 'sizes': sizes[:, i].tolist(), 'comparisons': int(comparisons[i])}
+                           for i in dropped],
+    }
+    if dropped:
+        logging.info('Dropped %d blocks with %d comparisons to stay within the comparison budget',
+                     len(dropped), budget_stats['dropped_comparisons'])
+
+    filtered_reversed_indices = []
+    for reversed_index in reversed_indices:
+        if isinstance(reversed_index, CompactReversedIndex):
+            reversed_index = reversed_index.select([k for k in reversed_index if k not in dropped_keys])
+        elif inplace:
+            for key in dropped_keys.intersection(reversed_index):
+                del reversed_index[key]
+        else:
+            reversed_index = {k: v for k, v in reversed_index.items() if k not in dropped_keys}
+        filtered_reversed_indices.append(reversed_index)
+    return filtered_reversed_indices, budget_stats
+
+
+def generate_reverse_blocks(reversed_indices: Sequence[Dict], as_arrays: bool = False,
+                            n_jobs: int = 1) -> List[Any]:
     """Invert a map from "blocks to records" to "records to blocks".
 
     :param reversed_indices: A list of dictionaries where key is the block key and value is a list of record IDs.
+    :param as_arrays: return a `ReverseBlockArrays` per party instead, which maps records to integer block ids
+        with CSR arrays built by a stable sort of the postings, without a Python set per record.
+    :param n_jobs: number of processes inverting the parties, -1 for one per CPU
     :return: A list of dictionaries where key is the record ID and value is a set of blocking keys the record belongs to.
     """
-    rec_to_blockkey = []
-    for reversed_index in reversed_indices:
-        map_rec_block = defaultdict(set)  # type: Dict[Any, Set[Any]]
-        for blk_key, rec_list in reversed_index.items():
-            for rec in rec_list:
-                map_rec_block[rec].add(blk_key)
-        rec_to_blockkey.append(map_rec_block)
-    return rec_to_blockkey
+    invert = _reverse_block_arrays if as_arrays else _reverse_blocks
+    n_jobs = min(resolve_n_jobs(n_jobs), len(reversed_indices))
+    if n_jobs <= 1:
+        return [invert(reversed_index) for reversed_index in reversed_indices]
+    return map_shards(invert, [(reversed_index,) for reversed_index in reversed_indices], n_jobs)
+
+
+def _reverse_blocks(reversed_index: Dict) -> Dict[Any, Set[Any]]:
+    map_rec_block = defaultdict(set)  # type: Dict[Any, Set[Any]]
+    for blk_key, rec_list in reversed_index.items():
+        if isinstance(rec_list, np.ndarray):
+            rec_list = rec_list.tolist()
+        for rec in rec_list:
+            map_rec_block[rec].add(blk_key)
+    return map_rec_block
+
+
+def _reverse_block_arrays(reversed_index: Dict) -> ReverseBlockArrays:
+    return ReverseBlockArrays.from_reversed_index(reversed_index)
 
 
-def generate_blocks_psig(reversed_indices: Sequence[Dict], block_states: Sequence[PPRLIndexPSignature], threshold: int):
+def block_key_matrix(block_keys: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sparse blocks x bloom filter bits matrix of P-Sig block keys in CSR form.
+
+    :param block_keys: block keys created with `bloom_filter_key`
+    :return: (indptr, indices) where the bits of block i are indices[indptr[i]:indptr[i + 1]]
+    """
+    indices = np.frombuffer(b''.join(block_keys), dtype=BLOCK_KEY_DTYPE)
+    nnz = np.fromiter((len(k) for k in block_keys), dtype=np.int64, count=len(block_keys)) // BLOCK_KEY_DTYPE.itemsize
+    indptr = np.zeros(len(block_keys) + 1, dtype=np.int64)
+    np.cumsum(nnz, out=indptr[1:])
+    return indptr, indices
+
+
+def generate_blocks_psig(reversed_indices: Sequence[Union[Dict, CompactReversedIndex]],
+                         block_states: Sequence[PPRLIndexPSignature], threshold: int,
+                         inplace: bool = False, profiler: Optional[StageProfiler] = None):
     """Generate blocks for P-Sig
 
+    The block keys of every party are treated as a sparse blocks x bits matrix. The candidate bloom
+    filter of a party is the column-wise OR of its matrix, and a block can only have matches if all
+    its bits are set in the blocking filter, i.e. if the product of its row with the blocking filter
+    equals the number of bits in the row.
+
     :param reversed_indices: A list of dictionaries where key is the block key and value is a list of record IDs.
     :param block_states: A list of PPRLIndex objects that hold configuration of the blocking job
     :param threshold: int which decides a pair when number of 1 bits in bloom filter is large than or equal to threshold
+    :param inplace: delete blocks from reversed_indices instead of copying the remaining blocks
+    :param profiler: optional StageProfiler recording the stages 'candidate_filter', 'has_matches' and
+        'key_intersection'
     :return: A list of dictionaries where blocks that don't contain any matches are deleted
     """
-    # generate candidate bloom filters
-    candidate_bloom_filters = []
-    for reversed_index, state in zip(reversed_indices, block_states):
-        cbf = set()  # type: Set[int]
-        for bf_set in reversed_index:
-            bf_set = ast.literal_eval(bf_set)
-            cbf = cbf.union(bf_set)
-
-        bf_len = block_states[0].blocking_config.bloom_filter_length
-        bf_vector = np.zeros(bf_len, dtype=bool)
-        bf_vector[list(cbf)] = True
-        candidate_bloom_filters.append(bf_vector)
-
-    # compute blocking filter (and operation)
-    cbf_array = np.sum(np.stack(candidate_bloom_filters), axis=0)
-    block_filter = cbf_array >= threshold
-
-    # filter reversed_indices with block filter
-    for reversed_index in reversed_indices:
-        has_matches = {bf_set: all(block_filter[i] for i in ast.literal_eval(bf_set)) for bf_set in reversed_index}
-        for bf_set in has_matches:
-            if not has_matches[bf_set]:
-                del reversed_index[bf_set]
+    bf_len = block_states[0].blocking_config.bloom_filter_length
+    with profile_stage(profiler, 'candidate_filter'):
+        block_keys = [list(reversed_index) for reversed_index in reversed_indices]
+        matrices = [block_key_matrix(keys) for keys in block_keys]
+
+        # generate candidate bloom filters and compute blocking filter (and operation)
+        cbf_array = np.zeros(bf_len, dtype=np.int64)
+        for _, indices in matrices:
+            candidate_bloom_filter = np.zeros(bf_len, dtype=bool)
+            candidate_bloom_filter[indices] = True
+            cbf_array += candidate_bloom_filter
+        block_filter = cbf_array >= threshold
 
+    # keep the blocks whose bits are all set in the block filter
+    with profile_stage(profiler, 'has_matches'):
+        matched_keys = []  # type: List[List[bytes]]
+        for keys, (indptr, indices) in zip(block_keys, matrices):
+            nnz = np.diff(indptr)
+            rows = np.repeat(np.arange(len(keys)), nnz)
+            set_bits = np.bincount(rows, weights=block_filter[indices], minlength=len(keys))
+            has_matches = set_bits == nnz
+            matched_keys.append([key for key, matches in zip(keys, has_matches.tolist()) if matches])
+
+    with profile_stage(profiler, 'key_intersection'):
+        return _intersect_psig_keys(reversed_indices, block_states, matched_keys, threshold, inplace)
+
+
+def _intersect_psig_keys(reversed_indices: Sequence[Union[Dict, CompactReversedIndex]],
+                         block_states: Sequence[PPRLIndexPSignature],
+                         matched_keys: List[List[bytes]], threshold: int, inplace: bool):
+    """Keep the matched blocks whose key is in at least threshold parties, optionally compressing the keys."""
     # because of collisions in counting bloom filter, there are blocks only unique to one filtered index
     # only keep blocks that exist in at least threshold many reversed indices
-    keys = defaultdict(int)  # type: Dict[str, int]
-    for reversed_index in reversed_indices:
-        for k in reversed_index:
+    keys = defaultdict(int)  # type: Dict[bytes, int]
+    for party_keys in matched_keys:
+        for k in party_keys:
             keys[k] += 1
     common_keys = [k for k in keys if keys[k] >= threshold]
-    clean_reversed_indices = []  # type: List[Dict[str, List]]
+    clean_reversed_indices = []  # type: List[Union[Dict[Any, List], CompactReversedIndex]]
     compress_block_key = block_states[0].blocking_config.compress_block_key
 
-    def optional_compression(key: str) -> str:
+    def optional_compression(key: bytes) -> Union[bytes, str]:
         if compress_block_key:
-            return blake2b(key.encode(), digest_size=5).hexdigest()
+            return blake2b(key, digest_size=5).hexdigest()
         else:
             return key
 
-    for reversed_index in reversed_indices:
-        clean_reversed_indices.append(dict((optional_compression(k), reversed_index[k]) for k in common_keys if k in reversed_index))
+    for reversed_index, party_keys in zip(reversed_indices, matched_keys):
+        party_key_set = set(party_keys)
+        if isinstance(reversed_index, CompactReversedIndex):
+            selected_keys = [k for k in common_keys if k in party_key_set]
+            clean_reversed_indices.append(reversed_index.select(
+                selected_keys, [optional_compression(k) for k in selected_keys]))
+        elif inplace:
+            party_common_keys = [k for k in reversed_index if k in party_key_set and keys[k] >= threshold]
+            for k in [k for k in reversed_index if not (k in party_key_set and keys[k] >= threshold)]:
+                del reversed_index[k]
+            if compress_block_key:
+                for k in party_common_keys:
+                    reversed_index[optional_compression(k)] = reversed_index.pop(k)
+            clean_reversed_indices.append(reversed_index)
+        else:
+            clean_reversed_indices.append(dict((optional_compression(k), reversed_index[k]) for k in common_keys
+                                               if k in party_key_set))
 
     return clean_reversed_indices
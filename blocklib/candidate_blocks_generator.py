@@ -1,9 +1,14 @@
+import itertools
 import sys
 
-from typing import Dict, Sequence, Tuple, Type, List, Optional, TextIO
+from typing import Any, Dict, Iterable, Sequence, Tuple, Type, List, Optional, TextIO, Union
+from .columnar import is_columnar
+from .compact import CompactReversedIndex
 from .pprlindex import PPRLIndex, ReversedIndexResult
 from .pprlpsig import PPRLIndexPSignature
 from .pprllambdafold import PPRLIndexLambdaFold
+from .profiling import StageProfiler, format_stage, profile_stage, resolve_profiler
+from .streaming import StreamingIndexBuilder
 from .validation import validate_blocking_schema
 
 
@@ -16,7 +21,8 @@ PPRLSTATES = {
 class CandidateBlockingResult:
     """Object for holding candidate blocking results.
 
-    :ivar blocks: a dictionary that contains a mapping from the block ID to the record IDs in that block.
+    :ivar blocks: a dictionary that contains a mapping from the block ID to the record IDs in that block,
+        or a CompactReversedIndex after calling `compact`.
     :ivar state: A PPRLIndex state that contains the configuration of blocking
     :ivar stats: a dictionary containing the summary statistics of the generated blocks"""
 
@@ -26,10 +32,19 @@ class CandidateBlockingResult:
         :param blocking_result: A ReversedIndexResult object, containing the blocks and corresponding statistics
         :param state: A PPRLIndex state that contains configuration of blocking
         """
-        self.blocks = blocking_result.reversed_index
+        self.blocks = blocking_result.reversed_index  # type: Union[Dict[Any, Any], CompactReversedIndex]
         self.state = state
         self.stats = blocking_result.stats
 
+    def compact(self) -> 'CandidateBlockingResult':
+        """
+        Replace the blocks with a CompactReversedIndex, which stores the record IDs of all blocks in
+        one NumPy array. Looking up a block then returns an array instead of a list.
+        :return: this object
+        """
+        self.blocks = CompactReversedIndex.from_dict(self.blocks)
+        return self
+
     def print_summary_statistics(self, output: TextIO = sys.stdout, round_ndigits: int = 4):
         """
         Print the summary statistics of this candidate blocking result to 'output'.
@@ -45,6 +60,10 @@ class CandidateBlockingResult:
             out.write('\tStandard Deviation of Block Size:  {}\n'.format(round(stats['std_size'], round_ndigits)))
             if 'coverage' in stats:
                 out.write('\tCoverage:           {}%\n'.format(round(stats['coverage'] * 100, 2)))
+            if 'percentiles' in stats:
+                out.write('\tBlock Size Percentiles: {}\n'.format(
+                    ', '.join('{} {}'.format(p, round(v, round_ndigits)) for p, v in stats['percentiles'].items())))
+                out.write('\tSum of Squared Block Sizes: {}\n'.format(stats['sum_of_squared_sizes']))
 
         output.write('Statistics for the generated blocks:\n')
         print_stats(self.stats, output)
@@ -53,23 +72,98 @@ class CandidateBlockingResult:
             for stat in self.stats['statistics_per_strategy']:
                 output.write('Strategy: {}\n'.format(stat['strategy_idx']))
                 print_stats(stat, output)
+        if 'profile' in self.stats:
+            output.write('Profile of the blocking stages:\n')
+            for record in self.stats['profile']:
+                output.write('\t{}\n'.format(format_stage(record)))
 
 
-def generate_candidate_blocks(data: Sequence[Tuple[str, ...]],
+def generate_candidate_blocks(data: Union[Sequence[Tuple[str, ...]], Any],
                               blocking_schema: Dict,
-                              header: Optional[List[str]] = None) -> CandidateBlockingResult:
+                              header: Optional[List[str]] = None,
+                              n_jobs: int = 1,
+                              compact: bool = False,
+                              profile: Union[bool, StageProfiler] = False,
+                              **kwargs) -> CandidateBlockingResult:
     """
     :param data: list of tuples E.g. ('0', 'Kenneth Bain', '1964/06/17', 'M')
+        For P-Sig, data can also be columnar: a pandas DataFrame, a pyarrow Table or a dict
+        mapping column names to arrays. The header is then taken from the column names.
     :param blocking_schema:
         A description of how the signatures should be generated.
         See :ref:`blocking-schema`
     :param header: column names (optional)
         Program should throw exception if block features are string but header is None
+    :param n_jobs: number of processes used to build the index, -1 for one per CPU.
+        The result does not depend on n_jobs.
+    :param compact: store the blocks as a CompactReversedIndex, see `CandidateBlockingResult.compact`
+    :param profile: record the wall time, CPU time and peak allocated memory of every stage of the
+        algorithm in stats['profile'], a list of records {'stage', 'wall_time', 'cpu_time', 'peak_memory'}.
+        Pass a `StageProfiler` to also report the stages to a callback or the logging module, or to
+        switch off memory tracing, which slows down the build.
+    :param kwargs: further options of the algorithm's `build_reversed_index`, e.g. `two_pass` for P-Sig
+        or `detailed_stats` to add block size percentiles, a histogram and the sum of squared block sizes
 
     :return: A 2-tuple containing
         A list of "signatures" per record in data.
         Internal state object from the signature generation (or None).
     """
+    profiler = resolve_profiler(profile)
+    with profile_stage(profiler, 'validation'):
+        state = _create_state(blocking_schema, header, columnar=is_columnar(data))
+    if profiler is not None:
+        kwargs['profiler'] = profiler
+    reversed_index_result = state.build_reversed_index(data, header, n_jobs=n_jobs, **kwargs)
+    candidate_block_obj = CandidateBlockingResult(reversed_index_result, state)
+    if compact:
+        with profile_stage(profiler, 'compact'):
+            candidate_block_obj.compact()
+    if profiler is not None:
+        candidate_block_obj.stats['profile'] = profiler.report()
+    return candidate_block_obj
+
+
+def generate_candidate_blocks_from_chunks(chunks: Iterable[Any],
+                                          blocking_schema: Dict,
+                                          header: Optional[List[str]] = None,
+                                          max_postings_in_memory: Optional[int] = None,
+                                          spill_dir: Optional[str] = None,
+                                          compact: bool = False) -> CandidateBlockingResult:
+    """
+    Generate candidate blocks from an iterable of record chunks, e.g. batches of rows from a CSV reader
+    or the row groups of a Parquet file, for datasets that do not fit in memory.
+
+    The result is the same as `generate_candidate_blocks` on the concatenation of the chunks. Record ids
+    default to the position of the record in the whole stream.
+
+    :param chunks: iterable of chunks. Every chunk is a list of tuples or, for P-Sig, columnar data
+        (see `generate_candidate_blocks`).
+    :param blocking_schema:
+        A description of how the signatures should be generated.
+        See :ref:`blocking-schema`
+    :param header: column names (optional)
+    :param max_postings_in_memory: maximum number of record ids held in memory while reading the chunks.
+        Beyond that the postings are spilled to disk. P-Sig filters the postings when reading them back,
+        so only blocks that pass the filter are loaded. None (the default) never spills.
+    :param spill_dir: directory for the spilled postings, defaults to the system temp directory
+    :param compact: store the blocks as a CompactReversedIndex, see `CandidateBlockingResult.compact`
+    :return: CandidateBlockingResult
+    """
+    chunks = iter(chunks)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        raise ValueError('No chunks to generate candidate blocks from')
+    state = _create_state(blocking_schema, header, columnar=is_columnar(first_chunk))
+
+    builder = StreamingIndexBuilder(state, header, max_postings_in_memory, spill_dir)
+    for chunk in itertools.chain([first_chunk], chunks):
+        builder.add_chunk(chunk)
+    candidate_block_obj = CandidateBlockingResult(builder.finalize(), state)
+    return candidate_block_obj.compact() if compact else candidate_block_obj
+
+
+def _create_state(blocking_schema: Dict, header: Optional[List[str]], columnar: bool = False) -> PPRLIndex:
+    """Validate the blocking schema against the input and create the PPRLIndex state of its algorithm."""
     blocking_model = validate_blocking_schema(blocking_schema)
 
     # extract algorithm and its config
@@ -83,15 +177,12 @@ def generate_candidate_blocks(data: Sequence[Tuple[str, ...]],
     assert all(type(x) == feature_type for x in blocking_features[1:]), error_msg
 
     # header should not be None if blocking features are string
-    if feature_type == str:
+    if feature_type == str and not columnar:
         assert header, 'Header must not be None if blocking features are string'
 
-    if algorithm in PPRLSTATES:
-        state = PPRLSTATES[algorithm](config)
-        reversed_index_result = state.build_reversed_index(data, header)
-        candidate_block_obj = CandidateBlockingResult(reversed_index_result, state)
+    if columnar and algorithm != 'p-sig':
+        raise NotImplementedError('Columnar data is only supported by p-sig, not {}'.format(algorithm))
 
-    else:
+    if algorithm not in PPRLSTATES:
         raise NotImplementedError('The algorithm {} is not supported yet'.format(algorithm))
-
-    return candidate_block_obj
+    return PPRLSTATES[algorithm](config)
@@ -0,0 +1,165 @@
+"""Enumerate the unique candidate record pairs of the final blocks of two parties."""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from typing import Any, Deque, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .compact import CompactReversedIndex
+from .utils import resolve_n_jobs
+
+# number of pairs per yielded batch
+DEFAULT_BATCH_SIZE = 2 ** 20
+# maximum number of pairs, including duplicates, materialized at once (per process)
+DEFAULT_MAX_PAIRS_IN_MEMORY = 2 ** 23
+
+
+class _PairIndex:
+    """The common blocks of two parties as arrays of record codes.
+
+    The postings of party a are sorted by record code, so the candidate pairs of a range of
+    party a records come from a contiguous slice of postings, and pairs of different ranges
+    never coincide.
+    """
+
+    def __init__(self, a_codes: np.ndarray, a_blocks: np.ndarray, b_indptr: np.ndarray, b_codes: np.ndarray,
+                 num_b: int):
+        order = np.argsort(a_codes, kind='stable')
+        self.a_codes = a_codes[order]
+        self.a_blocks = a_blocks[order]
+        self.b_indptr = b_indptr
+        self.b_codes = b_codes
+        self.num_b = num_b
+
+    def pair_counts(self) -> np.ndarray:
+        """Number of pairs, including duplicates, of every posting of party a."""
+        return np.diff(self.b_indptr)[self.a_blocks]
+
+    def pairs(self, start: int, stop: int) -> np.ndarray:
+        """Sorted unique pairs, as a code * num_b + b code, of the party a postings in [start, stop)."""
+        blocks = self.a_blocks[start:stop]
+        counts = np.diff(self.b_indptr)[blocks]
+        total = int(counts.sum())
+        # positions into b_codes: the concatenated ranges b_indptr[block]:b_indptr[block + 1]
+        run_starts = np.cumsum(counts) - counts
+        b_positions = np.arange(total, dtype=np.int64) + np.repeat(self.b_indptr[blocks] - run_starts, counts)
+        keys = np.repeat(self.a_codes[start:stop], counts) * self.num_b + self.b_codes[b_positions]
+        keys.sort()
+        is_first = np.empty(len(keys), dtype=bool)
+        is_first[:1] = True
+        np.not_equal(keys[1:], keys[:-1], out=is_first[1:])
+        return keys[is_first]
+
+
+_worker_index = None  # type: Optional[_PairIndex]
+
+
+def _init_worker(index: _PairIndex):
+    global _worker_index
+    _worker_index = index
+
+
+def _worker_pairs(start: int, stop: int) -> np.ndarray:
+    assert _worker_index is not None
+    return _worker_index.pairs(start, stop)
+
+
+def generate_candidate_pairs(filtered_reversed_indices: Sequence[Mapping[Any, Sequence[Any]]],
+                             batch_size: int = DEFAULT_BATCH_SIZE,
+                             max_pairs_in_memory: int = DEFAULT_MAX_PAIRS_IN_MEMORY,
+                             n_jobs: int = 1) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Stream the unique pairs of records of two parties that share at least one block.
+
+    Blocks overlap, e.g. the blocks of different P-Sig strategies or Lambda-fold tables, so the
+    same pair of records usually appears in several blocks but is generated only once.
+    The records of the first party are split into ranges whose pairs, including duplicates, are
+    at most max_pairs_in_memory. The pairs of a range are deduplicated by sorting, and ranges
+    can't share pairs. The pairs are yielded sorted by the record of the first party.
+
+    :param filtered_reversed_indices: the final blocks of two parties, as returned by `generate_blocks`
+    :param batch_size: maximum number of pairs per yielded batch
+    :param max_pairs_in_memory: maximum number of pairs, including duplicates, generated at once by
+        each process. A record whose blocks alone have more pairs is processed on its own.
+    :param n_jobs: number of processes generating the pairs of the ranges, -1 for one per CPU.
+        The result does not depend on n_jobs.
+    :return: iterator of (record_ids_a, record_ids_b) NumPy arrays, where (record_ids_a[i], record_ids_b[i])
+        is a candidate pair
+    """
+    if len(filtered_reversed_indices) != 2:
+        raise ValueError('Candidate pairs are generated between exactly 2 parties, got {}'.format(
+            len(filtered_reversed_indices)))
+    if batch_size < 1 or max_pairs_in_memory < 1:
+        raise ValueError('batch_size and max_pairs_in_memory must be positive')
+    n_jobs = resolve_n_jobs(n_jobs)
+
+    blocks_a, blocks_b = filtered_reversed_indices
+    keys = [k for k in blocks_a if k in blocks_b]
+    a_sizes, a_ids = _concatenated_record_ids(blocks_a, keys)
+    b_sizes, b_ids = _concatenated_record_ids(blocks_b, keys)
+    # encode the record ids of each party as integers, in the order of the record ids
+    unique_a, a_codes = np.unique(a_ids, return_inverse=True)
+    unique_b, b_codes = np.unique(b_ids, return_inverse=True)
+    b_indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(b_sizes, out=b_indptr[1:])
+    index = _PairIndex(a_codes.astype(np.int64).ravel(), np.repeat(np.arange(len(keys)), a_sizes),
+                       b_indptr, b_codes.astype(np.int64).ravel(), len(unique_b))
+
+    def batches(pair_keys: np.ndarray) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        codes_a, codes_b = np.divmod(pair_keys, index.num_b)
+        for start in range(0, len(pair_keys), batch_size):
+            yield unique_a[codes_a[start:start + batch_size]], unique_b[codes_b[start:start + batch_size]]
+
+    ranges = _posting_ranges(index, max_pairs_in_memory)
+    if n_jobs == 1 or len(ranges) <= 1:
+        for start, stop in ranges:
+            yield from batches(index.pairs(start, stop))
+        return
+
+    # keep at most n_jobs ranges in flight, so memory stays bounded if the consumer is slow
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker, initargs=(index,)) as executor:
+        remaining = iter(ranges)
+        pending = deque(executor.submit(_worker_pairs, start, stop)
+                        for start, stop in islice(remaining, n_jobs))  # type: Deque
+        while pending:
+            pair_keys = pending.popleft().result()
+            next_range = next(remaining, None)
+            if next_range is not None:
+                pending.append(executor.submit(_worker_pairs, *next_range))
+            yield from batches(pair_keys)
+
+
+def count_candidate_pairs(filtered_reversed_indices: Sequence[Mapping[Any, Sequence[Any]]], **kwargs) -> int:
+    """Number of unique candidate pairs of two parties, see `generate_candidate_pairs` for the arguments."""
+    return sum(len(ids_a) for ids_a, _ in generate_candidate_pairs(filtered_reversed_indices, **kwargs))
+
+
+def _concatenated_record_ids(blocks: Mapping[Any, Sequence[Any]], keys: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sizes of the given blocks and their record ids, concatenated in order."""
+    if isinstance(blocks, CompactReversedIndex):
+        selected = blocks.select(keys)
+        return selected.block_sizes(), selected.record_ids
+    sizes = np.fromiter(map(len, map(blocks.__getitem__, keys)), dtype=np.int64, count=len(keys))
+    return sizes, np.array(list(chain.from_iterable(map(blocks.__getitem__, keys))))
+
+
+def _posting_ranges(index: _PairIndex, max_pairs: int) -> List[Tuple[int, int]]:
+    """Split the party a postings into ranges of whole records with at most max_pairs pairs (or one record)."""
+    num_postings = len(index.a_codes)
+    if num_postings == 0:
+        return []
+    # pairs up to the end of every record, a range may only end where a record ends
+    record_ends = np.flatnonzero(np.diff(index.a_codes)) + 1
+    record_ends = np.append(record_ends, num_postings)
+    pairs_before = np.concatenate([[0], np.cumsum(index.pair_counts())])
+    pairs_before_ends = pairs_before[record_ends]
+    ranges = []
+    start = 0
+    while start < num_postings:
+        # the last record end within the budget, but at least the end of the first record
+        first_end = np.searchsorted(record_ends, start, side='right')
+        last_end = np.searchsorted(pairs_before_ends, pairs_before[start] + max_pairs, side='right') - 1
+        stop = int(record_ends[max(first_end, last_end)])
+        ranges.append((start, stop))
+        start = stop
+    return ranges
@@ -0,0 +1,236 @@
+"""Columnar (vectorized) P-Sig signature generation.
+
+Signatures are computed once per distinct value of a column instead of per record, and records
+are grouped by signature with NumPy.
+
+Supported inputs are a pandas ``DataFrame``, a pyarrow ``Table`` or a mapping from
+column name to a NumPy array. Neither pandas nor pyarrow are required by blocklib, the
+objects are only accessed through their public interfaces.
+
+NumPy unicode arrays have a fixed width, the length of their longest value. The rows are
+therefore processed in chunks of `CHUNK_ROWS`, so a single long value only widens the
+arrays of its chunk.
+"""
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from .signature_generator import _compile_spec, _resolve_feature_index
+from .utils import group_by_first_occurrence
+from .validation import PSigSignatureModel
+
+# number of rows whose signatures are generated at once
+CHUNK_ROWS = 2 ** 12
+
+
+def is_columnar(data: Any) -> bool:
+    """Check if data is a pandas DataFrame, a pyarrow Table or a mapping of column arrays."""
+    return isinstance(data, Mapping) or _is_dataframe(data) or _is_arrow_table(data)
+
+
+def _is_dataframe(data: Any) -> bool:
+    return hasattr(data, 'columns') and hasattr(data, 'iloc')
+
+
+def _is_arrow_table(data: Any) -> bool:
+    return hasattr(data, 'column_names') and hasattr(data, 'num_rows')
+
+
+class ColumnarData:
+    """Uniform access to the columns of a DataFrame, pyarrow Table or dict of arrays.
+
+    Columns are converted to NumPy arrays lazily, so only the columns that are referenced
+    by the blocking configuration are materialized.
+    """
+
+    def __init__(self, data: Any):
+        if _is_dataframe(data):
+            self.header = [str(c) for c in data.columns]
+            self.num_rows = len(data)
+            self._get = lambda i: data.iloc[:, i].to_numpy()  # type: Callable[[int], np.ndarray]
+        elif _is_arrow_table(data):
+            self.header = list(data.column_names)
+            self.num_rows = data.num_rows
+            self._get = lambda i: data.column(i).to_numpy(zero_copy_only=False)
+        elif isinstance(data, Mapping):
+            self.header = [str(c) for c in data.keys()]
+            values = list(data.values())
+            lengths = {len(v) for v in values}
+            if len(lengths) > 1:
+                raise ValueError('All columns must have the same length, got lengths {}'.format(sorted(lengths)))
+            self.num_rows = lengths.pop() if lengths else 0
+            self._get = lambda i: np.asarray(values[i])
+        else:
+            raise TypeError('Unsupported columnar data type {}'.format(type(data)))
+        self._columns = {}  # type: Dict[int, np.ndarray]
+        self._text = {}  # type: Dict[int, np.ndarray]
+
+    def __len__(self):
+        return self.num_rows
+
+    def row_slice(self, start: int, stop: int) -> 'ColumnarData':
+        """The rows [start, stop), as views of the columns of this object."""
+        part = ColumnarData.__new__(ColumnarData)
+        part.header = self.header
+        part.num_rows = max(0, min(stop, self.num_rows) - start)
+        part._get = lambda i: self.column(i)[start:stop]
+        part._columns = {}
+        part._text = {}
+        return part
+
+    def column(self, i: int) -> np.ndarray:
+        if i not in self._columns:
+            if not 0 <= i < len(self.header):
+                raise IndexError('Column index {} out of range for {} columns'.format(i, len(self.header)))
+            self._columns[i] = np.asarray(self._get(i))
+        return self._columns[i]
+
+    def text(self, i: int) -> np.ndarray:
+        """Column i converted to a NumPy unicode array."""
+        if i not in self._text:
+            self._text[i] = self.column(i).astype(str)
+        return self._text[i]
+
+    def feature_to_index(self) -> Dict[str, int]:
+        return {name: ind for ind, name in enumerate(self.header)}
+
+
+def null_mask(column: np.ndarray, null_sentinel: Any) -> np.ndarray:
+    """Boolean mask of the entries in column equal to null_sentinel (or None if the sentinel is None)."""
+    if null_sentinel is None:
+        if column.dtype != object:
+            return np.zeros(len(column), dtype=bool)
+        mask = column == None  # noqa: E711 elementwise comparison
+    else:
+        mask = column == null_sentinel
+    if not isinstance(mask, np.ndarray) or mask.shape != column.shape:
+        # incomparable types, e.g. a numeric column and a string sentinel
+        return np.zeros(len(column), dtype=bool)
+    return mask.astype(bool)
+
+
+class _StrategySignatures:
+    """Signatures of one strategy, computed per distinct value and per distinct combination of parts.
+
+    The signature part of every distinct feature value is computed once and given a code that is
+    consistent over chunks of rows, so that the signatures of all records can be represented by
+    a small integer matrix of part codes.
+    """
+
+    def __init__(self, index: int, strategy: PSigSignatureModel, feature_to_index: Dict[str, int]):
+        self.prefix = '{}_'.format(index)
+        self.specs = [(_resolve_feature_index(spec.feature, feature_to_index), _compile_spec(spec))
+                      for spec in strategy]
+        self.value_codes = [{} for _ in self.specs]  # type: List[Dict[str, int]]
+        self.parts = [[] for _ in self.specs]  # type: List[List[Optional[str]]]
+
+    def encode(self, columns: ColumnarData, null_sentinel: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """Part codes of the records of columns.
+
+        :return: (part_codes, valid) where part_codes has a row for every record with valid True
+            and a column for every signature spec
+        """
+        valid = np.full(len(columns), len(self.specs) > 0)
+        for attr_ind, _ in self.specs:
+            valid &= ~null_mask(columns.column(attr_ind), null_sentinel)
+        part_codes = np.empty((int(valid.sum()), len(self.specs)), dtype=np.int64)
+        if len(part_codes) == 0:
+            return part_codes, valid
+
+        for s, ((attr_ind, func), value_codes, parts) in enumerate(zip(self.specs, self.value_codes, self.parts)):
+            uniques, inverse = np.unique(columns.text(attr_ind)[valid], return_inverse=True)
+            codes = np.empty(len(uniques), dtype=np.int64)
+            for u, value in enumerate(uniques.tolist()):
+                code = value_codes.get(value)
+                if code is None:
+                    code = value_codes[value] = len(parts)
+                    parts.append(value if func is None else func(value))
+                codes[u] = code
+            part_codes[:, s] = codes[inverse.ravel()]
+        return part_codes, valid
+
+    def signatures(self, part_codes: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """Join the parts of every distinct row of part_codes into a signature.
+
+        :return: the distinct signatures and for every row of part_codes the index of its signature
+        """
+        # number the combinations one column at a time, so that the combined keys cannot overflow
+        keys = part_codes[:, 0]
+        for column in part_codes.T[1:]:
+            _, ranks = np.unique(keys, return_inverse=True)
+            keys = ranks.ravel() * (int(column.max()) + 1) + column
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        combinations = part_codes[first]
+        part_columns = [[parts[code] for code in column] for parts, column in zip(self.parts, combinations.T.tolist())]
+        # missing parts are left out along with their separator
+        joined = (self.prefix + '_'.join([part for part in row if part is not None]) for row in zip(*part_columns))
+        signature_codes = {}  # type: Dict[str, int]
+        codes = np.fromiter((signature_codes.setdefault(signature, len(signature_codes)) for signature in joined),
+                            dtype=np.int64, count=len(combinations))
+        return list(signature_codes), codes[inverse.ravel()]
+
+
+def group_record_ids(signatures: np.ndarray, record_ids: np.ndarray) -> Dict[Any, List[Any]]:
+    """Group record ids by signature, in order of first occurrence of each signature."""
+    first, order, offsets = group_by_first_occurrence(signatures)
+    keys = signatures[first].tolist()
+    grouped_ids = record_ids[order].tolist()
+    return {key: grouped_ids[offsets[g]:offsets[g + 1]] for g, key in enumerate(keys)}
+
+
+def build_signature_index_columnar(
+    signature_strategies: List[PSigSignatureModel],
+    data: Any,
+    null_sentinel: Any,
+    rec_id_col: Optional[int] = None,
+    first_record_id: int = 0,
+    size_bounds: Optional[Callable[[int], Tuple[float, float]]] = None,
+) -> Tuple[List[Dict[str, List[Any]]], int]:
+    """Build the unfiltered {signature -> record ids} index of every strategy from columnar data.
+
+    The signature codes of all records are generated in chunks of `CHUNK_ROWS` rows first, then the
+    record ids are grouped by signature once per strategy.
+
+    :param signature_strategies: A list of PSigSignatureModel instances.
+    :param data: pandas DataFrame, pyarrow Table, mapping from column name to array or `ColumnarData`
+    :param null_sentinel: value that represents NULL in the dataset
+    :param rec_id_col: index of the column holding record ids, defaults to the row number
+    :param first_record_id: record id of the first row if rec_id_col is None, e.g. the offset of a chunk
+    :param size_bounds: optional function returning the inclusive (min, max) block size given the number
+        of records. Signatures with a number of records out of these bounds are dropped before grouping.
+    :return: list of reversed indices (one per strategy) and the number of records
+    """
+    columns = data if isinstance(data, ColumnarData) else ColumnarData(data)
+    if rec_id_col is None:
+        record_ids = np.arange(first_record_id, first_record_id + len(columns))
+    else:
+        record_ids = columns.column(rec_id_col)
+    feature_to_index = columns.feature_to_index()
+    strategies = [_StrategySignatures(i, strategy, feature_to_index)
+                  for i, strategy in enumerate(signature_strategies)]
+
+    part_codes_per_strategy = [[] for _ in strategies]  # type: List[List[np.ndarray]]
+    record_ids_per_strategy = [[] for _ in strategies]  # type: List[List[np.ndarray]]
+    for start in range(0, len(columns), CHUNK_ROWS):
+        chunk = columns.row_slice(start, start + CHUNK_ROWS)
+        chunk_record_ids = record_ids[start:start + len(chunk)]
+        for strategy, part_codes, ids in zip(strategies, part_codes_per_strategy, record_ids_per_strategy):
+            chunk_part_codes, valid = strategy.encode(chunk, null_sentinel)
+            part_codes.append(chunk_part_codes)
+            ids.append(chunk_record_ids[valid])
+
+    reversed_index_per_strategy = []  # type: List[Dict[str, List[Any]]]
+    for strategy, part_codes, ids in zip(strategies, part_codes_per_strategy, record_ids_per_strategy):
+        signature_record_ids = np.concatenate(ids) if ids else record_ids[:0]
+        if len(signature_record_ids) == 0:
+            reversed_index_per_strategy.append({})
+            continue
+        signatures, signature_codes = strategy.signatures(np.concatenate(part_codes))
+        if size_bounds is not None:
+            min_size, max_size = size_bounds(len(columns))
+            counts = np.bincount(signature_codes, minlength=len(signatures))
+            mask = ((counts >= min_size) & (counts <= max_size))[signature_codes]
+            signature_codes, signature_record_ids = signature_codes[mask], signature_record_ids[mask]
+        grouped = group_record_ids(signature_codes, signature_record_ids)
+        reversed_index_per_strategy.append({signatures[code]: rec_ids for code, rec_ids in grouped.items()})
+    return reversed_index_per_strategy, len(columns)
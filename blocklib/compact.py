@@ -0,0 +1,155 @@
+"""Compact array-backed representation of reversed indices."""
+from itertools import chain
+from typing import Any, Dict, Hashable, Iterator, List, Mapping, Optional, Sequence, Set
+
+import numpy as np
+
+
+class CompactReversedIndex(Mapping):
+    """Read-only {block key -> record ids} mapping stored as CSR arrays.
+
+    The record ids of all blocks are concatenated into one NumPy array and the records of
+    block i are ``record_ids[offsets[i]:offsets[i + 1]]``. Compared to a dict of Python lists
+    this saves the list and the boxed integer per record id. Integer record ids are stored as
+    int32 if they fit and int64 otherwise, string ids as a unicode array and any other ids as
+    an object array.
+
+    Looking up a block returns a read-only view into the record id array.
+    """
+
+    def __init__(self, keys: Sequence[Hashable], offsets: np.ndarray, record_ids: np.ndarray):
+        """
+        :param keys: block keys, in order
+        :param offsets: int64 array of len(keys) + 1 offsets into record_ids
+        :param record_ids: record ids of all blocks, concatenated in the order of the keys
+        """
+        if len(offsets) != len(keys) + 1:
+            raise ValueError('Expected {} offsets for {} keys, got {}'.format(len(keys) + 1, len(keys), len(offsets)))
+        if offsets[-1] != len(record_ids):
+            raise ValueError('Offsets do not match the number of record ids')
+        self._keys = list(keys)
+        self._positions = {key: i for i, key in enumerate(self._keys)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.record_ids = record_ids
+        self.record_ids.flags.writeable = False
+
+    @classmethod
+    def from_dict(cls, reversed_index: Mapping[Hashable, Sequence[Any]]) -> 'CompactReversedIndex':
+        """Convert a {block key -> record ids} mapping."""
+        if isinstance(reversed_index, CompactReversedIndex):
+            return reversed_index
+        keys = list(reversed_index)
+        sizes = np.fromiter((len(reversed_index[k]) for k in keys), dtype=np.int64, count=len(keys))
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        record_ids = _record_id_array(list(chain.from_iterable(reversed_index[k] for k in keys)))
+        return cls(keys, offsets, record_ids)
+
+    def __getitem__(self, key: Hashable) -> np.ndarray:
+        i = self._positions[key]
+        return self.record_ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._positions
+
+    def __repr__(self):
+        return '{}({} blocks, {} record ids)'.format(type(self).__name__, len(self), len(self.record_ids))
+
+    def block_sizes(self) -> np.ndarray:
+        """Number of records of every block, in key order."""
+        return np.diff(self.offsets)
+
+    def select(self, keys: Sequence[Hashable], new_keys: Optional[Sequence[Hashable]] = None) -> 'CompactReversedIndex':
+        """A new compact index with only the given blocks, in the given order.
+
+        :param keys: keys of the blocks to keep
+        :param new_keys: optional keys to store the selected blocks under, one per key
+        """
+        positions = np.fromiter((self._positions[k] for k in keys), dtype=np.int64, count=len(keys))
+        starts, stops = self.offsets[positions], self.offsets[positions + 1]
+        sizes = stops - starts
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        # gather the ranges [starts[i], stops[i]) without a Python loop
+        gather = np.arange(offsets[-1]) - np.repeat(offsets[:-1] - starts, sizes)
+        return CompactReversedIndex(list(keys) if new_keys is None else new_keys, offsets, self.record_ids[gather])
+
+    def to_dict(self) -> Dict[Hashable, List[Any]]:
+        """Convert back into a dict of lists of Python objects."""
+        record_ids = self.record_ids.tolist()
+        offsets = self.offsets.tolist()
+        return {key: record_ids[offsets[i]:offsets[i + 1]] for i, key in enumerate(self._keys)}
+
+
+def _record_id_array(record_ids: List[Any]) -> np.ndarray:
+    """Store record ids in the smallest fitting integer type, or as an array of their common type."""
+    if all(type(r) is int for r in record_ids):
+        array = np.array(record_ids, dtype=np.int64)
+        if len(array) == 0 or (array.min() >= np.iinfo(np.int32).min and array.max() <= np.iinfo(np.int32).max):
+            return array.astype(np.int32)
+        return array
+    if all(type(r) is str for r in record_ids):
+        return np.array(record_ids, dtype=str)
+    array = np.empty(len(record_ids), dtype=object)
+    array[:] = record_ids
+    return array
+
+
+class ReverseBlockArrays:
+    """{record id -> block ids} inverse of a reversed index, stored as CSR arrays.
+
+    Blocks are identified by their position in `block_keys`. The blocks of the record
+    ``record_ids[i]`` are ``block_ids[indptr[i]:indptr[i + 1]]``, in ascending order.
+
+    :ivar record_ids: sorted array of the distinct record ids
+    :ivar indptr: int64 array of len(record_ids) + 1 offsets into block_ids
+    :ivar block_ids: int32 (or int64 for more than 2 ** 31 blocks) block ids of all records
+    :ivar block_keys: the key of every block id
+    """
+
+    def __init__(self, record_ids: np.ndarray, indptr: np.ndarray, block_ids: np.ndarray,
+                 block_keys: Sequence[Hashable]):
+        self.record_ids = record_ids
+        self.indptr = indptr
+        self.block_ids = block_ids
+        self.block_keys = list(block_keys)
+
+    @classmethod
+    def from_reversed_index(cls, reversed_index: Mapping[Hashable, Sequence[Any]]) -> 'ReverseBlockArrays':
+        """Invert a {block key -> record ids} mapping with a stable sort of its postings by record id."""
+        compact = CompactReversedIndex.from_dict(reversed_index)
+        num_blocks = len(compact)
+        block_dtype = np.int32 if num_blocks <= np.iinfo(np.int32).max else np.int64
+        posting_blocks = np.repeat(np.arange(num_blocks, dtype=block_dtype), compact.block_sizes())
+
+        # sorting stably by record id keeps the block ids of every record in ascending order
+        order = np.argsort(compact.record_ids, kind='stable')
+        sorted_ids = compact.record_ids[order]
+        starts = np.flatnonzero(sorted_ids[1:] != sorted_ids[:-1]) + 1
+        indptr = np.concatenate([[0], starts, [len(sorted_ids)]]).astype(np.int64) if len(sorted_ids) else \
+            np.zeros(1, dtype=np.int64)
+        record_ids = sorted_ids[indptr[:-1]]
+        return cls(record_ids, indptr, posting_blocks[order], list(compact))
+
+    def __len__(self) -> int:
+        return len(self.record_ids)
+
+    def __repr__(self):
+        return '{}({} records, {} blocks)'.format(type(self).__name__, len(self), len(self.block_keys))
+
+    def blocks_of(self, i: int) -> np.ndarray:
+        """The block ids of the i-th record, `record_ids[i]`."""
+        return self.block_ids[self.indptr[i]:self.indptr[i + 1]]
+
+    def to_dict(self) -> Dict[Hashable, Set[Hashable]]:
+        """Convert into a dict {record id -> set of block keys} as returned by `generate_reverse_blocks`."""
+        block_ids = self.block_ids.tolist()
+        indptr = self.indptr.tolist()
+        return {record_id: {self.block_keys[b] for b in block_ids[indptr[i]:indptr[i + 1]]}
+                for i, record_id in enumerate(self.record_ids.tolist())}
@@ -1,7 +1,21 @@
 """Class to implement privacy preserving encoding."""
 import hashlib
+import struct
 import numpy as np
-from typing import List, Set
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .utils import LRUCache
+
+# P-Sig block keys are sorted bloom filter positions packed as little endian uint32
+BLOCK_KEY_DTYPE = np.dtype('<u4')
+
+
+def _hash_pair(string: str, bf_len: int) -> Tuple[int, int]:
+    """The two base hashes of string (SHA1 and MD5) modulo bf_len for double hashing."""
+    encoded = string.encode('utf-8')
+    int1 = int.from_bytes(hashlib.sha1(encoded).digest(), 'big') % bf_len
+    int2 = int.from_bytes(hashlib.md5(encoded).digest(), 'big') % bf_len
+    return int1, int2
 
 
 def flip_bloom_filter(string: str, bf_len: int, num_hash_funct: int):
@@ -13,14 +27,7 @@ def flip_bloom_filter(string: str, bf_len: int, num_hash_funct: int):
     :param num_hash_funct: int: number of hash functions
     :return: bfset: a set of integers - indices that have been flipped to 1
     """
-    # config for hashing
-    h1 = hashlib.sha1
-    h2 = hashlib.md5
-
-    sha_bytes = h1(string.encode('utf-8')).digest()
-    md5_bytes = h2(string.encode('utf-8')).digest()
-    int1 = int.from_bytes(sha_bytes, 'big') % bf_len
-    int2 = int.from_bytes(md5_bytes, 'big') % bf_len
+    int1, int2 = _hash_pair(string, bf_len)
 
     # flip {num_hash_funct} times
     bfset = set()
@@ -31,27 +38,116 @@ def flip_bloom_filter(string: str, bf_len: int, num_hash_funct: int):
     return bfset
 
 
+def bloom_filter_key(positions: Iterable[int]) -> bytes:
+    """
+    Canonical block key of a set of bloom filter positions.
+
+    The key holds the distinct positions in increasing order as little endian uint32 values,
+    so it does not depend on the iteration order of positions.
+
+    :param positions: indices of bits set to one, e.g. the result of `flip_bloom_filter`
+    :return: bytes key, 4 bytes per distinct position
+    """
+    distinct = sorted(set(positions))
+    return struct.pack('<{}I'.format(len(distinct)), *distinct)
+
+
+def bloom_filter_keys(indices: np.ndarray) -> List[bytes]:
+    """
+    Block keys of many sets of bloom filter positions at once, the same as `bloom_filter_key` of every row.
+
+    :param indices: 2-D integer array with one set of positions per row, e.g. the result of `flip_bloom_filters`
+    :return: list of bytes keys, one per row of indices
+    """
+    positions = np.sort(indices, axis=1)
+    # drop the repeated positions of a row, which are next to each other after sorting
+    distinct = np.ones(positions.shape, dtype=bool)
+    distinct[:, 1:] = positions[:, 1:] != positions[:, :-1]
+    buffer = positions[distinct].astype(BLOCK_KEY_DTYPE).tobytes()
+    ends = np.cumsum(distinct.sum(axis=1)) * BLOCK_KEY_DTYPE.itemsize
+    starts = np.concatenate([[0], ends[:-1]])
+    return [buffer[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def block_key_positions(key: bytes) -> np.ndarray:
+    """
+    Bloom filter positions of a block key created with `bloom_filter_key`.
+
+    :param key: bytes block key
+    :return: read-only uint32 array of the positions in increasing order
+    """
+    return np.frombuffer(key, dtype=BLOCK_KEY_DTYPE)
+
+
+def flip_bloom_filters(strings: Sequence[str], bf_len: int, num_hash_funct: int,
+                       cache: Optional[LRUCache] = None) -> np.ndarray:
+    """
+    Hash many strings at once and return the indices of the bits each of them flips.
+
+    Row i holds the same indices as `flip_bloom_filter(strings[i], ...)`, in hash function
+    order and possibly with repetitions.
+
+    :param strings: strings to be hashed
+    :param bf_len: int: length of bloom filter
+    :param num_hash_funct: int: number of hash functions
+    :param cache: optional LRUCache memoizing the indices of a string, keyed by (string, bf_len, num_hash_funct).
+        Repeated strings of one call are hashed once anyway, the cache only pays off across many calls.
+    :return: int64 array of shape (len(strings), num_hash_funct)
+    """
+    # number the distinct strings, so that each of them is looked up and hashed once
+    codes = {}  # type: Dict[str, int]
+    inverse = np.fromiter((codes.setdefault(string, len(codes)) for string in strings), dtype=np.int64,
+                          count=len(strings))
+    distinct_indices = np.empty((len(codes), num_hash_funct), dtype=np.int64)
+    to_hash = []  # type: List[Tuple[int, str]]
+    for code, string in enumerate(codes):
+        cached = None if cache is None else cache.get((string, bf_len, num_hash_funct))
+        if cached is not None:
+            distinct_indices[code] = cached
+        else:
+            to_hash.append((code, string))
+
+    if to_hash:
+        pairs = np.array([_hash_pair(string, bf_len) for _, string in to_hash], dtype=np.int64).reshape(-1, 2)
+        hashed = (pairs[:, :1] + np.arange(num_hash_funct) * pairs[:, 1:]) % bf_len
+        distinct_indices[[code for code, _ in to_hash]] = hashed
+        if cache is not None:
+            for (_, string), string_indices in zip(to_hash, hashed):
+                cache.put((string, bf_len, num_hash_funct), string_indices.copy())
+    return distinct_indices[inverse]
+
+def generate_bloom_filters(list_of_list_of_strs: Sequence[Sequence[str]], bf_len: int, num_hash_funct: int,
+                           out: Optional[np.ndarray] = None, cache: Optional[LRUCache] = None) -> np.ndarray:
+    """
+    Generate one bloom filter per list of strings.
+
+    :param list_of_list_of_strs: for every bloom filter the strings to insert
+    :param bf_len: int: length of bloom filter
+    :param num_hash_funct: int: number of hash functions
+    :param out: optional preallocated bool array of shape (len(list_of_list_of_strs), bf_len) to write into.
+        It is expected to be all False.
+    :param cache: optional LRUCache, see `flip_bloom_filters`
+    :return: bool array where row i is the bloom filter of list_of_list_of_strs[i]
+    """
+    if out is None:
+        out = np.zeros((len(list_of_list_of_strs), bf_len), dtype=bool)
+    elif out.shape != (len(list_of_list_of_strs), bf_len):
+        raise ValueError('Expected output array of shape {}, got {}'.format(
+            (len(list_of_list_of_strs), bf_len), out.shape))
+
+    strings = [s for list_of_strs in list_of_list_of_strs for s in list_of_strs]
+    rows = np.repeat(np.arange(len(list_of_list_of_strs)), [len(list_of_strs) for list_of_strs in list_of_list_of_strs])
+    out[rows[:, None], flip_bloom_filters(strings, bf_len, num_hash_funct, cache)] = True
+    return out
+
+
 def generate_bloom_filter(list_of_strs: List[str], bf_len: int, num_hash_funct: int):
     """
     Generate a bloom filter given list of strings.
 
-    :param return_cbf_index_sig_map:
     :param list_of_strs:
     :param bf_len:
     :param num_hash_funct:
-    :return: bloom_filter_vector if return_cbf_index_sig_map is False else (bloom_filter_vector, cbf_index_sig_map)
+    :return: bloom_filter_vector as a numpy bool array
     """
-    # go through each signature and generate bloom filter of it
-    # -- we only store the set of index that flipped to 1
-    candidate_bloom_filter = set()  # type: Set[int]
-
-    for signature in list_of_strs:
-        bfset = flip_bloom_filter(signature, bf_len, num_hash_funct)
-        # union indices that have been flipped 1 in candidate bf
-        candidate_bloom_filter = candidate_bloom_filter.union(bfset)
-
-    # massage the cbf into a numpy bool array from a set
-    bloom_filter_vector = np.zeros(bf_len, dtype=bool)
-    bloom_filter_vector[list(candidate_bloom_filter)] = True
-
-    return bloom_filter_vector
+    return generate_bloom_filters([list_of_strs], bf_len, num_hash_funct)[0]
@@ -1,6 +1,15 @@
 """Module to evaluate blocking when ground truth is available."""
-from tqdm import tqdm
 import logging
+from collections import Counter
+from itertools import chain, combinations
+from typing import Any, Dict, Hashable, List, Mapping, Sequence, Tuple, Union
+
+import numpy as np
+
+from .compact import CompactReversedIndex
+from .utils import map_shards, resolve_n_jobs, shard_bounds
+
+EntityIds = Union[Sequence[Hashable], Mapping[Any, Hashable]]
 
 
 def assess_blocks_2party(filtered_reverse_indices, data):
@@ -10,35 +19,149 @@ def assess_blocks_2party(filtered_reverse_indices, data):
     :ivar data: a list of lists of entity_ids for 2 data providers
     """
     # currently just support for two party
-    dp1_signature, dp2_signature = filtered_reverse_indices
-    dp1_data, dp2_data = data
+    if len(filtered_reverse_indices) != 2 or len(data) != 2:
+        raise ValueError('assess_blocks_2party needs the blocks and entity ids of exactly 2 parties')
+    assessment = assess_blocks(filtered_reverse_indices, data)
+    return assessment['rr'], assessment['pc']
 
-    keys = set(dp1_signature.keys()).intersection(dp2_signature.keys())
-    num_comparisons = 0
-    found_matches = set()
 
-    for key in tqdm(keys, desc='assessing blocks', total=len(keys), unit='key'):
-        dp1_recs = dp1_signature.get(key, None)
-        dp2_recs = dp2_signature.get(key, None)
-        if dp1_recs is None or dp2_recs is None:
-            continue
-        num_comparisons += len(dp1_recs) * len(dp2_recs)
+def assess_blocks(filtered_reverse_indices: Sequence[Mapping[Any, Sequence[Any]]], data: Sequence[EntityIds],
+                  n_jobs: int = 1) -> Dict[str, Any]:
+    """Assess the blocking result of 2 or more parties against the ground truth.
 
-        found_matches.update(set(dp1_data[rec] for rec in dp1_recs).intersection(dp2_data[rec] for rec in dp2_recs))
+    Every pair of parties compares the records of the blocks they have in common. The entity ids are
+    encoded as integers and the blocks as arrays of (block, entity) codes, so the number of comparisons
+    is a dot product of the block sizes and the found matches a join of sorted arrays.
 
-    num_full_comparison = len(dp1_data) * len(dp2_data)
-    if num_full_comparison == 0:
+    :param filtered_reverse_indices: for each party, a mapping from block key to record ids
+    :param data: for each party, the entity id of every record. Either a list indexed by the record ids
+        (the positions of the records if there is no record id column) or a mapping from record id to entity id.
+    :param n_jobs: number of processes joining the blocks, -1 for one per CPU.
+        The blocks are split into shards of block keys. The result does not depend on n_jobs.
+    :return: dictionary with
+        'rr': reduction ratio, 1 - comparisons / all comparisons between the parties,
+        'pc': pair completeness, found true matches / all true matches,
+        'pq': pairs quality, found true matches / comparisons,
+        'f_measure': harmonic mean of pc and pq,
+        and the counts 'num_comparisons', 'num_all_comparisons', 'num_true_matches' and 'num_found_matches'.
+        A true match is an entity that has a record in both parties of a pair of parties.
+    """
+    if len(filtered_reverse_indices) != len(data) or len(data) < 2:
+        raise ValueError('Need blocks and entity ids for the same number (at least 2) of parties')
+    n_jobs = resolve_n_jobs(n_jobs)
+    party_pairs = list(combinations(range(len(data)), 2))
+
+    num_all_comparisons = sum(len(data[i]) * len(data[j]) for i, j in party_pairs)
+    if num_all_comparisons == 0:
         raise ValueError('There are not records in the provided data. Therefore we cannot assess the blocking result.')
 
-    entity1 = set(dp1_data)
-    entity2 = set(dp2_data)
-    num_all_true_matches = len(entity1.intersection(entity2))
+    party_entities, num_entities = _encode_entities([_entity_ids(entities) for entities in data])
+
+    # only blocks of at least 2 parties lead to comparisons
+    key_counts = Counter(chain.from_iterable(filtered_reverse_indices))
+    key_codes = {}  # type: Dict[Any, int]
+    for key, count in key_counts.items():
+        if count >= 2:
+            key_codes[key] = len(key_codes)
+    num_keys = len(key_codes)
 
-    # pair completeness is the "recall" before matching stage
-    rr = 1.0 - num_comparisons / num_full_comparison
-    if len(found_matches) == 0:
+    block_sizes = np.zeros((len(data), num_keys), dtype=np.int64)
+    party_pairs_codes = []  # type: List[np.ndarray]
+    for party, (blocks, entities) in enumerate(zip(filtered_reverse_indices, data)):
+        keys = [k for k in blocks if k in key_codes]
+        codes = np.fromiter(map(key_codes.__getitem__, keys), dtype=np.int64, count=len(keys))
+        sizes = np.fromiter(map(len, map(blocks.__getitem__, keys)), dtype=np.int64, count=len(keys))
+        block_sizes[party, codes] = sizes
+        records = _record_positions(blocks, keys, int(sizes.sum()), entities)
+        # (block, entity) pairs of the party as block code * num_entities + entity code
+        party_pairs_codes.append(np.repeat(codes, sizes) * num_entities + party_entities[party][records])
+
+    num_comparisons = sum(int(np.dot(block_sizes[i], block_sizes[j])) for i, j in party_pairs)
+    num_true_matches = sum(len(np.intersect1d(party_entities[i], party_entities[j])) for i, j in party_pairs)
+
+    # join the (block, entity) pairs of the parties per shard of block codes
+    bounds = shard_bounds(num_keys, n_jobs)
+    shards = [(parts, party_pairs, num_entities) for parts in _split_by_block(party_pairs_codes, bounds, num_entities)]
+    if len(shards) == 1:
+        shard_matches = [_found_matches(*shards[0])]
+    else:
+        shard_matches = map_shards(_found_matches, shards, n_jobs)
+    num_found_matches = sum(len(np.unique(np.concatenate([matches[pair] for matches in shard_matches])))
+                            for pair in range(len(party_pairs)))
+
+    rr = 1.0 - num_comparisons / num_all_comparisons
+    if num_found_matches == 0:
         logging.warning("Pair completeness is zero, because there are no true matches in the provided data.")
-        pc = 0
+        pc = 0.0
     else:
-        pc = len(found_matches) / num_all_true_matches
-    return rr, pc
+        pc = num_found_matches / num_true_matches
+    pq = 0.0 if num_comparisons == 0 else num_found_matches / num_comparisons
+    f_measure = 0.0 if pc + pq == 0 else 2 * pc * pq / (pc + pq)
+    return {
+        'rr': rr,
+        'pc': pc,
+        'pq': pq,
+        'f_measure': f_measure,
+        'num_comparisons': num_comparisons,
+        'num_all_comparisons': num_all_comparisons,
+        'num_true_matches': num_true_matches,
+        'num_found_matches': num_found_matches,
+    }
+
+
+def _entity_ids(entities: EntityIds) -> Sequence[Hashable]:
+    return list(entities.values()) if isinstance(entities, Mapping) else entities
+
+
+def _encode_entities(party_entities: List[Sequence[Hashable]]) -> Tuple[List[np.ndarray], int]:
+    """Encode the entity ids of all parties as integers 0, 1, ... and return the codes and their number."""
+    arrays = [np.asarray(entities) for entities in party_entities]
+    kinds = {array.dtype.kind for array in arrays if len(array)}
+    # NumPy converts mixed ids like [1, '1'] to strings, only use it if the ids really are all strings
+    if all(array.ndim == 1 for array in arrays) and (kinds <= {'i', 'u'} or (
+            kinds <= {'U'} and all(set(map(type, entities)) <= {str} for entities in party_entities))):
+        # integer or string ids, let NumPy sort them
+        unique, codes = np.unique(np.concatenate(arrays), return_inverse=True)
+        splits = np.cumsum([len(array) for array in arrays])[:-1]
+        return np.split(codes.astype(np.int64), splits), len(unique)
+    entity_codes = {}  # type: Dict[Hashable, int]
+    encoded = [np.fromiter(map(lambda e: entity_codes.setdefault(e, len(entity_codes)), entities),
+                           dtype=np.int64, count=len(entities)) for entities in party_entities]
+    return encoded, len(entity_codes)
+
+
+def _record_positions(blocks: Mapping[Any, Sequence[Any]], keys: List[Any], num_records: int,
+                      entities: EntityIds) -> np.ndarray:
+    """Positions in the entity ids of the records of the given blocks, concatenated in order."""
+    if isinstance(blocks, CompactReversedIndex):
+        record_ids = iter(blocks.select(keys).record_ids.tolist())
+    else:
+        record_ids = chain.from_iterable(map(blocks.__getitem__, keys))
+    if isinstance(entities, Mapping):
+        positions = {rec_id: i for i, rec_id in enumerate(entities)}
+        record_ids = map(positions.__getitem__, record_ids)
+    return np.fromiter(record_ids, dtype=np.int64, count=num_records)
+
+
+def _split_by_block(party_pairs_codes: List[np.ndarray], bounds: List[Tuple[int, int]],
+                    num_entities: int) -> List[List[np.ndarray]]:
+    """Split the (block, entity) codes of every party into the given shards of block codes."""
+    if len(bounds) == 1:
+        return [party_pairs_codes]
+    starts = np.array([start for start, _ in bounds[1:]], dtype=np.int64) * num_entities
+    shards = [[] for _ in bounds]  # type: List[List[np.ndarray]]
+    for codes in party_pairs_codes:
+        shard_ids = np.searchsorted(starts, codes, side='right')
+        order = np.argsort(shard_ids, kind='stable')
+        offsets = np.searchsorted(shard_ids[order], np.arange(len(bounds) + 1))
+        for shard, (start, stop) in zip(shards, zip(offsets[:-1], offsets[1:])):
+            shard.append(codes[order[start:stop]])
+    return shards
+
+
+def _found_matches(party_pairs_codes: List[np.ndarray], party_pairs: List[Tuple[int, int]],
+                   num_entities: int) -> List[np.ndarray]:
+    """For every pair of parties, the distinct entities that share a block in both parties."""
+    unique_codes = [np.unique(codes) for codes in party_pairs_codes]
+    return [np.unique(np.intersect1d(unique_codes[i], unique_codes[j], assume_unique=True) % num_entities)
+            for i, j in party_pairs]
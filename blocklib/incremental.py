@@ -0,0 +1,426 @@
+"""Blocking indices that are updated in place as records are added or removed.
+
+A full build generates the signatures of every record, hashes every signature into a bloom
+filter and regroups all postings. The incremental indices keep the intermediate state of a
+build, so applying a delta of records only costs work proportional to the delta and to the
+blocks it touches.
+"""
+from collections import Counter, defaultdict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from .columnar import ColumnarData, build_signature_index_columnar, is_columnar
+from .encoding import bloom_filter_keys, flip_bloom_filters
+from .pprlindex import ReversedIndexResult
+from .pprllambdafold import PPRLIndexLambdaFold
+from .pprlpsig import PPRLIndexPSignature, _signature_index
+from .stats import block_size_counts_stats, size_counts_per_strategy_stats
+from .validation import LambdaConfig, PSigConfig
+
+
+class ReversedIndexDiff:
+    """Blocks that changed in an update of an incremental index.
+
+    :ivar added: {block key -> record ids} of blocks that did not exist before the update
+    :ivar changed: {block key -> record ids} of existing blocks whose records changed
+    :ivar removed: keys of blocks that no longer exist
+    """
+
+    def __init__(self, added: Dict[Hashable, List[Any]], changed: Dict[Hashable, List[Any]],
+                 removed: List[Hashable]):
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+
+    def __len__(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+    def __repr__(self):
+        return 'ReversedIndexDiff({} added, {} changed, {} removed)'.format(
+            len(self.added), len(self.changed), len(self.removed))
+
+
+def _count_size(size_counts: Dict[int, int], size: int, delta: int):
+    """Add delta blocks of the given size to {block size -> number of blocks}, dropping sizes without blocks."""
+    count = size_counts.get(size, 0) + delta
+    if count:
+        size_counts[size] = count
+    else:
+        del size_counts[size]
+
+
+def _apply_blocks(reversed_index: Dict[Any, List[Any]], blocks: Iterable[Tuple[Hashable, List[Any]]],
+                  block_sizes: Dict[int, int]) -> ReversedIndexDiff:
+    """Replace blocks of reversed_index in place, an empty block removes its key.
+
+    :param block_sizes: {block size -> number of blocks} of reversed_index, updated in place
+    """
+    added, changed, removed = {}, {}, []
+    for key, block in blocks:
+        old_block = reversed_index.get(key)
+        if old_block is not None:
+            _count_size(block_sizes, len(old_block), -1)
+        if block:
+            _count_size(block_sizes, len(block), 1)
+        if not block:
+            if old_block is not None:
+                del reversed_index[key]
+                removed.append(key)
+        elif old_block is None:
+            reversed_index[key] = added[key] = block
+        elif old_block != block:
+            reversed_index[key] = changed[key] = block
+    return ReversedIndexDiff(added, changed, removed)
+
+
+def _check_new_record_ids(record_ids: List[Any], index_records: Dict[Any, Any]):
+    """Raise a ValueError if record ids repeat within the added records or are already in the index."""
+    repeated = [rec_id for rec_id, count in Counter(record_ids).items() if count > 1]
+    if repeated:
+        raise ValueError('Records with ids {} occur more than once in the added records'.format(repeated[:10]))
+    duplicates = [rec_id for rec_id in record_ids if rec_id in index_records]
+    if duplicates:
+        raise ValueError('Records with ids {} are already in the index'.format(duplicates[:10]))
+
+
+class IncrementalPSigIndex:
+    """P-Sig index that supports adding and removing records without a full rebuild.
+
+    The index keeps the unfiltered postings {signature -> record ids} of every strategy, the
+    signatures of every record and the signatures grouped by block size. An update only touches
+    the signatures of the added and removed records plus, for the ratio filter, the signatures
+    whose size lies between the old and the new filter bounds. Bloom filter keys are computed
+    once per signature that passes the filter. The statistics are computed from the number of
+    blocks of every size, which the updates keep up to date.
+
+    The blocks are the same as those of a full build on the current records, up to the order of
+    the record ids within a block.
+    """
+
+    def __init__(self, config: Union[PSigConfig, Dict, PPRLIndexPSignature], header: Optional[List[str]] = None):
+        """
+        :param config: P-Sig configuration, or a PPRLIndexPSignature state
+        :param header: file header, optional. Required if features are given by name and records are tuples.
+        """
+        self.state = config if isinstance(config, PPRLIndexPSignature) else PPRLIndexPSignature(config)
+        self.header = header
+        num_strategies = len(self.state.signature_strategies)
+        # ordered sets (dicts with None values) of record ids, so records can be removed in O(1)
+        self.postings = [{} for _ in range(num_strategies)]  # type: List[Dict[str, Dict[Any, None]]]
+        self.record_signatures = {}  # type: Dict[Any, List[Tuple[int, str]]]
+        self.reversed_index = {}  # type: Dict[bytes, List[Any]]
+        # {block size -> signatures} of every strategy
+        self._sizes = [defaultdict(set) for _ in range(num_strategies)]  # type: List[Dict[int, Set[str]]]
+        self._bounds = (0.0, 0.0)  # type: Tuple[float, float]
+        # {signature -> block size} of the signatures passing the filter, and their number per size
+        self._passing = [{} for _ in range(num_strategies)]  # type: List[Dict[str, int]]
+        self._passing_sizes = [{} for _ in range(num_strategies)]  # type: List[Dict[int, int]]
+        self._block_sizes = {}  # type: Dict[int, int]
+        self._signature_keys = {}  # type: Dict[str, bytes]
+        self._key_signatures = defaultdict(list)  # type: Dict[bytes, List[Tuple[int, str]]]
+        # number of passing signatures of every record, for the coverage
+        self._num_passing = defaultdict(int)  # type: Dict[Any, int]
+        self._num_covered = 0
+        self._next_record_id = 0
+        self._feature_to_index = None  # type: Optional[Dict[str, int]]
+        self._features_resolved = False
+
+    @property
+    def num_records(self) -> int:
+        return len(self.record_signatures)
+
+    def add_records(self, data: Any) -> Tuple[ReversedIndexResult, ReversedIndexDiff]:
+        """Add records to the index.
+
+        :param data: list of tuples, or columnar data (see `PPRLIndexPSignature.build_reversed_index_columnar`).
+            Without a record id column, records are numbered after the highest id assigned so far.
+        :return: the updated result and the blocks that changed
+        """
+        if is_columnar(data):
+            columns = ColumnarData(data)
+            if not self._features_resolved:
+                self._feature_to_index = self.state.get_columnar_feature_to_index_map(columns)
+                self.state.set_blocking_features_index(self.state.blocking_features, self._feature_to_index)
+                self._features_resolved = True
+            delta, num_records = build_signature_index_columnar(
+                self.state.signature_strategies, columns, self.state.null_sentinel, self.state.rec_id_col,
+                first_record_id=self._next_record_id)
+            if self.state.rec_id_col is None:
+                record_ids = list(range(self._next_record_id, self._next_record_id + num_records))  # type: List[Any]
+            else:
+                record_ids = columns.column(self.state.rec_id_col).tolist()
+        else:
+            if not self._features_resolved and len(data) > 0:
+                self._feature_to_index = self.state.get_feature_to_index_map(data, self.header)
+                self.state.set_blocking_features_index(self.state.blocking_features, self._feature_to_index)
+                self._features_resolved = True
+            if self.state.rec_id_col is None:
+                record_ids = list(range(self._next_record_id, self._next_record_id + len(data)))
+            else:
+                record_ids = [x[self.state.rec_id_col] for x in data]
+            delta = _signature_index(self.state.signature_strategies, self.state.null_sentinel,
+                                     self._feature_to_index, data, record_ids)
+
+        _check_new_record_ids(record_ids, self.record_signatures)
+        if self.state.rec_id_col is None:
+            self._next_record_id += len(record_ids)
+
+        for rec_id in record_ids:
+            self.record_signatures[rec_id] = []
+        touched = []  # type: List[Tuple[int, str]]
+        for strategy_index, rev_index in enumerate(delta):
+            postings = self.postings[strategy_index]
+            passing = self._passing[strategy_index]
+            for signature, rec_ids in rev_index.items():
+                touched.append((strategy_index, signature))
+                signature_postings = postings.setdefault(signature, {})
+                self._resize(strategy_index, signature, len(signature_postings), len(signature_postings) + len(rec_ids))
+                for rec_id in rec_ids:
+                    signature_postings[rec_id] = None
+                    self.record_signatures[rec_id].append((strategy_index, signature))
+                    if signature in passing:
+                        self._cover(rec_id)
+        return self._update(touched)
+
+    def remove_records(self, record_ids: Iterable[Any]) -> Tuple[ReversedIndexResult, ReversedIndexDiff]:
+        """Remove records from the index.
+
+        :param record_ids: ids of the records to remove
+        :raises KeyError: if a record is not in the index
+        :return: the updated result and the blocks that changed
+        """
+        record_ids = list(dict.fromkeys(record_ids))
+        missing = [rec_id for rec_id in record_ids if rec_id not in self.record_signatures]
+        if missing:
+            raise KeyError('Records with ids {} are not in the index'.format(missing[:10]))
+
+        touched = []  # type: List[Tuple[int, str]]
+        for rec_id in record_ids:
+            for strategy_index, signature in self.record_signatures.pop(rec_id):
+                touched.append((strategy_index, signature))
+                if signature in self._passing[strategy_index]:
+                    self._uncover(rec_id)
+                signature_postings = self.postings[strategy_index][signature]
+                self._resize(strategy_index, signature, len(signature_postings), len(signature_postings) - 1)
+                del signature_postings[rec_id]
+            self._num_passing.pop(rec_id, None)
+        return self._update(touched)
+
+    def result(self) -> ReversedIndexResult:
+        """The current blocks and their statistics."""
+        return ReversedIndexResult(self.reversed_index, self._stats())
+
+    def _resize(self, strategy_index: int, signature: str, old_size: int, new_size: int):
+        sizes = self._sizes[strategy_index]
+        if old_size > 0:
+            sizes[old_size].discard(signature)
+            if not sizes[old_size]:
+                del sizes[old_size]
+        if new_size > 0:
+            sizes[new_size].add(signature)
+
+    def _cover(self, rec_id: Any):
+        self._num_passing[rec_id] += 1
+        if self._num_passing[rec_id] == 1:
+            self._num_covered += 1
+
+    def _uncover(self, rec_id: Any):
+        self._num_passing[rec_id] -= 1
+        if self._num_passing[rec_id] == 0:
+            self._num_covered -= 1
+
+    def _update(self, touched: List[Tuple[int, str]]) -> Tuple[ReversedIndexResult, ReversedIndexDiff]:
+        """Re-apply the filter to the touched signatures and rebuild the blocks they belong to."""
+        min_size, max_size = self.state._block_size_bounds(self.num_records)
+        old_min_size, old_max_size = self._bounds
+        self._bounds = (min_size, max_size)
+        candidates = set(touched)
+        # with the ratio filter the bounds move with the number of records, which changes the filter
+        # status of the signatures with a size between the old and the new bound. Only the sizes that
+        # occur are checked, the bounds can be far apart (e.g. from (0, 0) to a count filter max).
+        if (min_size, max_size) != (old_min_size, old_max_size):
+            for strategy_index, sizes in enumerate(self._sizes):
+                for size, signatures in sizes.items():
+                    if (old_min_size <= size <= old_max_size) != (min_size <= size <= max_size):
+                        candidates.update((strategy_index, s) for s in signatures)
+
+        changed = []  # type: List[Tuple[int, str]]
+        for strategy_index, signature in candidates:
+            postings = self.postings[strategy_index]
+            passing, passing_sizes = self._passing[strategy_index], self._passing_sizes[strategy_index]
+            rec_ids = postings.get(signature, {})
+            old_size = passing.pop(signature, None)
+            was_passing = old_size is not None
+            is_passing = len(rec_ids) > 0 and max_size >= len(rec_ids) >= min_size
+            if old_size is not None:
+                _count_size(passing_sizes, old_size, -1)
+            if is_passing:
+                passing[signature] = len(rec_ids)
+                _count_size(passing_sizes, len(rec_ids), 1)
+            if was_passing != is_passing:
+                for rec_id in rec_ids:
+                    if is_passing:
+                        self._cover(rec_id)
+                    else:
+                        self._uncover(rec_id)
+            if was_passing or is_passing:
+                changed.append((strategy_index, signature))
+            if len(rec_ids) == 0:
+                postings.pop(signature, None)
+
+        # bloom filter keys of signatures that pass the filter for the first time
+        new_signatures = [s for i, s in changed if s in self._passing[i] and s not in self._signature_keys]
+        bf_indices = flip_bloom_filters(new_signatures, self.state.blocking_config.bloom_filter_length,
+                                        self.state.blocking_config.number_of_hash_functions)
+        self._signature_keys.update(zip(new_signatures, bloom_filter_keys(bf_indices)))
+
+        affected_keys = {}  # type: Dict[bytes, None]
+        for strategy_index, signature in changed:
+            key = self._signature_keys[signature]
+            key_signatures = self._key_signatures[key]
+            if signature in self._passing[strategy_index]:
+                if (strategy_index, signature) not in key_signatures:
+                    key_signatures.append((strategy_index, signature))
+            else:
+                key_signatures.remove((strategy_index, signature))
+                del self._signature_keys[signature]
+            affected_keys[key] = None
+
+        blocks = []  # type: List[Tuple[bytes, List[Any]]]
+        for key in affected_keys:
+            key_signatures = self._key_signatures[key]
+            if not key_signatures:
+                del self._key_signatures[key]
+            blocks.append((key, [rec_id for i, s in key_signatures for rec_id in self.postings[i][s]]))
+        diff = _apply_blocks(self.reversed_index, blocks, self._block_sizes)
+        return self.result(), diff
+
+    def _stats(self) -> Dict:
+        stats = block_size_counts_stats(self._block_sizes)
+        stats['statistics_per_strategy'] = size_counts_per_strategy_stats(self._passing_sizes, self.num_records)
+        stats['coverage'] = self._num_covered / self.num_records if self.num_records > 0 else 0
+        return stats
+
+
+class IncrementalLambdaFoldIndex:
+    """Lambda-fold index that supports adding and removing records without a full rebuild.
+
+    The block keys of a record only depend on the record and the sampled bit positions of the
+    state (see `PPRLIndexLambdaFold.sampled_positions`), so adding records only encodes the new
+    records and updates the blocks they fall into. The blocks are the same as those of a full
+    build on the current records. The statistics are computed from the number of blocks of every
+    size, which the updates keep up to date.
+    """
+
+    def __init__(self, config: Union[LambdaConfig, Dict, PPRLIndexLambdaFold], header: Optional[List[str]] = None):
+        """
+        :param config: Lambda-fold configuration, or a PPRLIndexLambdaFold state
+        :param header: file header, optional
+        """
+        self.state = config if isinstance(config, PPRLIndexLambdaFold) else PPRLIndexLambdaFold(config)
+        self.header = header
+        # ordered sets (dicts with None values) of record ids, so records can be removed in O(1)
+        self.blocks = {}  # type: Dict[str, Dict[Any, None]]
+        self.record_keys = {}  # type: Dict[Any, List[str]]
+        self.reversed_index = {}  # type: Dict[str, List[Any]]
+        self._block_sizes = {}  # type: Dict[int, int]
+        self._next_record_id = 0
+        self._features_resolved = False
+
+    @classmethod
+    def from_candidate_blocks(cls, candidate_block_obj: Any,
+                              header: Optional[List[str]] = None) -> 'IncrementalLambdaFoldIndex':
+        """Continue a Lambda-fold index from a candidate blocking result, e.g. one loaded with
+        `load_candidate_blocks` in a later session.
+
+        :param candidate_block_obj: CandidateBlockingResult of a Lambda-fold index whose state has sampled positions
+        :param header: file header, optional
+        """
+        state = candidate_block_obj.state
+        if not isinstance(state, PPRLIndexLambdaFold):
+            raise TypeError('Expected a Lambda-fold state, got {}'.format(type(state).__name__))
+        if state.sampled_positions is None:
+            raise ValueError('The state does not have sampled positions')
+        index = cls(state, header)
+        for key, rec_ids in candidate_block_obj.blocks.items():
+            rec_ids = rec_ids.tolist() if isinstance(rec_ids, np.ndarray) else list(rec_ids)
+            index.blocks[key] = dict.fromkeys(rec_ids)
+            index.reversed_index[key] = rec_ids
+            _count_size(index._block_sizes, len(rec_ids), 1)
+            for rec_id in rec_ids:
+                index.record_keys.setdefault(rec_id, []).append(key)
+        int_ids = [rec_id for rec_id in index.record_keys if type(rec_id) is int]
+        index._next_record_id = max(int_ids) + 1 if int_ids else 0
+        return index
+
+    @property
+    def num_records(self) -> int:
+        return len(self.record_keys)
+
+    def add_records(self, data: Sequence[Any]) -> Tuple[ReversedIndexResult, ReversedIndexDiff]:
+        """Add records (or CLKs) to the index.
+
+        :param data: list of tuples, or CLKs if the state is configured for them.
+            Without a record id column, records are numbered after the highest id assigned so far.
+        :return: the updated result and the blocks that changed
+        """
+        if len(data) == 0:
+            return self.result(), ReversedIndexDiff({}, {}, [])
+        if not self._features_resolved:
+            feature_to_index = self.state.get_feature_to_index_map(data, self.header)
+            self.state.set_blocking_features_index(self.state.blocking_features, feature_to_index)
+            self._features_resolved = True
+
+        if self.state.record_id_col is None:
+            record_ids = list(range(self._next_record_id, self._next_record_id + len(data)))  # type: List[Any]
+        else:
+            record_ids = [x[self.state.record_id_col] for x in data]
+        _check_new_record_ids(record_ids, self.record_keys)
+        if self.state.record_id_col is None:
+            self._next_record_id += len(record_ids)
+
+        sampled_positions = self.state._sample_indices(data)
+        affected_keys = {}  # type: Dict[str, None]
+        for rec_id in record_ids:
+            self.record_keys[rec_id] = []
+        for lambda_table in self.state._lambda_tables(data, record_ids, sampled_positions):
+            for key, rec_ids in lambda_table.items():
+                self.blocks.setdefault(key, {}).update(dict.fromkeys(rec_ids))
+                for rec_id in rec_ids:
+                    self.record_keys[rec_id].append(key)
+                affected_keys[key] = None
+        return self._update(affected_keys)
+
+    def remove_records(self, record_ids: Iterable[Any]) -> Tuple[ReversedIndexResult, ReversedIndexDiff]:
+        """Remove records from the index.
+
+        :param record_ids: ids of the records to remove
+        :raises KeyError: if a record is not in the index
+        :return: the updated result and the blocks that changed
+        """
+        record_ids = list(dict.fromkeys(record_ids))
+        missing = [rec_id for rec_id in record_ids if rec_id not in self.record_keys]
+        if missing:
+            raise KeyError('Records with ids {} are not in the index'.format(missing[:10]))
+
+        affected_keys = {}  # type: Dict[str, None]
+        for rec_id in record_ids:
+            for key in self.record_keys.pop(rec_id):
+                del self.blocks[key][rec_id]
+                affected_keys[key] = None
+        return self._update(affected_keys)
+
+    def result(self) -> ReversedIndexResult:
+        """The current blocks and their statistics."""
+        return ReversedIndexResult(self.reversed_index, block_size_counts_stats(self._block_sizes))
+
+    def _update(self, affected_keys: Iterable[str]) -> Tuple[ReversedIndexResult, ReversedIndexDiff]:
+        blocks = []  # type: List[Tuple[str, List[Any]]]
+        for key in affected_keys:
+            block = list(self.blocks[key])
+            if not block:
+                del self.blocks[key]
+            blocks.append((key, block))
+        diff = _apply_blocks(self.reversed_index, blocks, self._block_sizes)
+        return self.result(), diff
@@ -3,6 +3,7 @@ from typing import Any, Dict, List, Sequence, Optional, Union, cast
 import logging
 from pydantic.tools import parse_obj_as
 
+from blocklib.compact import CompactReversedIndex
 from blocklib.configuration import get_config
 from blocklib.utils import check_header
 from blocklib.validation import PPRLIndexConfig
@@ -45,11 +46,12 @@ class PPRLIndex:
         else:
             self.blocking_features_index = blocking_features
 
-    def build_reversed_index(self, data: Sequence[Sequence],  header: Optional[List[str]] = None):
+    def build_reversed_index(self, data: Sequence[Sequence],  header: Optional[List[str]] = None, n_jobs: int = 1):
         """Method which builds the index for all database.
 
            :param data: list of tuples, PII dataset
            :param header: file header, optional
+           :param n_jobs: number of processes to use, -1 for one per CPU
            :rtype: ReversedIndexResult
            See derived classes for actual implementations.
         """
@@ -76,7 +78,7 @@ class PPRLIndex:
 
 class ReversedIndexResult(object):
 
-    def __init__(self, reversed_index: Dict, stats: Dict):
+    def __init__(self, reversed_index: Union[Dict, CompactReversedIndex], stats: Dict):
         self.reversed_index = reversed_index
         self.stats = stats
 
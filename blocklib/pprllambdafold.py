@@ -3,12 +3,19 @@ import random
 from collections import defaultdict
 from typing import Dict, Sequence, Any, List, Optional, Union, cast
 
+import numpy as np
+
 from .pprlindex import PPRLIndex, ReversedIndexResult
-from .encoding import generate_bloom_filter
-from .utils import deserialize_filters
+from .profiling import StageProfiler, profile_stage
+from .encoding import generate_bloom_filter, generate_bloom_filters
+from .utils import deserialize_bitarray, deserialize_filters_packed, group_by_first_occurrence, \
+    map_shards, packed_bits, resolve_n_jobs, shard_bounds
 from .stats import reversed_index_stats
 from .validation import LambdaConfig
 
+# number of records whose bloom filters are generated at once when encoding PII
+ENCODING_BATCH_SIZE = 10000
+
 
 class PPRLIndexLambdaFold(PPRLIndex):
     """Class that implements the PPRL indexing technique:
@@ -38,50 +45,128 @@ class PPRLIndexLambdaFold(PPRLIndex):
         self.input_clks = config.block_encodings
         self.random_state = config.random_state
         self.record_id_col = config.record_id_column
+        # the K bloom filter positions of each of the Lambda tables, sampled on the first build if not configured
+        self.sampled_positions = config.sampled_positions  # type: Optional[List[List[int]]]
 
     def __record_to_bf__(self, record: Sequence, blocking_features_index: List[int]):
         """Convert a record to list of bigrams and then map to a bloom filter."""
-        s = ''.join([record[i] for i in blocking_features_index])
-        # generate list of bigram of s. hash each bigram to position of bit 1 and flip bloom filter
-        ngram = 2
-        grams = [s[i: i + ngram] for i in range(len(s) - ngram + 1)]
+        grams = self.__record_to_bigrams__(record, blocking_features_index)
         bloom_filter = generate_bloom_filter(grams, self.bf_len, self.num_hash_function)
         return bloom_filter
 
-    def build_reversed_index(self, data: Sequence[Any], header: Optional[List[str]] = None):
+    @staticmethod
+    def __record_to_bigrams__(record: Sequence, blocking_features_index: List[int]) -> List[str]:
+        """Concatenate the blocking features of a record and return the list of its bigrams."""
+        s = ''.join([record[i] for i in blocking_features_index])
+        ngram = 2
+        return [s[i: i + ngram] for i in range(len(s) - ngram + 1)]
+
+    def build_reversed_index(self, data: Sequence[Any], header: Optional[List[str]] = None, n_jobs: int = 1,
+                             profiler: Optional[StageProfiler] = None, detailed_stats: bool = False):
         """Build inverted index for PPRL Lambda-fold blocking method.
 
         :param data: list of lists
         :param header: file header, optional
+        :param n_jobs: number of processes building the Lambda tables, -1 for one per CPU.
+            Every process builds the tables for a contiguous shard of the records and the shards
+            are merged in order, so the result is the same as with a single process.
+        :param profiler: optional StageProfiler recording the stages 'header_mapping', 'lambda_tables'
+            (encoding and grouping the records) and 'stats'
+        :param detailed_stats: add block size percentiles, a histogram and the sum of squared block sizes
+            to the statistics, see `blocklib.stats.block_size_stats`
         :return: reversed index as ReversedIndexResult
         """
-        feature_to_index = self.get_feature_to_index_map(data, header)
-        self.set_blocking_features_index(self.blocking_features, feature_to_index)
-
-        # create record index lists
-        if self.record_id_col is None:
-            record_ids = list(range(len(data)))
-        else:
-            record_ids = [x[self.record_id_col] for x in data]
-
-        random.seed(self.random_state)
-
+        with profile_stage(profiler, 'header_mapping'):
+            feature_to_index = self.get_feature_to_index_map(data, header)
+            self.set_blocking_features_index(self.blocking_features, feature_to_index)
+
+            # create record index lists
+            if self.record_id_col is None:
+                record_ids = list(range(len(data)))
+            else:
+                record_ids = [x[self.record_id_col] for x in data]
+
+        with profile_stage(profiler, 'lambda_tables'):
+            sampled_indices = self._sample_indices(data)
+
+            n_jobs = resolve_n_jobs(n_jobs)
+            if n_jobs == 1:
+                lambda_tables = self._lambda_tables(data, record_ids, sampled_indices)
+            else:
+                shards = [(data[start:stop], record_ids[start:stop], sampled_indices)
+                          for start, stop in shard_bounds(len(data), n_jobs)]
+                shard_tables = map_shards(self._lambda_tables, shards, n_jobs)
+                lambda_tables = [defaultdict(list) for _ in range(self.mylambda)]
+                for tables in shard_tables:
+                    for merged_table, table in zip(lambda_tables, tables):
+                        for block_key, rec_ids in table.items():
+                            merged_table[block_key].extend(rec_ids)
+
+            # add the Lambda fold tables to the invert index
+            invert_index = {}  # type: Dict[Any, List[Any]]
+            for lambda_table in lambda_tables:
+                invert_index.update(lambda_table)
+
+        with profile_stage(profiler, 'stats'):
+            stats = reversed_index_stats(invert_index, detailed_stats)
+        return ReversedIndexResult(invert_index, stats)
+
+    def _sample_indices(self, data: Sequence[Any]) -> List[List[int]]:
+        """Return the K indices from [0, bf-len] of each of the Lambda tables.
+
+        The indices are sampled with random_state on first use and stored in `sampled_positions` and
+        the config, so later builds (or a state created from the saved config) use the same positions.
+        """
         if self.input_clks:
-            clks = deserialize_filters(data)
+            bf_len = len(deserialize_bitarray(data[0]))
         else:
-            clks = [self.__record_to_bf__(rec, self.blocking_features_index) for rec in data]
-        bf_len = len(clks[0])
-
-        # build Lambda fold tables and add to the invert index
-        invert_index = {}  # type: Dict[Any, List[Any]]
-        for i in range(self.mylambda):
-            lambda_table = defaultdict(list)  # type: Dict[Any, Any]
-            # sample K indices from [0, bf-len]
-            indices = random.sample(range(bf_len), self.K)
-            for rec_id, clk in zip(record_ids, clks):
-                block_key = ''.join(['1' if clk[ind] else '0' for ind in indices])
-                lambda_table['{}{}'.format(i, block_key)].append(rec_id)
-            invert_index.update(lambda_table)
-
-        return ReversedIndexResult(invert_index, reversed_index_stats(invert_index))
-
+            bf_len = self.bf_len
+
+        if self.sampled_positions is None:
+            random.seed(self.random_state)
+            self.sampled_positions = [random.sample(range(bf_len), self.K) for _ in range(self.mylambda)]
+            self.config.sampled_positions = self.sampled_positions  # type: ignore
+        elif any(p >= bf_len for positions in self.sampled_positions for p in positions):
+            raise ValueError('Sampled positions exceed the bloom filter length {}'.format(bf_len))
+        return self.sampled_positions
+
+    def _encode_packed(self, data: Sequence[Any]) -> np.ndarray:
+        """Encode records (or deserialize CLKs) into a packed 2-D uint8 array, one row per record."""
+        if self.input_clks:
+            packed, _ = deserialize_filters_packed(data)
+            return packed
+        # hash bigrams in batches of records, every distinct bigram of a batch is hashed once
+        packed = np.empty((len(data), (self.bf_len + 7) // 8), dtype=np.uint8)
+        bloom_filters = np.empty((min(len(data), ENCODING_BATCH_SIZE), self.bf_len), dtype=bool)
+        for start in range(0, len(data), ENCODING_BATCH_SIZE):
+            batch = data[start:start + ENCODING_BATCH_SIZE]
+            batch_filters = bloom_filters[:len(batch)]
+            batch_filters[:] = False
+            grams = [self.__record_to_bigrams__(rec, self.blocking_features_index) for rec in batch]
+            generate_bloom_filters(grams, self.bf_len, self.num_hash_function, out=batch_filters)
+            packed[start:start + len(batch)] = np.packbits(batch_filters, axis=1)
+        return packed
+
+    def _lambda_tables(self, data: Sequence[Any], record_ids: Sequence[Any],
+                       sampled_indices: List[List[int]]) -> List[Dict[str, List[Any]]]:
+        """Build the Lambda tables {block key -> record ids} for the given records."""
+        packed = self._encode_packed(data)
+        rec_ids = np.empty(len(record_ids), dtype=object)
+        rec_ids[:] = record_ids
+
+        lambda_tables = []
+        for i, indices in enumerate(sampled_indices):
+            # the K sampled bits of every record, and the bits packed into bytes to group records by key
+            bits = packed_bits(packed, indices)
+            packed_bytes = np.ascontiguousarray(np.packbits(bits, axis=1))
+            packed_keys = packed_bytes.view(np.dtype((np.void, packed_bytes.shape[1]))).ravel()
+            first, order, offsets = group_by_first_occurrence(packed_keys)
+
+            # block key is the table number followed by the sampled bits as '0'/'1' characters
+            key_chars = np.ascontiguousarray(bits[first] + ord('0')).view('S{}'.format(len(indices))).ravel()
+            grouped_ids = rec_ids[order].tolist()
+            lambda_tables.append({
+                '{}{}'.format(i, key.decode()): grouped_ids[offsets[g]:offsets[g + 1]]
+                for g, key in enumerate(key_chars.tolist())
+            })
+        return lambda_tables
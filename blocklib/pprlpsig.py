@@ -1,12 +1,15 @@
 import logging
-from collections import defaultdict
-from typing import Dict, List, Sequence, Any, Optional, Union, cast
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Any, Optional, Set, Tuple, Union, cast
 
-from .encoding import flip_bloom_filter
+from .columnar import ColumnarData, build_signature_index_columnar, is_columnar
+from .encoding import bloom_filter_keys, flip_bloom_filters
 from .pprlindex import PPRLIndex, ReversedIndexResult
-from .signature_generator import generate_signatures
+from .profiling import StageProfiler, profile_stage
+from .signature_generator import compile_signature_strategies
 from .stats import reversed_index_per_strategy_stats, reversed_index_stats
-from .validation import PSigConfig
+from .utils import map_shards, resolve_n_jobs, shard_bounds
+from .validation import PSigConfig, PSigSignatureModel
 
 
 class PPRLIndexPSignature(PPRLIndex):
@@ -37,35 +40,109 @@ class PPRLIndexPSignature(PPRLIndex):
         self.rec_id_col = config.record_id_column
         self.null_sentinel = config.null_sentinel
 
-    def build_reversed_index(self, data: Sequence[Sequence], header: Optional[List[str]] = None):
+    def build_reversed_index(self, data: Sequence[Sequence], header: Optional[List[str]] = None, n_jobs: int = 1,
+                             two_pass: bool = False, profiler: Optional[StageProfiler] = None,
+                             detailed_stats: bool = False):
         """Build inverted index given P-Sig method.
 
+        :param data: list of tuples, or columnar data (see `build_reversed_index_columnar`)
+        :param header: file header, optional. Ignored for columnar data.
+        :param n_jobs: number of processes generating signatures, -1 for one per CPU.
+            The data is split into contiguous shards whose indices are merged in order,
+            so the result is the same as with a single process. Ignored for columnar data.
+        :param two_pass: count the signatures in a first pass and only collect the record ids of
+            signatures that pass the filter in a second pass. The signatures are generated twice, but
+            the record ids of blocks that are filtered out, e.g. very common signatures, are never stored.
+            The result is the same.
+        :param profiler: optional StageProfiler recording the stages 'header_mapping', 'signature_generation'
+            (including the counting pass), 'filter', 'strategy_stats', 'bloom_filter_keys' and 'stats'
+        :param detailed_stats: add block size percentiles, a histogram and the sum of squared block sizes
+            to the statistics of the index and of every strategy, see `blocklib.stats.block_size_stats`
         """
-        feature_to_index = self.get_feature_to_index_map(data, header)
-        self.set_blocking_features_index(self.blocking_features, feature_to_index)
+        if is_columnar(data):
+            return self.build_reversed_index_columnar(data, two_pass=two_pass, profiler=profiler,
+                                                      detailed_stats=detailed_stats)
 
-        # Build index of records
-        if self.rec_id_col is None:
-            record_ids = list(range(len(data)))
-        else:
-            record_ids = [x[self.rec_id_col] for x in data]
+        with profile_stage(profiler, 'header_mapping'):
+            feature_to_index = self.get_feature_to_index_map(data, header)
+            self.set_blocking_features_index(self.blocking_features, feature_to_index)
 
-        reversed_index_per_strategy = \
-            [defaultdict(list) for _ in range(len(self.signature_strategies))]  # type: List[Dict[str, List[Any]]]
-        # Build inverted index
-        # {signature -> record ids}
-        for rec_id, dtuple in zip(record_ids, data):
+            # Build index of records
+            if self.rec_id_col is None:
+                record_ids = list(range(len(data)))
+            else:
+                record_ids = [x[self.rec_id_col] for x in data]
 
-            signatures = generate_signatures(self.signature_strategies, dtuple, self.null_sentinel, feature_to_index)
+        with profile_stage(profiler, 'signature_generation'):
+            n_jobs = resolve_n_jobs(n_jobs)
+            bounds = shard_bounds(len(data), n_jobs)
+            keep = None  # type: Optional[List[Set[str]]]
+            if two_pass:
+                # first pass: only count the signatures, to find those that pass the filter
+                if n_jobs == 1:
+                    counts = _signature_counts(self.signature_strategies, self.null_sentinel, feature_to_index, data)
+                else:
+                    count_shards = [(self.signature_strategies, self.null_sentinel, feature_to_index,
+                                     data[start:stop]) for start, stop in bounds]
+                    counts = merge_signature_counts(map_shards(_signature_counts, count_shards, n_jobs))
+                min_size, max_size = self._block_size_bounds(len(data))
+                keep = [{signature for signature, count in strategy_counts.items() if max_size >= count >= min_size}
+                        for strategy_counts in counts]
 
-            for strategy_index, signature in signatures:
-                reversed_index_per_strategy[strategy_index][signature].append(rec_id)
+            if n_jobs == 1:
+                reversed_index_per_strategy = _signature_index(self.signature_strategies, self.null_sentinel,
+                                                               feature_to_index, data, record_ids, keep)
+            else:
+                shards = [(self.signature_strategies, self.null_sentinel, feature_to_index,
+                           data[start:stop], record_ids[start:stop], keep) for start, stop in bounds]
+                reversed_index_per_strategy = merge_signature_indices(map_shards(_signature_index, shards, n_jobs))
+
+        return self._build_from_signature_index(reversed_index_per_strategy, len(data), profiler, detailed_stats)
+
+    def build_reversed_index_columnar(self, data: Any, two_pass: bool = False,
+                                      profiler: Optional[StageProfiler] = None, detailed_stats: bool = False):
+        """Build inverted index given P-Sig method from columnar data.
+
+        Signatures are computed once per distinct value of a column and the records are grouped
+        by signature with NumPy, which avoids converting the data into a list of tuples first.
+        The result is the same as for `build_reversed_index` on the rows.
 
-        reversed_index_per_strategy = [self.filter_reversed_index(data, reversed_index) for reversed_index in
-                                       reversed_index_per_strategy]
-        # somehow the reversed_index of the first strategy gets overwritten in the next step. Thus, we generate the
-        # statistics of the different strategies first.
-        strategy_stats = reversed_index_per_strategy_stats(reversed_index_per_strategy, len(data))
+        :param data: pandas DataFrame, pyarrow Table or dict mapping column names to arrays.
+            Features given by name are looked up in the column names.
+        :param two_pass: drop the signatures that don't pass the filter before grouping the records,
+            see `build_reversed_index`
+        :param profiler: optional StageProfiler, see `build_reversed_index`
+        :param detailed_stats: add detailed block size statistics, see `build_reversed_index`
+        :rtype: ReversedIndexResult
+        """
+        with profile_stage(profiler, 'header_mapping'):
+            columns = ColumnarData(data)
+            self.set_blocking_features_index(self.blocking_features, self.get_columnar_feature_to_index_map(columns))
+
+        with profile_stage(profiler, 'signature_generation'):
+            reversed_index_per_strategy, num_records = build_signature_index_columnar(
+                self.signature_strategies, columns, self.null_sentinel, self.rec_id_col,
+                size_bounds=self._block_size_bounds if two_pass else None)
+        return self._build_from_signature_index(reversed_index_per_strategy, num_records, profiler, detailed_stats)
+
+    def get_columnar_feature_to_index_map(self, columns: ColumnarData) -> Optional[Dict[str, int]]:
+        """Return feature name to column index mapping of columnar data if features are given by name."""
+        if type(self.blocking_features[0]) == str:
+            return columns.feature_to_index()
+        return None
+
+    def _build_from_signature_index(self, reversed_index_per_strategy: List[Dict[str, List[Any]]],
+                                    num_records: int, profiler: Optional[StageProfiler] = None,
+                                    detailed_stats: bool = False):
+        """Filter the {signature -> record ids} index of every strategy and map signatures into bloom filters."""
+        with profile_stage(profiler, 'filter'):
+            reversed_index_per_strategy = [self._filter_reversed_index(num_records, reversed_index)
+                                           for reversed_index in reversed_index_per_strategy]
+        with profile_stage(profiler, 'strategy_stats'):
+            # somehow the reversed_index of the first strategy gets overwritten in the next step. Thus, we generate
+            # the statistics of the different strategies first.
+            strategy_stats = reversed_index_per_strategy_stats(reversed_index_per_strategy, num_records,
+                                                               detailed_stats)
         # combine the reversed indices into one
         filtered_reversed_index = reversed_index_per_strategy[0]
         for rev_idx in reversed_index_per_strategy[1:]:
@@ -80,7 +157,7 @@ class PPRLIndexPSignature(PPRLIndex):
         for recids in filtered_reversed_index.values():
             for rid in recids:
                 entities.add(rid)
-        coverage = len(entities) / len(record_ids)
+        coverage = len(entities) / num_records
         if coverage < 1:
             logging.warning(
                 f'The P-Sig configuration leads to incomplete coverage ({round(coverage * 100, 2)}%)!\n'
@@ -92,36 +169,97 @@ class PPRLIndexPSignature(PPRLIndex):
         num_hash_func = self.blocking_config.number_of_hash_functions
         bf_len = self.blocking_config.bloom_filter_length
 
-        reversed_index = {}  # type: Dict[str, List[Any]]
+        reversed_index = {}  # type: Dict[bytes, List[Any]]
 
-        for signature, rec_ids in filtered_reversed_index.items():
-            bf_set = str(tuple(flip_bloom_filter(signature, bf_len, num_hash_func)))
-            if bf_set in reversed_index:
-                reversed_index[bf_set].extend(rec_ids)
-            else:
-                reversed_index[bf_set] = rec_ids
+        with profile_stage(profiler, 'bloom_filter_keys'):
+            signatures = list(filtered_reversed_index)
+            bf_keys = bloom_filter_keys(flip_bloom_filters(signatures, bf_len, num_hash_func))
+            for signature, bf_set in zip(signatures, bf_keys):
+                rec_ids = filtered_reversed_index[signature]
+                if bf_set in reversed_index:
+                    reversed_index[bf_set].extend(rec_ids)
+                else:
+                    reversed_index[bf_set] = rec_ids
 
         # create some statistics around the blocking results
-        stats = reversed_index_stats(reversed_index)
+        with profile_stage(profiler, 'stats'):
+            stats = reversed_index_stats(reversed_index, detailed_stats)
         stats['statistics_per_strategy'] = strategy_stats
         stats['coverage'] = coverage
         return ReversedIndexResult(reversed_index, stats)
 
     def filter_reversed_index(self, data: Sequence[Sequence], reversed_index: Dict):
         # Filter inverted index based on ratio
-        n = len(data)
+        return self._filter_reversed_index(len(data), reversed_index)
 
+    def _filter_reversed_index(self, n: int, reversed_index: Dict):
         # filter blocks based on filter type
+        min_size, max_size = self._block_size_bounds(n)
+        return {k: v for k, v in reversed_index.items() if max_size >= len(v) >= min_size}
+
+    def _block_size_bounds(self, n: int) -> Tuple[float, float]:
+        """Inclusive bounds on the size of blocks that pass the filter, given the number of records n."""
         filter_type = self.filter_config.type
         if filter_type == "ratio":
             min_occur_ratio = self.filter_config.min
             max_occur_ratio = self.filter_config.max
-            reversed_index = {k: v for k, v in reversed_index.items() if n * max_occur_ratio >= len(v) >= n * min_occur_ratio}
+            return n * min_occur_ratio, n * max_occur_ratio
         elif filter_type == "count":
             min_occur_count = self.filter_config.min
             max_occur_count = self.filter_config.max
-            reversed_index = {k: v for k, v in reversed_index.items() if max_occur_count >= len(v) >= min_occur_count}
+            return min_occur_count, max_occur_count
         else:
             raise NotImplementedError("Don't support {} filter yet.".format(filter_type))
 
-        return reversed_index
+
+def _signature_index(signature_strategies: List[PSigSignatureModel], null_sentinel: Any,
+                     feature_to_index: Optional[Dict[str, int]], data: Sequence[Sequence],
+                     record_ids: Sequence[Any], keep: Optional[List[Set[str]]] = None) -> List[Dict[str, List[Any]]]:
+    """Build the unfiltered {signature -> record ids} index of every strategy.
+
+    :param keep: optional set of signatures per strategy, the record ids of other signatures are not collected
+    """
+    reversed_index_per_strategy = \
+        [defaultdict(list) for _ in range(len(signature_strategies))]  # type: List[Dict[str, List[Any]]]
+    generate_signatures = compile_signature_strategies(signature_strategies, null_sentinel, feature_to_index)
+    # Build inverted index
+    # {signature -> record ids}
+    for rec_id, dtuple in zip(record_ids, data):
+
+        signatures = generate_signatures(dtuple)
+
+        for strategy_index, signature in signatures:
+            if keep is None or signature in keep[strategy_index]:
+                reversed_index_per_strategy[strategy_index][signature].append(rec_id)
+
+    return reversed_index_per_strategy
+
+
+def _signature_counts(signature_strategies: List[PSigSignatureModel], null_sentinel: Any,
+                      feature_to_index: Optional[Dict[str, int]], data: Sequence[Sequence]) -> List[Counter]:
+    """Count the records of every signature of every strategy."""
+    counts = [Counter() for _ in range(len(signature_strategies))]  # type: List[Counter]
+    generate_signatures = compile_signature_strategies(signature_strategies, null_sentinel, feature_to_index)
+    for dtuple in data:
+        for strategy_index, signature in generate_signatures(dtuple):
+            counts[strategy_index][signature] += 1
+    return counts
+
+
+def merge_signature_counts(shard_counts: Sequence[List[Counter]]) -> List[Counter]:
+    """Sum the per strategy signature counts of several shards."""
+    merged = [Counter() for _ in range(len(shard_counts[0]))]  # type: List[Counter]
+    for counts in shard_counts:
+        for merged_counts, strategy_counts in zip(merged, counts):
+            merged_counts.update(strategy_counts)
+    return merged
+
+
+def merge_signature_indices(shard_indices: Sequence[List[Dict[str, List[Any]]]]) -> List[Dict[str, List[Any]]]:
+    """Merge per strategy signature indices of consecutive shards, keeping the order of the records."""
+    merged = [defaultdict(list) for _ in range(len(shard_indices[0]))]  # type: List[Dict[str, List[Any]]]
+    for shard_index in shard_indices:
+        for merged_index, reversed_index in zip(merged, shard_index):
+            for signature, rec_ids in reversed_index.items():
+                merged_index[signature].extend(rec_ids)
+    return merged
@@ -0,0 +1,91 @@
+"""Opt-in timing and memory instrumentation of the blocking stages."""
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Union
+
+
+class StageProfiler:
+    """Record the wall time, CPU time and peak allocated memory of named stages.
+
+    Use `stage` as a context manager around every stage. Stages should not be nested, as the
+    memory peak of the inner stage resets the one of the outer stage.
+
+    The memory is the peak of the memory allocated by Python (including NumPy arrays) during the
+    stage, above the memory allocated when the stage started, as traced by `tracemalloc`. Tracing
+    slows down allocation heavy code considerably, it can be switched off with trace_memory=False.
+    """
+
+    def __init__(self, trace_memory: bool = True,
+                 callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 log_level: Optional[int] = None):
+        """
+        :param trace_memory: record the peak allocated memory of every stage with tracemalloc
+        :param callback: optional function called with the record of every stage when it ends
+        :param log_level: optional logging level to log every stage with, e.g. logging.INFO
+        """
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.log_level = log_level
+        self.records = []  # type: List[Dict[str, Any]]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Profile the code in the with block as stage name."""
+        started_tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            # Python < 3.9 can't reset the peak, it is then the peak since tracing started
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            start_memory, _ = tracemalloc.get_traced_memory()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record = {
+                'stage': name,
+                'wall_time': time.perf_counter() - start_wall,
+                'cpu_time': time.process_time() - start_cpu,
+                'peak_memory': None,
+            }  # type: Dict[str, Any]
+            if self.trace_memory:
+                _, peak_memory = tracemalloc.get_traced_memory()
+                record['peak_memory'] = peak_memory - start_memory
+            if started_tracing:
+                tracemalloc.stop()
+            self.add(record)
+
+    def add(self, record: Dict[str, Any]):
+        """Add the record of a stage and report it to the callback and the log."""
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+        if self.log_level is not None:
+            logging.log(self.log_level, format_stage(record))
+
+    def report(self) -> List[Dict[str, Any]]:
+        """The records of all stages so far, in order."""
+        return list(self.records)
+
+
+def format_stage(record: Dict[str, Any]) -> str:
+    """One line summary of a stage record."""
+    line = '{}: {:.4f}s wall, {:.4f}s CPU'.format(record['stage'], record['wall_time'], record['cpu_time'])
+    if record['peak_memory'] is not None:
+        line += ', {:.2f} MiB peak'.format(record['peak_memory'] / 2 ** 20)
+    return line
+
+
+def resolve_profiler(profile: Union[bool, StageProfiler, None]) -> Optional[StageProfiler]:
+    """Profiler for the profile argument of the public functions: True creates a StageProfiler."""
+    if isinstance(profile, StageProfiler):
+        return profile
+    return StageProfiler() if profile else None
+
+
+def profile_stage(profiler: Optional[StageProfiler], name: str) -> ContextManager:
+    """Context manager that profiles a stage if profiler is not None and does nothing otherwise."""
+    return nullcontext() if profiler is None else profiler.stage(name)
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Dict, List, Sequence, Optional, cast
+from typing import Any, Callable, Dict, List, Sequence, Optional, Tuple, Union, cast
 
 from metaphone import doublemetaphone
 
@@ -20,44 +20,61 @@ def generate_by_char_at(attr_ind: int, dtuple: Sequence, pos: List[Any]):
     >>> assert res == 'Litt'
 
     """
-    sig = []
-    feature = dtuple[attr_ind]
+    return _select_chars(dtuple[attr_ind], parse_char_at_pos(pos))
 
-    # missing value
-    if feature == "":
-        return None
 
-    max_ind = len(feature)
+def parse_char_at_pos(pos: List[Any]) -> List[Union[int, Tuple[Optional[int], Optional[int]]]]:
+    """Parse the ``pos`` config of a characters-at signature.
+
+    Each position becomes either an int (a single character) or a ``(start, end)`` tuple
+    where an open end is ``None``.
+
+    >>> parse_char_at_pos([0, '2', ':4', '-2:', '1:3'])
+    [0, 2, (None, 4), (-2, None), (1, 3)]
+
+    """
+    parsed = []  # type: List[Union[int, Tuple[Optional[int], Optional[int]]]]
     for p in pos:
         if type(p) == int:
-            p = min(p, max_ind - 1)
-            sig.append(feature[p])
+            parsed.append(p)
         elif ":" not in p:
-            p = int(p)
-            p = min(p, max_ind - 1)
-            sig.append(feature[p])
+            parsed.append(int(p))
         else:
-            start_ind, end_ind = p.split(":")
-            if start_ind != "" and end_ind != "":
-                start_ind = int(start_ind)
-                end_ind = int(end_ind)
+            start, end = p.split(":")
+            if start != "" and end != "":
+                start_ind, end_ind = int(start), int(end)
                 assert (
                     start_ind < end_ind
                 ), "Start index should be less than End index in {}".format(p)
-                start_ind = min(start_ind, max_ind - 1)
-                end_ind = min(end_ind, max_ind)
-                c = feature[start_ind:end_ind]
-            elif start_ind == "" and end_ind != "":
-                end_ind = int(end_ind)
-                end_ind = min(end_ind, max_ind)
-                c = feature[:end_ind]
-            elif start_ind != "" and end_ind == "":
-                start_ind = int(start_ind)
-                start_ind = min(start_ind, max_ind)
-                c = feature[start_ind:]
+                parsed.append((start_ind, end_ind))
+            elif start == "" and end != "":
+                parsed.append((None, int(end)))
+            elif start != "" and end == "":
+                parsed.append((int(start), None))
             else:
                 raise ValueError("Invalid pos argument: {}".format(p))
-            sig.append(c)
+    return parsed
+
+
+def _select_chars(feature: str, parsed_pos: List[Union[int, Tuple[Optional[int], Optional[int]]]]):
+    """Apply positions from `parse_char_at_pos` to one feature value."""
+    # missing value
+    if feature == "":
+        return None
+
+    sig = []
+    max_ind = len(feature)
+    for p in parsed_pos:
+        if type(p) == int:
+            sig.append(feature[min(cast(int, p), max_ind - 1)])
+        else:
+            start_ind, end_ind = cast(Tuple[Optional[int], Optional[int]], p)
+            if start_ind is None:
+                sig.append(feature[:min(cast(int, end_ind), max_ind)])
+            elif end_ind is None:
+                sig.append(feature[min(start_ind, max_ind):])
+            else:
+                sig.append(feature[min(start_ind, max_ind - 1):min(end_ind, max_ind)])
 
     return "".join(sig)
 
@@ -85,6 +102,94 @@ SIGNATURE_STRATEGIES = {
 }  # type: Dict[str, Callable[..., str]]
 
 
+def _metaphone(feature: str):
+    return "".join(doublemetaphone(feature))
+
+
+def _compile_spec(spec) -> Optional[Callable[[str], Optional[str]]]:
+    """Bind a signature spec to a function of the (stringified) feature value.
+
+    Returns None for feature-value as the feature value itself is the signature.
+    """
+    if spec.type == "feature-value":
+        return None
+    elif spec.type in ("characters-at", "characters_at"):
+        parsed_pos = parse_char_at_pos(cast(PSigCharsAtSignatureSpec, spec).config.pos)
+        return lambda feature: _select_chars(feature, parsed_pos)
+    elif spec.type == "metaphone":
+        return _metaphone
+    elif spec.type in SIGNATURE_STRATEGIES:
+        # strategy added to SIGNATURE_STRATEGIES without a compiled counterpart
+        func = SIGNATURE_STRATEGIES[spec.type]
+        args = dict(getattr(spec, "config", {}))
+        return lambda feature: func(attr_ind=0, dtuple=(feature,), **args)
+    else:
+        raise NotImplementedError(f"Strategy {spec.type} is not implemented yet!")
+
+
+def _resolve_feature_index(feature: Union[int, str], feature_to_index: Optional[Dict[str, int]]) -> int:
+    if type(feature) == str:
+        assert feature_to_index, "Missing information to map from feature name to index"
+        attr_ind = feature_to_index.get(cast(str, feature), None)
+        if attr_ind is None:
+            raise ValueError(f"Feature {feature} is not in the dataset")
+        return attr_ind
+    return cast(int, feature)
+
+
+def compile_signature_strategies(
+    signature_strategies: List[PSigSignatureModel],
+    null_sentinel: Any,
+    feature_to_index: Optional[Dict[str, int]] = None,
+) -> Callable[[Sequence], List[Tuple[int, str]]]:
+    """Compile signature strategies into a function that generates the signatures of one record.
+
+    Feature names are resolved to column indices, strategy functions are looked up and
+    characters-at positions are parsed once, so that the returned function only does the
+    per record work.
+
+    :param signature_strategies:
+        A list of PSigSignatureModel instances each describing a strategy to generate signatures.
+
+    :param null_sentinel:
+        String that represents the NULL value in the dataset
+
+    :param feature_to_index:
+        Mapping from feature name to feature index
+
+    :return: function mapping a record to a list of tuples (strategy_index, signature)
+    """
+    plan = []
+    columns = []  # type: List[int]
+    for i, strategy in enumerate(signature_strategies):
+        specs = []
+        for spec in strategy:
+            attr_ind = _resolve_feature_index(spec.feature, feature_to_index)
+            if attr_ind not in columns:
+                columns.append(attr_ind)
+            specs.append((attr_ind, columns.index(attr_ind), _compile_spec(spec)))
+        plan.append((i, "{}_".format(i), specs))
+    null_is_none = null_sentinel is None
+
+    def generate(dtuple: Sequence) -> List[Tuple[int, str]]:
+        # only the referenced columns are converted to strings, once per record
+        text = [v if type(v) is str else str(v) for v in [dtuple[c] for c in columns]]
+        signatures = []
+        for i, prefix, specs in plan:
+            sig = []  # type: List[Optional[str]]
+            for attr_ind, slot, func in specs:
+                value = dtuple[attr_ind]
+                if value is None if null_is_none else value == null_sentinel:
+                    sig = []
+                    break
+                sig.append(text[slot] if func is None else func(text[slot]))
+            if len(sig) > 0:
+                signatures.append((i, prefix + "_".join([x for x in sig if x is not None])))
+        return signatures
+
+    return generate
+
+
 def generate_signatures(
     signature_strategies: List[PSigSignatureModel],
     dtuple: Sequence,
@@ -93,6 +198,9 @@ def generate_signatures(
 ):
     """Generate signatures for one record.
 
+    To generate signatures for many records, compile the strategies once with
+    `compile_signature_strategies` instead.
+
     :param signature_strategies:
         A list of PSigSignatureModel instances each describing a strategy to generate signatures.
 
@@ -107,52 +215,4 @@ def generate_signatures(
 
     :return signatures: list of tuples (strategy_index, signature)
     """
-    # signatures to return
-    signatures = []
-
-    # loop through each strategy
-
-    for i, strategy in enumerate(signature_strategies):
-        sig: List = []
-        for spec in strategy:
-            # arguments that we need to pass for any strategy
-            attr = spec.feature
-            if type(attr) == str:
-                attr_name: str = cast(str, attr)
-                assert (
-                    feature_to_index
-                ), "Missing information to map from feature name to index"
-                attr_ind = feature_to_index.get(attr_name, None)
-                if attr_ind is None:
-                    raise ValueError(f"Feature {attr} is not in the dataset")
-            else:
-                attr_ind = cast(int, attr)
-
-            if (
-                dtuple[attr_ind] is null_sentinel
-                if null_sentinel is None
-                else dtuple[attr_ind] == null_sentinel
-            ):
-                sig = []
-                break
-            args = dict(attr_ind=attr_ind, dtuple=[str(x) for x in dtuple])
-
-            # find the correct strategy function to call
-            func = SIGNATURE_STRATEGIES.get(spec.type, None)
-
-            if func is None:
-                raise NotImplementedError(
-                    f"Strategy {spec.type} is not implemented yet!"
-                )
-            else:
-                if hasattr(spec, "config"):
-                    # For now that means it must be a PSigCharsAtSignatureSpec
-                    args.update(cast(PSigCharsAtSignatureSpec, spec).config)
-                s = func(**args)
-                sig.append(s)
-        if len(sig) > 0:
-            signatures.append(
-                (i, "{}_{}".format(i, "_".join([x for x in sig if x is not None])))
-            )
-
-    return signatures
+    return compile_signature_strategies(signature_strategies, null_sentinel, feature_to_index)(dtuple)
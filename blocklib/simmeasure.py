@@ -1,8 +1,23 @@
 """Similarity Measure Algorithms."""
 from blocklib.configuration import get_config
+from blocklib.utils import CacheInfo, LRUCache, resolve_n_jobs
 import logging
 from abc import ABC
-from typing import Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import blake2b
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# maximum length of the shorter string for the NumPy bit-parallel edit distance, one uint64 word
+WORD_SIZE = 64
+# number of pairs whose edit distance is computed at once in `EditSim.sim_many`
+EDIT_BATCH_SIZE = 4096
+# default maximum number of strings and pairs in the caches of DiceSim
+Q_GRAM_CACHE_SIZE = 2 ** 16
+SIM_CACHE_SIZE = 2 ** 18
+# number of pairs scored at once by `DiceSim.sim_pairs`
+DICE_BATCH_SIZE = 2 ** 16
 
 
 class SimMeasure(ABC):
@@ -16,6 +31,10 @@ class SimMeasure(ABC):
            If this similarity should be cached set the argument cache to True.
         """
 
+    def sim_many(self, pairs: Sequence[Tuple[str, str]], cache: bool = False) -> np.ndarray:
+        """Return the similarities of many string pairs as float64 array."""
+        return np.fromiter((self.sim(s1, s2, cache) for s1, s2 in pairs), dtype=np.float64, count=len(pairs))
+
 
 class EditSim(SimMeasure):
     """Class that implements Edit (or Levenshtein) distance for two strings."""
@@ -30,58 +49,211 @@ class EditSim(SimMeasure):
 
     def sim(self, str1: str, str2: str, cache: bool = False):
         """Return sim score between 0 to 1.
+
+        The edit distance is computed with the bit-parallel algorithm of Myers (as formulated by
+        Hyyrö), one Python integer bit per character of the shorter string.
+
+        With a min_threshold, pairs whose length difference alone gives a similarity below it score 0.0,
+        and pairs whose edit distance exceeds (1 - min_threshold) * max_len already before comparing all
+        characters score 1 - (max_dist + 1) / max_len, as with the row by row dynamic program.
         """
-        min_threshold = self.min_threshold
         # Quick check if the strings are empty or the same
         if (str1 == '') or (str2 == ''):
             return 0.0
         elif str1 == str2:
             return 1.0
 
-        n = len(str1)
-        m = len(str2)
-        max_len = max(n, m)
-
-        if min_threshold is not None:
-            if isinstance(min_threshold, float) and 0 <= min_threshold <= 1:
-
-                len_diff = abs(n - m)
-                w = 1.0 - float(len_diff) / float(max_len)
-
-                if w < min_threshold:
-                    return 0.0  # Similarity is smaller than minimum threshold
+        max_len = max(len(str1), len(str2))
+        max_dist = self._max_dist(len(str1), len(str2))
+        if max_dist is not None and max_dist < 0:
+            return 0.0  # Similarity is smaller than minimum threshold
 
-                else:  # Calculate the maximum distance possible with this threshold
-                    max_dist = (1.0 - min_threshold) * max_len
-
-            else:
-                msg = 'Illegal value for minimum threshold (not between 0 and 1): {}'.format(min_threshold)
-                raise ValueError(msg)
-
-        if n > m:  # Make sure n <= m, to use O(min(n,m)) space
+        if len(str1) > len(str2):  # the bits represent the shorter string
             str1, str2 = str2, str1
-            n, m = m, n
-
-        current = list(range(n + 1))
-
-        for i in range(1, m + 1):
-            previous = current
-            current = [i] + n * [0]
-            str2char = str2[i - 1]
+        dist, column = _bit_parallel_edit_distance(str1, str2)
 
-            for j in range(1, n + 1):
-                substitute = previous[j - 1]
-                if str1[j - 1] != str2char:
-                    substitute += 1
+        # The dynamic program stops early once the minimum of its row, which never decreases, exceeds
+        # max_dist. That is the case iff the minimum of the last row exceeds it.
+        if max_dist is not None and dist > max_dist and _min_prefix_sum(len(str2), *column) > max_dist:
+            return 1.0 - float(max_dist + 1) / float(max_len)
+        return 1.0 - float(dist) / float(max_len)
 
-                # Get minimum of insert, delete and substitute
-                current[j] = min(previous[j] + 1, current[j - 1] + 1, substitute)
+    def sim_many(self, pairs: Sequence[Tuple[str, str]], cache: bool = False) -> np.ndarray:
+        """Return the similarities of many string pairs as float64 array, the same values as `sim`.
 
-            if (min_threshold is not None) and (min(current) > max_dist):
-                return 1.0 - float(max_dist + 1) / float(max_len)
+        Pairs whose shorter string has at most 64 characters are processed in batches with the
+        bit-parallel algorithm on NumPy uint64 arrays, one pair per array element. Longer pairs fall
+        back to `sim`.
+        """
+        result = np.empty(len(pairs), dtype=np.float64)
+        batch = []  # type: List[int]
+        for i, (str1, str2) in enumerate(pairs):
+            if str1 == '' or str2 == '':
+                result[i] = 0.0
+            elif str1 == str2:
+                result[i] = 1.0
+            elif min(len(str1), len(str2)) > WORD_SIZE:
+                result[i] = self.sim(str1, str2)
+            else:
+                batch.append(i)
+        for start in range(0, len(batch), EDIT_BATCH_SIZE):
+            indices = batch[start:start + EDIT_BATCH_SIZE]
+            result[indices] = self._sim_batch([pairs[i] for i in indices])
+        return result
+
+    def _max_dist(self, n: int, m: int) -> Optional[float]:
+        """Maximum edit distance within min_threshold, negative if the length difference alone exceeds it."""
+        min_threshold = self.min_threshold
+        if min_threshold is None:
+            return None
+        self._check_min_threshold()
+        max_len = max(n, m)
+        w = 1.0 - float(abs(n - m)) / float(max_len)
+        if w < min_threshold:
+            return -1.0
+        # Calculate the maximum distance possible with this threshold
+        return (1.0 - min_threshold) * max_len
 
-        w = 1.0 - float(current[n]) / float(max_len)
-        return w
+    def _check_min_threshold(self) -> None:
+        min_threshold = self.min_threshold
+        if not (isinstance(min_threshold, float) and 0 <= min_threshold <= 1):
+            msg = 'Illegal value for minimum threshold (not between 0 and 1): {}'.format(min_threshold)
+            raise ValueError(msg)
+
+    def _sim_batch(self, pairs: List[Tuple[str, str]]) -> np.ndarray:
+        """Similarities of non-empty, unequal pairs whose shorter string has at most 64 characters."""
+        lengths = np.array([(len(s1), len(s2)) for s1, s2 in pairs], dtype=np.int64).reshape(-1, 2)
+        short_lengths, long_lengths = lengths.min(axis=1), lengths.max(axis=1)
+        max_lens = long_lengths.astype(np.float64)
+        sims = np.zeros(len(pairs), dtype=np.float64)
+
+        compare = np.ones(len(pairs), dtype=bool)
+        max_dists = None
+        if self.min_threshold is not None:
+            self._check_min_threshold()
+            w = 1.0 - (long_lengths - short_lengths).astype(np.float64) / max_lens
+            # Similarity is smaller than minimum threshold
+            compare = w >= self.min_threshold
+            max_dists = (1.0 - self.min_threshold) * max_lens
+        if not compare.any():
+            return sims
+
+        indices = np.flatnonzero(compare)
+        ordered = [(s1, s2) if len(s1) <= len(s2) else (s2, s1) for s1, s2 in (pairs[i] for i in indices)]
+        short_lengths, long_lengths, max_lens = short_lengths[indices], long_lengths[indices], max_lens[indices]
+        dists, vp, vn = _bit_parallel_edit_distances(ordered, short_lengths, long_lengths)
+        sims[indices] = 1.0 - dists / max_lens
+
+        if max_dists is not None:
+            max_dists = max_dists[indices]
+            over = dists > max_dists
+            if over.any():
+                # minimum of the last row, see `sim`
+                width = int(short_lengths[over].max())
+                bits = np.arange(width, dtype=np.uint64)
+                deltas = ((vp[over, None] >> bits) & 1).astype(np.int64) - ((vn[over, None] >> bits) & 1).astype(
+                    np.int64)
+                column = long_lengths[over, None] + np.cumsum(deltas, axis=1)
+                column[np.arange(width) >= short_lengths[over, None]] = np.iinfo(np.int64).max
+                column_min = np.minimum(column.min(axis=1), long_lengths[over])
+                early_exit = np.zeros(len(indices), dtype=bool)
+                early_exit[over] = column_min > max_dists[over]
+                sims[indices[early_exit]] = 1.0 - (max_dists[early_exit] + 1) / max_lens[early_exit]
+        return sims
+
+
+def _bit_parallel_edit_distance(pattern: str, text: str) -> Tuple[int, Tuple[int, int]]:
+    """Levenshtein distance of pattern and text with Python integers as bit vectors.
+
+    :return: (distance, (VP, VN)) where bit i of VP (VN) is set if the distance of text and
+        pattern[:i + 1] is one more (less) than the distance of text and pattern[:i]
+    """
+    n = len(pattern)
+    mask = (1 << n) - 1
+    top = 1 << (n - 1)
+    peq = {}  # type: Dict[str, int]
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+
+    vp, vn, dist = mask, 0, n
+    for char in text:
+        eq = peq.get(char, 0)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = vn | (~(xh | vp) & mask)
+        hn = vp & xh
+        if hp & top:
+            dist += 1
+        elif hn & top:
+            dist -= 1
+        # the distance to the empty pattern grows with the text, so a 1 is shifted in
+        hp = ((hp << 1) | 1) & mask
+        hn = (hn << 1) & mask
+        vp = hn | (~(xv | hp) & mask)
+        vn = hp & xv
+    return dist, (vp, vn)
+
+
+def _min_prefix_sum(start: int, vp: int, vn: int) -> int:
+    """Minimum of start and start plus the running sums of the +1 (vp) and -1 (vn) bits."""
+    value = minimum = start
+    while vp or vn:
+        value += (vp & 1) - (vn & 1)
+        minimum = min(minimum, value)
+        vp >>= 1
+        vn >>= 1
+    return minimum
+
+
+def _bit_parallel_edit_distances(pairs: List[Tuple[str, str]], short_lengths: np.ndarray,
+                                 long_lengths: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The bit-parallel edit distance of many (pattern, text) pairs with patterns of at most 64 characters.
+
+    :return: distances and the final VP and VN bit vectors of every pair, see `_bit_parallel_edit_distance`
+    """
+    num_pairs = len(pairs)
+    max_text = int(long_lengths.max())
+    width = int(short_lengths.max())
+    # character codes of the patterns and texts, padded with values that match nothing
+    patterns = np.full((num_pairs, width), -1, dtype=np.int64)
+    texts = np.full((num_pairs, max_text), -2, dtype=np.int64)
+    pattern_codes = _char_codes([s1 for s1, _ in pairs])
+    text_codes = _char_codes([s2 for _, s2 in pairs])
+    patterns[np.repeat(np.arange(num_pairs), short_lengths), _positions(short_lengths)] = pattern_codes
+    texts[np.repeat(np.arange(num_pairs), long_lengths), _positions(long_lengths)] = text_codes
+
+    one = np.uint64(1)
+    top = np.left_shift(one, (short_lengths - 1).astype(np.uint64))
+    mask = top | (top - one)
+    vp = mask.copy()
+    vn = np.zeros(num_pairs, dtype=np.uint64)
+    dist = short_lengths.copy()
+    weights = np.left_shift(one, np.arange(width, dtype=np.uint64))
+    for t in range(max_text):
+        active = t < long_lengths
+        # bit i of eq is set if pattern character i equals text character t
+        eq = np.bitwise_or.reduce(np.where(patterns == texts[:, t, None], weights, np.uint64(0)), axis=1)
+        xv = eq | vn
+        xh = (((eq & vp) + vp) ^ vp) | eq
+        hp = vn | (~(xh | vp) & mask)
+        hn = vp & xh
+        dist += active * (((hp & top) != 0).astype(np.int64) - (((hp & top) == 0) & ((hn & top) != 0)))
+        hp = ((hp << one) | one) & mask
+        hn = (hn << one) & mask
+        vp = np.where(active, hn | (~(xv | hp) & mask), vp)
+        vn = np.where(active, hp & xv, vn)
+    return dist, vp, vn
+
+
+def _char_codes(strings: List[str]) -> np.ndarray:
+    """Unicode code points of the concatenated strings."""
+    return np.frombuffer(''.join(strings).encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+
+
+def _positions(lengths: np.ndarray) -> np.ndarray:
+    """0, 1, ..., lengths[0] - 1, 0, 1, ..., lengths[1] - 1, ..."""
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(int(lengths.sum())) - np.repeat(offsets, lengths)
 
 
 class DiceSim(SimMeasure):
@@ -89,8 +261,10 @@ class DiceSim(SimMeasure):
        This methods uses the constants: ngram_len and ngram_padding (and if this
        constant is set to True also padding_start_char and self.padding_end_char).
 
-       If the argument cache is set to True then the generated q-gram lists
-       will be stored in a dictionary to prevent their repeated computation.
+       If the argument cache is set to True then the q-gram sets of the strings and the
+       similarities of the pairs are stored in LRU caches of at most q_gram_cache_size and
+       sim_cache_size (optional config) items, to prevent their repeated computation.
+       The caches can be shared by threads, see `cache_info` for their hit rates.
     """
 
     def __init__(self, config: Dict):
@@ -100,11 +274,11 @@ class DiceSim(SimMeasure):
         self.padding_start_char = get_config(config, 'padding_start_char')
         self.padding_end_char = get_config(config, 'padding_end_char')
 
-        # Store strings converted into q-grams. Keys in this will be strings and their values their q-gram list
-        self.q_gram_cache = {}  # type: Dict[str, List[str]]
+        # Store strings converted into q-grams. Keys are strings and values their q-gram set and number of q-grams
+        self.q_gram_cache = LRUCache(config.get('q_gram_cache_size', Q_GRAM_CACHE_SIZE))
 
-        # Store the string pair and its similarity in a cache as well
-        self.sim_cache = {}  # type: Dict[Tuple[str, str], float]
+        # Store the similarity of string pairs as well, keyed by the sorted pair
+        self.sim_cache = LRUCache(config.get('sim_cache_size', SIM_CACHE_SIZE))
 
     def sim(self, s1: str, s2: str, cache: bool = False):
         """Calculate the similarity between the given two strings. The method
@@ -116,39 +290,176 @@ class DiceSim(SimMeasure):
         if s1 == s2:  # Quick check for equality
             return 1.0
 
-        # Check if the string pair has been compared before
-        if (s1, s2) in self.sim_cache:
-            return self.sim_cache[(s1, s2)]
+        # Check if the string pair has been compared before, in either order
+        pair = (s1, s2) if s1 <= s2 else (s2, s1)
+        if cache:
+            sim = self.sim_cache.get(pair)
+            if sim is not None:
+                return sim
 
         q_minus_1 = self.ngram_len - 1
 
-        # Convert input strings into q-gram lists
-        l1 = self._convert_to_qgrams(s1, q_minus_1, cache)
-        l2 = self._convert_to_qgrams(s2, q_minus_1, cache)
+        # Convert input strings into q-gram sets
+        set1, len1 = self._convert_to_qgrams(s1, q_minus_1, cache)
+        set2, len2 = self._convert_to_qgrams(s2, q_minus_1, cache)
 
-        common = len(set(l1).intersection(set(l2)))
+        common = len(set1.intersection(set2))
 
-        sim = 2.0 * common / (len(l1) + len(l2))
+        sim = 2.0 * common / (len1 + len2)
 
         if cache:
-            self.sim_cache[(s1, s2)] = sim
+            self.sim_cache.put(pair, sim)
 
         return sim
 
-    def _convert_to_qgrams(self, inputstr: str, q_minus_1: int, cache: bool):
-        if cache and (inputstr in self.q_gram_cache):
-            qgrams = self.q_gram_cache[inputstr]
+    def cache_info(self) -> Dict[str, CacheInfo]:
+        """Hits, misses, evictions and sizes of the 'q_gram' and 'sim' caches."""
+        return {'q_gram': self.q_gram_cache.info(), 'sim': self.sim_cache.info()}
+
+    def _convert_to_qgrams(self, inputstr: str, q_minus_1: int, cache: bool) -> Tuple[FrozenSet[str], int]:
+        """The set of q-grams of a string and the number of its q-grams, including repeated ones."""
+        if cache:
+            cached = self.q_gram_cache.get(inputstr)
+            if cached is not None:
+                return cached
+
+        qgrams = self._qgrams(inputstr, q_minus_1)
+        result = (frozenset(qgrams), len(qgrams))
+        if cache:
+            self.q_gram_cache.put(inputstr, result)
+        return result
+
+    def encode(self, strings: Sequence[str]) -> 'QGramVectors':
+        """Encode strings as sparse vectors of their hashed q-grams, to score many pairs with `sim_pairs`.
 
+        Every distinct q-gram is hashed once to a 64 bit integer with blake2b.
+        """
+        q_minus_1 = self.ngram_len - 1
+        hashes = {}  # type: Dict[str, int]
+        row_hashes = []  # type: List[List[int]]
+        lengths = np.empty(len(strings), dtype=np.int64)
+        for i, string in enumerate(strings):
+            qgrams = self._qgrams(string, q_minus_1)
+            lengths[i] = len(qgrams)
+            row = []
+            for qgram in set(qgrams):
+                h = hashes.get(qgram)
+                if h is None:
+                    h = hashes[qgram] = int.from_bytes(blake2b(qgram.encode('utf-8'), digest_size=8).digest(), 'big')
+                row.append(h)
+            row.sort()
+            row_hashes.append(row)
+        sizes = np.fromiter(map(len, row_hashes), dtype=np.int64, count=len(row_hashes))
+        indptr = np.zeros(len(strings) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=indptr[1:])
+        values = np.fromiter((h for row in row_hashes for h in row), dtype=np.uint64, count=int(indptr[-1]))
+        return QGramVectors(list(strings), indptr, values, lengths)
+
+    def sim_pairs(self, vectors_a: 'QGramVectors', vectors_b: 'QGramVectors', rows_a: Sequence[int],
+                  rows_b: Sequence[int], n_jobs: int = 1) -> np.ndarray:
+        """Similarities of the strings vectors_a.strings[rows_a[i]] and vectors_b.strings[rows_b[i]] as float64 array.
+
+        The q-gram hashes are numbered 0, 1, ... in order, and the common q-grams of a batch of pairs are
+        counted by sorting the (pair, q-gram number) elements of both strings of every pair together, a
+        q-gram in both strings is then a repeated element. Without hash collisions the similarities are
+        the same as of `sim`. Pairs of different strings that both
+        have no q-grams score 0.0, where `sim` divides by zero.
+
+        :param vectors_a: strings encoded by `encode`
+        :param vectors_b: strings encoded by `encode`, vectors_a again to compare strings of one column
+        :param rows_a: positions in vectors_a of the first string of every pair
+        :param rows_b: positions in vectors_b of the second string of every pair
+        :param n_jobs: number of threads scoring batches of pairs, -1 for one per CPU
+        """
+        positions_a = np.asarray(rows_a, dtype=np.int64)
+        positions_b = np.asarray(rows_b, dtype=np.int64)
+        if positions_a.shape != positions_b.shape or positions_a.ndim != 1:
+            raise ValueError('Expected two 1-d arrays of rows of the same length, got shapes {} and {}'.format(
+                positions_a.shape, positions_b.shape))
+        n_jobs = resolve_n_jobs(n_jobs)
+        if vectors_b is vectors_a:
+            unique, codes = np.unique(vectors_a.hashes, return_inverse=True)
+            codes_a = codes_b = codes.astype(np.int64).ravel()
         else:
-            # Need to calculate q-gram list for the first string
-            if self.ngram_padding:
-                ps1 = self.padding_start_char * q_minus_1 + inputstr + self.padding_end_char * q_minus_1
-            else:
-                ps1 = inputstr
+            unique, codes = np.unique(np.concatenate([vectors_a.hashes, vectors_b.hashes]), return_inverse=True)
+            codes_a, codes_b = np.split(codes.astype(np.int64).ravel(), [len(vectors_a.hashes)])
+        result = np.empty(len(positions_a), dtype=np.float64)
+        starts = range(0, len(positions_a), DICE_BATCH_SIZE)
+
+        def score(start: int):
+            stop = start + DICE_BATCH_SIZE
+            result[start:stop] = _dice_batch(vectors_a, vectors_b, codes_a, codes_b, len(unique),
+                                             positions_a[start:stop], positions_b[start:stop])
+
+        if n_jobs == 1 or len(starts) <= 1:
+            for start in starts:
+                score(start)
+        else:
+            # NumPy releases the GIL while sorting, so threads score batches in parallel
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(score, starts))
+        return result
+
+    def _qgrams(self, inputstr: str, q_minus_1: int) -> List[str]:
+        if self.ngram_padding:
+            ps1 = self.padding_start_char * q_minus_1 + inputstr + self.padding_end_char * q_minus_1
+        else:
+            ps1 = inputstr
+        return [ps1[i:i + self.ngram_len] for i in range(len(ps1) - q_minus_1)]
+
 
-            qgrams = [ps1[i:i + self.ngram_len] for i in range(len(ps1) - q_minus_1)]
+class QGramVectors:
+    """Strings as sparse vectors of their hashed q-grams, stored as CSR arrays, see `DiceSim.encode`.
 
-            if cache:
-                self.q_gram_cache[inputstr] = qgrams
-        return qgrams
+    The distinct q-gram hashes of the string ``strings[i]`` are ``hashes[indptr[i]:indptr[i + 1]]``,
+    in ascending order.
+
+    :ivar strings: the encoded strings
+    :ivar indptr: int64 array of len(strings) + 1 offsets into hashes
+    :ivar hashes: uint64 q-gram hashes of all strings
+    :ivar lengths: int64 number of q-grams of every string, including repeated q-grams
+    """
 
+    def __init__(self, strings: List[str], indptr: np.ndarray, hashes: np.ndarray, lengths: np.ndarray):
+        self.strings = strings
+        self.indptr = indptr
+        self.hashes = hashes
+        self.lengths = lengths
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __repr__(self):
+        return '{}({} strings, {} q-gram hashes)'.format(type(self).__name__, len(self), len(self.hashes))
+
+    def _gather(self, rows: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """The number of distinct q-grams of the given rows and their values, e.g. hashes, concatenated in order."""
+        starts = self.indptr[rows]
+        sizes = self.indptr[rows + 1] - starts
+        run_starts = np.cumsum(sizes) - sizes
+        positions = np.arange(int(sizes.sum()), dtype=np.int64) + np.repeat(starts - run_starts, sizes)
+        return sizes, values[positions]
+
+
+def _dice_batch(vectors_a: QGramVectors, vectors_b: QGramVectors, codes_a: np.ndarray, codes_b: np.ndarray,
+                num_codes: int, rows_a: np.ndarray, rows_b: np.ndarray) -> np.ndarray:
+    """Dice similarities of the pairs (rows_a[i], rows_b[i]), with codes_a and codes_b the q-gram numbers."""
+    num_pairs = len(rows_a)
+    sizes_a, elements_a = vectors_a._gather(rows_a, codes_a)
+    sizes_b, elements_b = vectors_b._gather(rows_b, codes_b)
+    pair_ids = np.repeat(np.tile(np.arange(num_pairs, dtype=np.int64), 2), np.concatenate([sizes_a, sizes_b]))
+    elements = pair_ids * num_codes + np.concatenate([elements_a, elements_b])
+    elements.sort()
+    # the q-grams of a string are distinct, so a repeated element is a q-gram of both strings
+    repeated = elements[1:] == elements[:-1]
+    common = np.bincount(elements[1:][repeated] // max(num_codes, 1), minlength=num_pairs)
+
+    totals = vectors_a.lengths[rows_a] + vectors_b.lengths[rows_b]
+    sims = np.zeros(num_pairs, dtype=np.float64)
+    np.divide(2.0 * common, totals, out=sims, where=totals > 0)
+    # equal strings have the same q-grams, only compare the strings of such pairs
+    same_qgrams = (common == sizes_a) & (sizes_a == sizes_b) & (totals == 2 * vectors_a.lengths[rows_a])
+    for i in np.flatnonzero(same_qgrams).tolist():
+        if vectors_a.strings[rows_a[i]] == vectors_b.strings[rows_b[i]]:
+            sims[i] = 1.0
+    return sims
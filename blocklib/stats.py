@@ -1,11 +1,17 @@
-import statistics
-from typing import Sequence, Dict, List, Any
+import math
+from typing import Sequence, Dict, List, Any, Mapping, Tuple
 
+import numpy as np
 
-def reversed_index_per_strategy_stats(reversed_index_per_strategy: Sequence[Dict[str, List[Any]]], num_elements: int):
+# percentiles of the block sizes reported in the detailed statistics
+PERCENTILES = (5, 25, 50, 75, 90, 95, 99)
+
+
+def reversed_index_per_strategy_stats(reversed_index_per_strategy: Sequence[Dict[str, List[Any]]], num_elements: int,
+                                      detailed: bool = False):
     strat_stats = []
     for i, reversed_index in enumerate(reversed_index_per_strategy):
-        stats = reversed_index_stats(reversed_index)
+        stats = reversed_index_stats(reversed_index, detailed)
         stats['strategy_idx'] = i
         _add_coverage_to_stats_per_stragegy(stats, num_elements)
         strat_stats.append(stats)
@@ -18,15 +24,108 @@ def _add_coverage_to_stats_per_stragegy(stats: Dict, num_elements: int):
     stats['coverage'] = 0 if stats['sum_of_blocks'] == 0 else stats['sum_of_blocks'] / num_elements
 
 
-def reversed_index_stats(reversed_index: Dict[str, List[Any]]):
-    lengths = [len(rv) for rv in reversed_index.values()]
-    stats = {
-        'num_of_blocks': len(lengths),
-        'min_size': 0 if len(lengths) == 0 else min(lengths),
-        'max_size': 0 if len(lengths) == 0 else max(lengths),
-        'avg_size': 0 if len(lengths) == 0 else statistics.mean(lengths),
-        'med_size': 0 if len(lengths) == 0 else int(statistics.median(lengths)),
-        'std_size': 0 if 0 <= len(lengths) <= 1 else statistics.stdev(lengths),
-        'sum_of_blocks': sum(lengths)
-    }
+def block_sizes(reversed_index: Mapping[Any, Sequence[Any]]) -> np.ndarray:
+    """The sizes of the blocks of a reversed index as int64 array."""
+    if hasattr(reversed_index, 'block_sizes'):
+        # CompactReversedIndex knows its block sizes from its offsets
+        return np.asarray(reversed_index.block_sizes(), dtype=np.int64)  # type: ignore
+    return np.fromiter(map(len, reversed_index.values()), dtype=np.int64, count=len(reversed_index))
+
+
+def reversed_index_stats(reversed_index: Mapping[Any, Sequence[Any]], detailed: bool = False):
+    """Summary statistics of the block sizes of a reversed index, see `block_size_stats`."""
+    return block_size_stats(block_sizes(reversed_index), detailed)
+
+
+def block_size_stats(lengths: np.ndarray, detailed: bool = False) -> Dict[str, Any]:
+    """Summary statistics of an array of block sizes, as Python numbers.
+
+    :param lengths: the size of every block
+    :param detailed: also return
+        'percentiles': {'p5': ..., 'p99': ...} block size percentiles of `PERCENTILES`,
+        'histogram': {'bin_edges': [0, 1, 2, 4, ...], 'counts': [...]} number of blocks with a size in
+        [bin_edges[i], bin_edges[i + 1]), with power of two bin edges,
+        'sum_of_squared_sizes': sum of |b|^2 over all blocks b, an estimate of the number of comparisons
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    num_blocks = len(lengths)
+    sum_of_blocks, sum_of_squares = _exact_sums(lengths)
+    if num_blocks == 0:
+        stats = _summary_stats(0, 0, 0, 0, 0, 0)
+    else:
+        stats = _summary_stats(num_blocks, int(lengths.min()), int(lengths.max()), int(np.median(lengths)),
+                               sum_of_blocks, sum_of_squares)
+    if detailed:
+        stats.update(_detailed_block_size_stats(lengths))
+        stats['sum_of_squared_sizes'] = sum_of_squares
     return stats
+
+
+def block_size_counts_stats(size_counts: Mapping[int, int]) -> Dict[str, Any]:
+    """Summary statistics of blocks given as {block size -> number of blocks}, the same as `block_size_stats`.
+
+    The work only depends on the number of distinct sizes, so an index that keeps these counts up to date
+    gets its statistics without a pass over its blocks.
+    """
+    items = sorted((size, count) for size, count in size_counts.items() if count > 0)
+    num_blocks = sum(count for _, count in items)
+    if num_blocks == 0:
+        return _summary_stats(0, 0, 0, 0, 0, 0)
+    sum_of_blocks = sum(size * count for size, count in items)
+    sum_of_squares = sum(size * size * count for size, count in items)
+    # the median is the mean of the sizes at the positions (n - 1) // 2 and n // 2 in sorted order
+    ends = np.cumsum([count for _, count in items])
+    lower = items[int(np.searchsorted(ends, (num_blocks - 1) // 2, side='right'))][0]
+    upper = items[int(np.searchsorted(ends, num_blocks // 2, side='right'))][0]
+    return _summary_stats(num_blocks, items[0][0], items[-1][0], int((lower + upper) / 2), sum_of_blocks,
+                          sum_of_squares)
+
+
+def size_counts_per_strategy_stats(size_counts_per_strategy: Sequence[Mapping[int, int]], num_elements: int):
+    """`reversed_index_per_strategy_stats` of the {block size -> number of blocks} counts of every strategy."""
+    strat_stats = []
+    for i, size_counts in enumerate(size_counts_per_strategy):
+        stats = block_size_counts_stats(size_counts)
+        stats['strategy_idx'] = i
+        _add_coverage_to_stats_per_stragegy(stats, num_elements)
+        strat_stats.append(stats)
+    return strat_stats
+
+
+def _summary_stats(num_blocks: int, min_size: int, max_size: int, med_size: int, sum_of_blocks: int,
+                   sum_of_squares: int) -> Dict[str, Any]:
+    return {
+        'num_of_blocks': num_blocks,
+        'min_size': min_size,
+        'max_size': max_size,
+        'avg_size': 0 if num_blocks == 0 else sum_of_blocks / num_blocks,
+        'med_size': med_size,
+        'std_size': 0 if 0 <= num_blocks <= 1 else
+        math.sqrt((num_blocks * sum_of_squares - sum_of_blocks ** 2) / (num_blocks * (num_blocks - 1))),
+        'sum_of_blocks': sum_of_blocks
+    }
+
+
+def _exact_sums(lengths: np.ndarray) -> Tuple[int, int]:
+    """Sum and sum of squares of the block sizes as Python ints.
+
+    Integer sums are exact, and so don't depend on the order of the blocks, as long as they fit
+    into int64, i.e. for a sum of squares below 9.2e18.
+    """
+    lengths = lengths.astype(np.int64, copy=False)
+    return int(lengths.sum()), int((lengths ** 2).sum())
+
+
+def _detailed_block_size_stats(lengths: np.ndarray) -> Dict[str, Any]:
+    if len(lengths) == 0:
+        percentiles = [0.0] * len(PERCENTILES)
+    else:
+        percentiles = np.percentile(lengths, PERCENTILES).tolist()
+    max_size = int(lengths.max()) if len(lengths) else 0
+    # bin edges 0, 1, 2, 4, ... up to the first power of two above the largest block
+    bin_edges = [0] + [1 << i for i in range(max_size.bit_length() + 1)]
+    counts, _ = np.histogram(lengths, bins=bin_edges)
+    return {
+        'percentiles': {'p{}'.format(p): value for p, value in zip(PERCENTILES, percentiles)},
+        'histogram': {'bin_edges': bin_edges, 'counts': counts.tolist()},
+    }
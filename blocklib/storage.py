@@ -0,0 +1,137 @@
+"""Save and load blocks in a memory-mappable directory format.
+
+A blocks directory holds::
+
+    meta.json         format version, key and record id types, statistics and blocking state
+    keys.json         block keys in order, bytes keys hex encoded
+    offsets.npy       int64 array of num_blocks + 1 offsets into record_ids.npy
+    record_ids.npy    record ids of all blocks concatenated in key order
+
+The record ids of block i are ``record_ids[offsets[i]:offsets[i + 1]]``. Both arrays are
+standard ``.npy`` files, so they can be opened with ``numpy.load(..., mmap_mode='r')`` and only
+the pages of the blocks that are actually read are loaded from disk. See :ref:`blocks-format`.
+"""
+import json
+import os
+from typing import Any, Dict, Hashable, List, Mapping, Optional, Sequence, Set
+
+import numpy as np
+
+from .candidate_blocks_generator import PPRLSTATES, CandidateBlockingResult
+from .compact import CompactReversedIndex
+from .pprlindex import ReversedIndexResult
+
+FORMAT_NAME = 'blocklib-blocks'
+FORMAT_VERSION = 1
+
+META_FILE = 'meta.json'
+KEYS_FILE = 'keys.json'
+OFFSETS_FILE = 'offsets.npy'
+RECORD_IDS_FILE = 'record_ids.npy'
+
+
+def save_blocks(path: str, blocks: Mapping[Hashable, Sequence[Any]], stats: Optional[Dict] = None,
+                state: Optional[Dict] = None):
+    """
+    Save blocks, e.g. one party's output of `generate_blocks`, to the directory path.
+
+    :param path: directory to write to, created if it does not exist
+    :param blocks: mapping from block key to record ids. All keys must be of the same type (bytes, str or int),
+        record ids must be integers or strings.
+    :param stats: optional JSON serializable statistics of the blocks
+    :param state: optional JSON serializable description of the blocking state, see `save_candidate_blocks`
+    """
+    compact = CompactReversedIndex.from_dict(blocks)
+    if compact.record_ids.dtype == object:
+        raise ValueError('Record ids must be all integers or all strings to be saved')
+    keys = list(compact)
+    key_type = _key_type(keys)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, OFFSETS_FILE), compact.offsets)
+    np.save(os.path.join(path, RECORD_IDS_FILE), compact.record_ids)
+    with open(os.path.join(path, KEYS_FILE), 'w') as f:
+        json.dump([k.hex() for k in keys] if key_type == 'bytes' else keys, f)
+    meta = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'key_type': key_type,
+        'num_blocks': len(keys),
+        'num_record_ids': len(compact.record_ids),
+        'record_id_dtype': compact.record_ids.dtype.str,
+        'stats': stats,
+        'state': state,
+    }
+    with open(os.path.join(path, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def _key_type(keys: List[Hashable]) -> str:
+    key_types = {type(k) for k in keys}  # type: Set[type]
+    if len(key_types) > 1:
+        raise ValueError('All block keys must have the same type, got {}'.format(sorted(t.__name__ for t in key_types)))
+    key_type = key_types.pop() if key_types else str
+    if key_type not in (bytes, str, int):
+        raise ValueError('Unsupported block key type {}'.format(key_type.__name__))
+    return key_type.__name__
+
+
+def load_meta(path: str) -> Dict:
+    """Read and check the meta data of a blocks directory."""
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get('format') != FORMAT_NAME:
+        raise ValueError('{} is not a blocks directory'.format(path))
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError('Unsupported blocks format version {}'.format(meta.get('version')))
+    return meta
+
+
+def load_blocks(path: str, mmap: bool = True) -> CompactReversedIndex:
+    """
+    Load blocks saved with `save_blocks`.
+
+    :param path: blocks directory
+    :param mmap: memory map the record ids instead of reading them into memory
+    :return: CompactReversedIndex, looking up a block only reads its record ids from disk
+    """
+    meta = load_meta(path)
+    with open(os.path.join(path, KEYS_FILE)) as f:
+        keys = json.load(f)
+    if meta['key_type'] == 'bytes':
+        keys = [bytes.fromhex(k) for k in keys]
+    offsets = np.load(os.path.join(path, OFFSETS_FILE))
+    record_ids = np.load(os.path.join(path, RECORD_IDS_FILE), mmap_mode='r' if mmap else None)
+    return CompactReversedIndex(keys, offsets, record_ids)
+
+
+def save_candidate_blocks(path: str, candidate_block_obj: CandidateBlockingResult):
+    """
+    Save a candidate blocking result, including its statistics and blocking configuration.
+
+    :param path: directory to write to, created if it does not exist
+    :param candidate_block_obj: result of `generate_candidate_blocks`
+    """
+    algorithms = {state_type: name for name, state_type in PPRLSTATES.items()}
+    state = candidate_block_obj.state
+    state_meta = {
+        'type': algorithms[type(state)],
+        'config': state.config.dict(by_alias=True),
+    }
+    save_blocks(path, candidate_block_obj.blocks, candidate_block_obj.stats, state_meta)
+
+
+def load_candidate_blocks(path: str, mmap: bool = True) -> CandidateBlockingResult:
+    """
+    Load a candidate blocking result saved with `save_candidate_blocks`.
+
+    :param path: blocks directory
+    :param mmap: memory map the record ids instead of reading them into memory
+    :return: CandidateBlockingResult with compact blocks, which can be passed to `generate_blocks`
+    """
+    meta = load_meta(path)
+    if meta.get('state') is None:
+        raise ValueError('{} does not contain a blocking state'.format(path))
+    state = PPRLSTATES[meta['state']['type']](meta['state']['config'])
+    blocks = load_blocks(path, mmap=mmap)
+    return CandidateBlockingResult(ReversedIndexResult(blocks, meta['stats']), state)
@@ -0,0 +1,211 @@
+"""Build reversed indices from a stream of record chunks.
+
+The records are consumed one chunk at a time, so the dataset never has to fit in memory as
+a whole. The postings {block key -> record ids} of the chunks are accumulated and written to
+a temporary file whenever they exceed a memory budget. P-Sig additionally keeps the size of
+every block in memory, so the filter (the ratio filter depends on the total number of records)
+is resolved once all chunks have been seen and only the postings of blocks that pass it are
+read back.
+"""
+import os
+import pickle
+import tempfile
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, cast
+
+from .columnar import ColumnarData, build_signature_index_columnar, is_columnar
+from .pprlindex import PPRLIndex, ReversedIndexResult
+from .pprllambdafold import PPRLIndexLambdaFold
+from .pprlpsig import PPRLIndexPSignature, _signature_index
+from .stats import reversed_index_stats
+
+
+class SpillingPostings:
+    """Postings of several tables, spilled to temporary files when they exceed a memory budget.
+
+    Every spill writes one run holding the postings added since the previous spill. Runs are
+    merged back in the order they were written, so record ids stay in input order.
+    """
+
+    def __init__(self, num_tables: int, max_postings_in_memory: Optional[int] = None,
+                 spill_dir: Optional[str] = None):
+        """
+        :param num_tables: number of {key -> record ids} tables
+        :param max_postings_in_memory: number of record ids kept in memory before they are
+            written to disk. None keeps everything in memory.
+        :param spill_dir: directory for the temporary files, defaults to the system temp directory
+        """
+        if max_postings_in_memory is not None and max_postings_in_memory < 1:
+            raise ValueError('max_postings_in_memory must be positive, got {}'.format(max_postings_in_memory))
+        self.num_tables = num_tables
+        self.max_postings_in_memory = max_postings_in_memory
+        self.spill_dir = spill_dir
+        self.num_postings = 0
+        self._tables = self._empty_tables()
+        self._runs = []  # type: List[str]
+        self._tmpdir = None  # type: Optional[tempfile.TemporaryDirectory]
+
+    def _empty_tables(self) -> List[Dict[Any, List[Any]]]:
+        return [defaultdict(list) for _ in range(self.num_tables)]
+
+    @property
+    def num_runs(self) -> int:
+        """Number of runs spilled to disk."""
+        return len(self._runs)
+
+    def add(self, tables: Sequence[Dict[Any, List[Any]]]):
+        """Append the postings of one chunk, spilling to disk if the budget is exceeded."""
+        for merged_table, table in zip(self._tables, tables):
+            for key, rec_ids in table.items():
+                merged_table[key].extend(rec_ids)
+                self.num_postings += len(rec_ids)
+        if self.max_postings_in_memory is not None and self.num_postings > self.max_postings_in_memory:
+            self.spill()
+
+    def spill(self) -> None:
+        """Write the postings held in memory to a new run."""
+        if self.num_postings == 0:
+            return
+        if self._tmpdir is None:
+            self._tmpdir = tempfile.TemporaryDirectory(prefix='blocklib-', dir=self.spill_dir)
+        path = os.path.join(self._tmpdir.name, 'run-{}.pickle'.format(len(self._runs)))
+        with open(path, 'wb') as f:
+            pickle.dump([dict(table) for table in self._tables], f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._runs.append(path)
+        self._tables = self._empty_tables()
+        self.num_postings = 0
+
+    def _iter_runs(self) -> Iterator[List[Dict[Any, List[Any]]]]:
+        for path in self._runs:
+            with open(path, 'rb') as f:
+                yield pickle.load(f)
+        yield self._tables
+
+    def merge(self, keep: Optional[Sequence[Set[Any]]] = None) -> List[Dict[Any, List[Any]]]:
+        """Merge all runs into one {key -> record ids} table per table.
+
+        :param keep: optional set of keys per table. Postings of other keys are dropped while
+            the runs are read, so they never have to be in memory all at once.
+        """
+        if not self._runs:
+            if keep is None:
+                return self._tables
+            return [{key: rec_ids for key, rec_ids in table.items() if key in keys}
+                    for table, keys in zip(self._tables, keep)]
+
+        merged = self._empty_tables()
+        for tables in self._iter_runs():
+            for i, (merged_table, table) in enumerate(zip(merged, tables)):
+                for key, rec_ids in table.items():
+                    if keep is None or key in keep[i]:
+                        merged_table[key].extend(rec_ids)
+        return merged
+
+    def close(self) -> None:
+        """Delete the spilled runs."""
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+        self._runs = []
+
+
+class StreamingIndexBuilder:
+    """Incrementally build the reversed index of a P-Sig or Lambda-fold state from chunks of records.
+
+    The result of `finalize` is the same as building the index of the concatenated chunks
+    with `state.build_reversed_index`. Without a record id column, records are numbered
+    consecutively across chunks.
+    """
+
+    def __init__(self, state: PPRLIndex, header: Optional[List[str]] = None,
+                 max_postings_in_memory: Optional[int] = None, spill_dir: Optional[str] = None):
+        """
+        :param state: a PPRLIndexPSignature or PPRLIndexLambdaFold state
+        :param header: file header, optional. Ignored for columnar chunks.
+        :param max_postings_in_memory: number of record ids held in memory before the postings
+            are spilled to disk, None to never spill
+        :param spill_dir: directory for spilled postings, defaults to the system temp directory
+        """
+        if isinstance(state, PPRLIndexPSignature):
+            num_tables = len(state.signature_strategies)
+            # exact size of every signature's block, used to resolve the filter at the end
+            self.counts = [Counter() for _ in range(num_tables)]  # type: List[Counter]
+        elif isinstance(state, PPRLIndexLambdaFold):
+            num_tables = state.mylambda
+            self._sampled_indices = None  # type: Optional[List[List[int]]]
+        else:
+            raise NotImplementedError('Streaming is not supported for {}'.format(type(state).__name__))
+        self.state = state
+        self.header = header
+        self.num_records = 0
+        self.postings = SpillingPostings(num_tables, max_postings_in_memory, spill_dir)
+        self._feature_to_index = None  # type: Optional[Dict[str, int]]
+        self._features_resolved = False
+
+    def add_chunk(self, chunk: Any):
+        """Add the next chunk of records, a list of tuples or (P-Sig only) columnar data."""
+        if is_columnar(chunk):
+            if not isinstance(self.state, PPRLIndexPSignature):
+                raise NotImplementedError('Columnar data is only supported by p-sig')
+            columns = ColumnarData(chunk)
+            if not self._features_resolved:
+                self._feature_to_index = self.state.get_columnar_feature_to_index_map(columns)
+                self.state.set_blocking_features_index(self.state.blocking_features, self._feature_to_index)
+                self._features_resolved = True
+            tables, num_records = build_signature_index_columnar(
+                self.state.signature_strategies, columns, self.state.null_sentinel, self.state.rec_id_col,
+                first_record_id=self.num_records)
+        else:
+            if not isinstance(chunk, Sequence):
+                chunk = list(chunk)
+            num_records = len(chunk)
+            if num_records == 0:
+                return
+            tables = self._row_tables(chunk)
+
+        if isinstance(self.state, PPRLIndexPSignature):
+            for counts, table in zip(self.counts, tables):
+                for signature, rec_ids in table.items():
+                    counts[signature] += len(rec_ids)
+        self.postings.add(tables)
+        self.num_records += num_records
+
+    def _row_tables(self, chunk: Sequence[Any]) -> List[Dict[Any, List[Any]]]:
+        state = self.state
+        if not self._features_resolved:
+            self._feature_to_index = state.get_feature_to_index_map(chunk, self.header)
+            state.set_blocking_features_index(state.blocking_features, self._feature_to_index)  # type: ignore
+            self._features_resolved = True
+
+        if isinstance(state, PPRLIndexPSignature):
+            rec_id_col = state.rec_id_col
+        else:
+            rec_id_col = cast(PPRLIndexLambdaFold, state).record_id_col
+        if rec_id_col is None:
+            record_ids = list(range(self.num_records, self.num_records + len(chunk)))  # type: List[Any]
+        else:
+            record_ids = [x[rec_id_col] for x in chunk]
+
+        if isinstance(state, PPRLIndexPSignature):
+            return _signature_index(state.signature_strategies, state.null_sentinel,
+                                    self._feature_to_index, chunk, record_ids)
+        lambda_state = cast(PPRLIndexLambdaFold, state)
+        if self._sampled_indices is None:
+            self._sampled_indices = lambda_state._sample_indices(chunk)
+        return lambda_state._lambda_tables(chunk, record_ids, self._sampled_indices)
+
+    def finalize(self) -> ReversedIndexResult:
+        """Merge the postings of all chunks and build the reversed index."""
+        try:
+            if isinstance(self.state, PPRLIndexPSignature):
+                min_size, max_size = self.state._block_size_bounds(self.num_records)
+                keep = [{signature for signature, count in counts.items() if max_size >= count >= min_size}
+                        for counts in self.counts]
+                return self.state._build_from_signature_index(self.postings.merge(keep), self.num_records)
+
+            invert_index = {}  # type: Dict[Any, List[Any]]
+            for lambda_table in self.postings.merge():
+                invert_index.update(lambda_table)
+            return ReversedIndexResult(invert_index, reversed_index_stats(invert_index))
+        finally:
+            self.postings.close()
@@ -1,6 +1,11 @@
 import base64
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from bitarray import bitarray
-from typing import Sequence, Any, List
+from typing import Callable, Hashable, NamedTuple, Sequence, Any, List, Optional, Tuple
 
 
 def check_header(header: List[str], row: Sequence[Any]):
@@ -23,3 +28,138 @@ def deserialize_filters(filters: Sequence[Any]):
         res.append(ba)
     return res
 
+
+def deserialize_filters_packed(filters: Sequence[Any]) -> Tuple[np.ndarray, int]:
+    """Deserialize base64 encoded filters into one packed 2-D uint8 array.
+
+    Row i holds the bytes of filter i, bits are in big endian order as for `deserialize_bitarray`.
+
+    :return: the packed array and the length of the filters in bits
+    """
+    decoded = [base64.decodebytes(f.encode()) for f in filters]
+    num_bytes = len(decoded[0]) if decoded else 0
+    if any(len(d) != num_bytes for d in decoded):
+        raise ValueError('All filters must have the same length')
+    packed = np.frombuffer(b''.join(decoded), dtype=np.uint8).reshape(len(decoded), num_bytes)
+    return packed, num_bytes * 8
+
+
+def packed_bits(packed: np.ndarray, indices: Sequence[int]) -> np.ndarray:
+    """Gather the bits at indices from every row of a packed (big endian) bit matrix.
+
+    :return: uint8 array of shape (rows, len(indices)) with values 0 or 1
+    """
+    positions = np.asarray(indices, dtype=np.int64)
+    return (packed[:, positions >> 3] >> (7 - (positions & 7)).astype(np.uint8)) & 1
+
+
+def group_by_first_occurrence(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Group the positions of equal keys.
+
+    Groups are ordered by the first occurrence of their key and positions within a group are
+    in increasing order, i.e. the same order as appending to a dict of lists in a loop.
+
+    :return: (first, order, offsets) where group g holds positions order[offsets[g]:offsets[g + 1]]
+        and first[g] is the position of its first occurrence.
+    """
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    # renumber groups by first occurrence
+    rank = np.empty(len(first), dtype=np.int64)
+    by_first = np.argsort(first, kind='stable')
+    rank[by_first] = np.arange(len(first))
+    inverse = rank[inverse.ravel()]
+    order = np.argsort(inverse, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(inverse, minlength=len(first)))])
+    return first[by_first], order, offsets
+
+
+def resolve_n_jobs(n_jobs: int) -> int:
+    """Number of worker processes for n_jobs, where -1 means one per CPU."""
+    if n_jobs == -1:
+        return os.cpu_count() or 1
+    if n_jobs < 1:
+        raise ValueError('n_jobs must be a positive integer or -1, got {}'.format(n_jobs))
+    return n_jobs
+
+
+def shard_bounds(n: int, num_shards: int) -> List[Tuple[int, int]]:
+    """Split range(n) into at most num_shards contiguous (start, stop) shards of similar size."""
+    num_shards = max(1, min(num_shards, n))
+    step, rest = divmod(n, num_shards)
+    bounds = []
+    start = 0
+    for i in range(num_shards):
+        stop = start + step + (1 if i < rest else 0)
+        bounds.append((start, stop))
+        start = stop
+    return bounds
+
+
+def map_shards(func: Callable, shard_args: Sequence[Tuple], n_jobs: int) -> List[Any]:
+    """Call func(*args) for every shard in a process pool and return the results in shard order."""
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(func, *args) for args in shard_args]
+        return [future.result() for future in futures]
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of a LRUCache, like `functools.lru_cache().cache_info()` with evictions."""
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+class LRUCache:
+    """A dictionary like cache holding at most maxsize items, evicting the least recently used.
+
+    All operations take a lock, so the cache can be shared by threads. It counts the hits and misses
+    of `get` and the evictions of `put`, see `info`.
+    """
+
+    def __init__(self, maxsize: int):
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive, got {}'.format(maxsize))
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return key in self._data
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return self._data[key]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all items and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._data))
@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import Field
+from pydantic import Field, validator
 
 from .shared_blocking_config import BlockingConfigBase
 
@@ -14,5 +14,24 @@ class LambdaConfig(BlockingConfigBase):
                                   alias='input-clks',
                                   description='Input data is CLK rather than PII')
     random_state: int
+    sampled_positions: Optional[List[List[int]]] = Field(
+        None,
+        alias='sampled-positions',
+        description='The K bloom filter positions of each of the Lambda tables. Sampled with random_state if not given')
 
-    #random_state: Optional[int] = Field(None, alias='random-state')
\ No newline at end of file
+    #random_state: Optional[int] = Field(None, alias='random-state')
+
+    @validator('sampled_positions')
+    def validate_sampled_positions(cls, sampled_positions, values):
+        if sampled_positions is None:
+            return sampled_positions
+        if len(sampled_positions) != values.get('Lambda'):
+            raise ValueError('Expected sampled positions for {} tables, got {}'.format(
+                values.get('Lambda'), len(sampled_positions)))
+        for positions in sampled_positions:
+            if len(positions) != values.get('K') or len(set(positions)) != len(positions):
+                raise ValueError('Expected {} distinct sampled positions per table, got {}'.format(
+                    values.get('K'), positions))
+            if any(p < 0 for p in positions):
+                raise ValueError('Sampled positions must not be negative, got {}'.format(positions))
+        return sampled_positions
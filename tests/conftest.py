@@ -21,4 +21,48 @@ def valid_psig_config():
                     {"type": "feature-value", "feature": 1}
                 ]
             ]
-        }
\ No newline at end of file
+        }
+
+
+@pytest.fixture
+def two_party_data():
+    """Records (id, firstname, lastname) of two parties, 'Fred Yu' and 'Max Zhang' are in both."""
+    data1 = [('id1', 'Joyce', 'Wang'), ('id2', 'Fred', 'Yu'), ('id3', 'Max', 'Zhang'), ('id4', 'Fred', 'Zhou')]
+    data2 = [('id4', 'Fred', 'Yu'), ('id5', 'Jone', 'Zhang'), ('id6', 'Li', 'Jone'), ('id7', 'Max', 'Zhang')]
+    yield data1, data2
+
+
+@pytest.fixture
+def psig_schema():
+    """P-Sig blocking schema for `two_party_data`."""
+    yield {'type': 'p-sig', 'version': 1, 'config': {
+        "blocking-features": [1],
+        "record-id-col": 0,
+        "filter": {"type": "count", "max": 5, "min": 0},
+        "blocking-filter": {"type": "bloom filter", "number-hash-functions": 20, "bf-len": 2048},
+        "signatureSpecs": [
+            [{"type": "feature-value", "feature": 1}],
+            [{"type": "characters-at", "config": {"pos": ["0:2"]}, "feature": 2}],
+        ]
+    }}
+
+
+@pytest.fixture
+def lambda_schema():
+    """Lambda-fold blocking schema for `two_party_data`."""
+    yield {'type': 'lambda-fold', 'version': 1, 'config': {
+        "blocking-features": [1, 2],
+        "record-id-col": 0,
+        "Lambda": 5,
+        "bf-len": 2000,
+        "num-hash-funcs": 500,
+        "K": 30,
+        "random_state": 0,
+        "input-clks": False
+    }}
+
+
+@pytest.fixture(params=['psig_schema', 'lambda_schema'])
+def blocking_schema(request):
+    """Each of the `psig_schema` and `lambda_schema` fixtures."""
+    yield request.getfixturevalue(request.param)
@@ -1,6 +1,7 @@
 import pytest
 from blocklib import generate_blocks, generate_reverse_blocks
-from blocklib import generate_candidate_blocks, flip_bloom_filter
+from blocklib import generate_candidate_blocks, flip_bloom_filter, bloom_filter_key, PPRLIndexLambdaFold
+from blocklib.blocks_generator import block_key_matrix
 from blocklib.candidate_blocks_generator import CandidateBlockingResult
 from blocklib.pprlindex import ReversedIndexResult
 
@@ -24,6 +25,16 @@ class TestBlocksGenerator:
         record_to_blocks = generate_reverse_blocks(reversed_indices)
         assert record_to_blocks[0] == {'r1': {'Fr'}, 'r2': {'Fr'}, 'r3': {'Jo'}, 'r4': {'Jo'}}
         assert record_to_blocks[1] == {1: {'Li'}, 2: {'Li', 'Xu'}, 3: {'Li', 'Xu'}, 4: {'Xu'}}
+        assert generate_reverse_blocks(reversed_indices, n_jobs=2) == record_to_blocks
+
+        for n_jobs in (1, 2):
+            arrays = generate_reverse_blocks(reversed_indices, as_arrays=True, n_jobs=n_jobs)
+            assert [a.to_dict() for a in arrays] == record_to_blocks
+        assert arrays[1].record_ids.tolist() == [1, 2, 3, 4]
+        assert arrays[1].indptr.tolist() == [0, 1, 3, 5, 6]
+        assert arrays[1].block_ids.tolist() == [0, 0, 1, 0, 1, 1]
+        assert arrays[1].block_keys == ['Li', 'Xu']
+        assert arrays[1].blocks_of(2).tolist() == [0, 1]
 
     def test_lambdafold(self):
         """Test block generator for PPRLLambdaFold method."""
@@ -118,7 +129,7 @@ class TestBlocksGenerator:
         for string in ['1_Fr', '0_Fred', '1_Li']:
             bf_set = flip_bloom_filter(string, config['blocking-filter']['bf-len'],
                                        config['blocking-filter']['number-hash-functions'])
-            expected_bf_sets[str(tuple(bf_set))] = True
+            expected_bf_sets[bloom_filter_key(bf_set)] = True
 
         assert all(key in expected_bf_sets for key in filtered_alice)
         assert filtered_alice.keys() == filtered_bob.keys()
@@ -241,7 +252,7 @@ class TestBlocksGenerator:
         for string in ['1_Fr', '1_Jo']:
             bf_set = flip_bloom_filter(string, config['blocking-filter']['bf-len'],
                                        config['blocking-filter']['number-hash-functions'])
-            expected_bf_sets[string] = str(tuple(bf_set))
+            expected_bf_sets[string] = bloom_filter_key(bf_set)
 
         expected_m1 = {expected_bf_sets['1_Fr']: ['m1-2'], expected_bf_sets['1_Jo']: ['m1-1']}
         expected_m2 = {expected_bf_sets['1_Fr']: ['m2-1'], expected_bf_sets['1_Jo']: ['m2-2']}
@@ -253,4 +264,104 @@ class TestBlocksGenerator:
         assert expected_m3 == filtered_m3
         assert expected_m4 == filtered_m4
 
-
+    def test_block_key_matrix(self):
+        """Test the CSR representation of P-Sig block keys."""
+        keys = [bloom_filter_key([5, 1, 3]), bloom_filter_key([2]), bloom_filter_key([7, 0])]
+        indptr, indices = block_key_matrix(keys)
+        assert indptr.tolist() == [0, 3, 4, 6]
+        assert indices.tolist() == [1, 3, 5, 2, 0, 7]
+
+        indptr, indices = block_key_matrix([])
+        assert indptr.tolist() == [0]
+        assert len(indices) == 0
+
+    @pytest.mark.parametrize('compress_block_key', [False, True])
+    def test_psig_inplace(self, compress_block_key):
+        """Test that filtering P-Sig blocks in place gives the same blocks."""
+        data1 = [('id1', 'Joyce', 'Wang'), ('id2', 'Fred', 'Yu'), ('id3', 'Max', 'Zhang')]
+        data2 = [('id4', 'Fred', 'Yu'), ('id5', 'Jone', 'Zhang'), ('id6', 'Li', 'Jone')]
+        config = {
+            "blocking-features": [1],
+            "record-id-col": 0,
+            "filter": {"type": "count", "max": 5, "min": 0},
+            "blocking-filter": {
+                "type": "bloom filter",
+                "number-hash-functions": 20,
+                "bf-len": 2048,
+                "compress-block-key": compress_block_key,
+            },
+            "signatureSpecs": [
+                [{"type": "feature-value", "feature": 1}],
+                [{"type": "characters-at", "config": {"pos": ["0:2"]}, "feature": 2}],
+            ]
+        }
+        blocking_config = {'type': 'p-sig', 'version': 1, 'config': config}
+        candidate_objs = [generate_candidate_blocks(data, blocking_config) for data in (data1, data2)]
+        expected = generate_blocks(candidate_objs, K=2)
+        filtered = generate_blocks(candidate_objs, K=2, inplace=True)
+        assert filtered == expected
+        assert all(f is obj.blocks for f, obj in zip(filtered, candidate_objs))
+
+    def test_default_inplace(self):
+        """Test filtering blocks of the default strategy in place."""
+        config = {
+            "blocking-features": [1, 2],
+            "Lambda": 5,
+            "bf-len": 2000,
+            "num-hash-funcs": 500,
+            "K": 30,
+            "random_state": 0,
+            "record-id-col": 0,
+            "input-clks": False
+        }
+        blocking_config = {'type': 'lambda-fold', 'version': 1, 'config': config}
+        records = [[['id1', "Joyce", "Wang"], ['id2', "Fred", "Yu"]],
+                   [['id3', "Joyce", "Wang"], ['id4', "Lindsay", "Lin"]],
+                   [['id5', "Fred", "Yu"]]]
+        candidate_objs = [generate_candidate_blocks(r, blocking_config) for r in records]
+        expected = generate_blocks(candidate_objs, K=2)
+        assert [len(f) for f in expected] == [10, 5, 5]
+        filtered = generate_blocks(candidate_objs, K=2, inplace=True)
+        assert filtered == expected
+        assert all(f is obj.blocks for f, obj in zip(filtered, candidate_objs))
+
+    @pytest.mark.parametrize('compact', [False, True])
+    def test_comparison_budget(self, compact):
+        """Test dropping blocks over the per block limit and the largest blocks over the total budget."""
+        config = {
+            "blocking-features": [1, 2],
+            "Lambda": 5,
+            "bf-len": 2000,
+            "num-hash-funcs": 500,
+            "K": 30,
+            "random_state": 0,
+            "input-clks": False
+        }
+        blocks = [{'a': [1, 2, 3], 'b': [4], 'c': [5, 6], 'd': [7]},
+                  {'a': [1, 2], 'b': [3, 4], 'c': [5, 6, 7], 'e': [8]},
+                  {'a': [9], 'b': [10]}]
+        candidate_objs = [CandidateBlockingResult(ReversedIndexResult(b, {}), PPRLIndexLambdaFold(config))
+                          for b in blocks]
+        if compact:
+            candidate_objs = [obj.compact() for obj in candidate_objs]
+        # comparisons: a = 3*2 + 3*1 + 2*1 = 11, b = 1*2 + 1*1 + 2*1 = 5, c = 2*3 = 6
+        stats = {}
+        filtered = generate_blocks(candidate_objs, K=2, stats=stats, max_block_comparisons=10)
+        assert [sorted(f) for f in filtered] == [['b', 'c'], ['b', 'c'], ['b']]
+        assert stats['num_comparisons'] == 11
+        assert stats['dropped_comparisons'] == 11
+        assert stats['dropped_blocks'] == [{'key': 'a', 'sizes': [3, 2, 1], 'comparisons': 11}]
+
+        stats = {}
+        filtered = generate_blocks(candidate_objs, K=2, stats=stats, max_comparisons=10)
+        assert [sorted(f) for f in filtered] == [['b'], ['b'], ['b']]
+        assert stats['num_comparisons'] == 5
+        assert [d['key'] for d in stats['dropped_blocks']] == ['a', 'c']
+
+        stats = {}
+        filtered = generate_blocks(candidate_objs, K=2, stats=stats, max_comparisons=22)
+        assert [sorted(f) for f in filtered] == [['a', 'b', 'c'], ['a', 'b', 'c'], ['a', 'b']]
+        assert stats['dropped_blocks'] == [] and stats['num_comparisons'] == 22
+
+        with pytest.raises(ValueError):
+            generate_blocks(candidate_objs, K=2, max_comparisons=-1)
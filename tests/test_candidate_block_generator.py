@@ -2,7 +2,7 @@ import pytest
 import io
 
 from blocklib import generate_candidate_blocks, validate_blocking_schema
-from blocklib import flip_bloom_filter
+from blocklib import flip_bloom_filter, bloom_filter_key
 
 data = [('id1', 'Joyce', 'Wang', 'Ashfield'),
         ('id2', 'Joyce', 'Hsu', 'Burwood'),
@@ -73,8 +73,8 @@ class TestCandidateBlockGenerator:
         print(validate_blocking_schema(block_config))
 
         candidate_block_obj = generate_candidate_blocks(data, block_config)
-        bf_set_fred = str(tuple(flip_bloom_filter('0_Fred', bf_len, num_hash_funcs)))
-        bf_set_lindsay = str(tuple(flip_bloom_filter('0_Lindsay', bf_len, num_hash_funcs)))
+        bf_set_fred = bloom_filter_key(flip_bloom_filter('0_Fred', bf_len, num_hash_funcs))
+        bf_set_lindsay = bloom_filter_key(flip_bloom_filter('0_Lindsay', bf_len, num_hash_funcs))
         assert candidate_block_obj.blocks == {bf_set_fred: ['id4', 'id5'], bf_set_lindsay: ['id6']}
         stringbuf = io.StringIO()
         candidate_block_obj.print_summary_statistics(output=stringbuf)
@@ -84,3 +84,43 @@ class TestCandidateBlockGenerator:
         assert 'Coverage:           50.0%' in stats
         assert 'Individual statistics for each strategy:' in stats
 
+    def test_generate_candidate_blocks_columnar(self):
+        """Test generation of candidate blocks for p-sig from a dict of columns."""
+        global data
+        header = ['ID', 'firstname', 'lastname', 'suburb']
+        config = {
+            "blocking-features": ['firstname'],
+            "record-id-col": 0,
+            "filter": {
+                "type": "ratio",
+                "max": 0.49,
+                "min": 0.0,
+            },
+            "blocking-filter": {
+                "type": "bloom filter",
+                "number-hash-functions": 4,
+                "bf-len": 2048,
+            },
+            "signatureSpecs": [
+                [
+                    {"type": "feature-value", "feature": 'firstname'}
+                ]
+            ]
+        }
+        block_config = {'type': 'p-sig', 'version': 1, 'config': config}
+        columns = {name: [row[i] for row in data] for i, name in enumerate(header)}
+        candidate_block_obj = generate_candidate_blocks(columns, block_config)
+        expected = generate_candidate_blocks(data, block_config, header=header)
+        assert candidate_block_obj.blocks == expected.blocks
+
+        lambda_config = {'type': 'lambda-fold', 'version': 1, 'config': {
+            "blocking-features": [1, 2],
+            "Lambda": 5,
+            "bf-len": 2000,
+            "num-hash-funcs": 10,
+            "K": 30,
+            "random_state": 0,
+            "input-clks": False
+        }}
+        with pytest.raises(NotImplementedError):
+            generate_candidate_blocks(columns, lambda_config)
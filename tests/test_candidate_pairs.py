@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+import pytest
+
+from blocklib import CompactReversedIndex, count_candidate_pairs, generate_blocks, generate_candidate_blocks, \
+    generate_candidate_pairs
+
+
+def random_blocks(seed, record_ids, num_blocks=40):
+    rng = random.Random(seed)
+    return {key: rng.sample(record_ids, rng.randrange(1, 8)) for key in rng.sample(range(2 * num_blocks), num_blocks)}
+
+
+def expected_pairs(blocks_a, blocks_b):
+    return sorted({(a, b) for key in blocks_a if key in blocks_b for a in blocks_a[key] for b in blocks_b[key]})
+
+
+def collect(batches):
+    pairs = []
+    for ids_a, ids_b in batches:
+        assert isinstance(ids_a, np.ndarray) and len(ids_a) == len(ids_b)
+        pairs.extend(zip(ids_a.tolist(), ids_b.tolist()))
+    return pairs
+
+
+@pytest.mark.parametrize('record_ids', [list(range(50)), ['rec{:03d}'.format(i) for i in range(50)]])
+def test_generate_candidate_pairs(record_ids):
+    blocks_a = random_blocks(0, record_ids)
+    blocks_b = random_blocks(1, record_ids)
+    expected = expected_pairs(blocks_a, blocks_b)
+    assert len(expected) > 0
+
+    assert collect(generate_candidate_pairs([blocks_a, blocks_b])) == expected
+    for max_pairs in (1, 7, 100):
+        batches = list(generate_candidate_pairs([blocks_a, blocks_b], batch_size=5, max_pairs_in_memory=max_pairs))
+        assert all(len(ids_a) <= 5 for ids_a, _ in batches)
+        assert collect(batches) == expected
+    assert collect(generate_candidate_pairs([blocks_a, blocks_b], max_pairs_in_memory=10, n_jobs=2)) == expected
+
+    compact = [CompactReversedIndex.from_dict(blocks) for blocks in (blocks_a, blocks_b)]
+    assert collect(generate_candidate_pairs(compact)) == expected
+    assert count_candidate_pairs([blocks_a, blocks_b], max_pairs_in_memory=3) == len(expected)
+
+
+def test_generate_candidate_pairs_final_blocks(two_party_data, psig_schema):
+    blocks = generate_blocks([generate_candidate_blocks(data, psig_schema) for data in two_party_data], K=2)
+    # both strategies block ('id2', 'id4'), the pair is only generated once
+    assert collect(generate_candidate_pairs(blocks)) == expected_pairs(*blocks)
+    assert ('id2', 'id4') in collect(generate_candidate_pairs(blocks))
+
+
+def test_generate_candidate_pairs_errors():
+    assert collect(generate_candidate_pairs([{'a': [1]}, {'b': [2]}])) == []
+    with pytest.raises(ValueError):
+        list(generate_candidate_pairs([{}, {}, {}]))
+    with pytest.raises(ValueError):
+        list(generate_candidate_pairs([{}, {}], batch_size=0))
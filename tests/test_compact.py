@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from blocklib import CompactReversedIndex, ReverseBlockArrays, assess_blocks_2party, generate_blocks, \
+    generate_candidate_blocks, generate_reverse_blocks
+
+
+def test_compact_mapping():
+    blocks = {'a': [3, 1], 'b': [], 'c': [2]}
+    compact = CompactReversedIndex.from_dict(blocks)
+    assert len(compact) == 3
+    assert list(compact) == ['a', 'b', 'c']
+    assert 'b' in compact and 'd' not in compact
+    assert compact['a'].tolist() == [3, 1]
+    assert compact.get('d') is None
+    assert compact.record_ids.dtype == np.int32
+    assert compact.block_sizes().tolist() == [2, 0, 1]
+    assert compact.to_dict() == blocks
+    assert CompactReversedIndex.from_dict(compact) is compact
+    with pytest.raises(ValueError):
+        compact['a'][0] = 5
+
+    selected = compact.select(['c', 'a'], new_keys=['x', 'y'])
+    assert selected.to_dict() == {'x': [2], 'y': [3, 1]}
+
+    assert CompactReversedIndex.from_dict({'a': [2 ** 40]}).record_ids.dtype == np.int64
+    assert CompactReversedIndex.from_dict({'a': ['id1', 'id2']}).to_dict() == {'a': ['id1', 'id2']}
+    assert CompactReversedIndex.from_dict({'a': ['id1', 2]}).to_dict() == {'a': ['id1', 2]}
+
+    with pytest.raises(ValueError):
+        CompactReversedIndex(['a'], np.array([0, 1]), np.array([1, 2]))
+
+
+def test_compact_blocks(two_party_data, blocking_schema):
+    candidate_objs = [generate_candidate_blocks(data, blocking_schema) for data in two_party_data]
+    compact_objs = [generate_candidate_blocks(data, blocking_schema, compact=True) for data in two_party_data]
+    for candidate_obj, compact_obj in zip(candidate_objs, compact_objs):
+        assert isinstance(compact_obj.blocks, CompactReversedIndex)
+        assert compact_obj.blocks.to_dict() == candidate_obj.blocks
+        assert compact_obj.stats == candidate_obj.stats
+
+    expected = generate_blocks(candidate_objs, K=2)
+    filtered = generate_blocks(compact_objs, K=2, inplace=True)
+    assert [f.to_dict() for f in filtered] == expected
+
+    reverse_blocks = generate_reverse_blocks(filtered)
+    assert reverse_blocks == generate_reverse_blocks(expected)
+
+    entity_ids = [{'id1': 0, 'id2': 1, 'id3': 2, 'id4': 3}, {'id4': 1, 'id5': 4, 'id6': 5, 'id7': 2}]
+    assert assess_blocks_2party(filtered, entity_ids) == assess_blocks_2party(expected, entity_ids)
+
+
+def test_reverse_block_arrays():
+    blocks = {'b': ['r3', 'r1'], 'a': ['r1'], 'c': [], 'd': ['r2', 'r3', 'r1']}
+    reverse = ReverseBlockArrays.from_reversed_index(blocks)
+    assert len(reverse) == 3
+    assert reverse.record_ids.tolist() == ['r1', 'r2', 'r3']
+    assert reverse.block_keys == ['b', 'a', 'c', 'd']
+    assert [reverse.blocks_of(i).tolist() for i in range(3)] == [[0, 1, 3], [3], [0, 3]]
+    assert reverse.to_dict() == {'r1': {'a', 'b', 'd'}, 'r2': {'d'}, 'r3': {'b', 'd'}}
+    assert ReverseBlockArrays.from_reversed_index(CompactReversedIndex.from_dict(blocks)).to_dict() == \
+        reverse.to_dict()
+    assert len(ReverseBlockArrays.from_reversed_index({})) == 0
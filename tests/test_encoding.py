@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from blocklib import flip_bloom_filter, flip_bloom_filters, generate_bloom_filter, generate_bloom_filters, \
+    bloom_filter_key, bloom_filter_keys, block_key_positions
+from blocklib.utils import CacheInfo, LRUCache
+
+
+def test_flip_bloom_filters():
+    """Test that batched hashing gives the same indices as hashing one string at a time."""
+    strings = ['Jo', 'oy', 'yc', 'ce', 'Jo', '']
+    indices = flip_bloom_filters(strings, 2048, 5)
+    assert indices.shape == (len(strings), 5)
+    for string, row in zip(strings, indices):
+        assert set(row.tolist()) == flip_bloom_filter(string, 2048, 5)
+
+    # cached results are the same
+    cache = LRUCache(3)
+    assert np.array_equal(flip_bloom_filters(strings, 2048, 5, cache=cache), indices)
+    assert len(cache) == 3
+    # every distinct string is looked up once per call
+    assert cache.info().misses == 5
+    assert np.array_equal(flip_bloom_filters(strings, 2048, 5, cache=cache), indices)
+    # the same string with a different bf_len is a different cache entry
+    assert set(flip_bloom_filters(['Jo'], 100, 5, cache=cache)[0].tolist()) == flip_bloom_filter('Jo', 100, 5)
+
+
+def test_generate_bloom_filters():
+    """Test generating many bloom filters into a preallocated array."""
+    list_of_list_of_strs = [['Jo', 'oy', 'yc', 'ce'], [], ['Fr', 're', 'ed']]
+    out = np.zeros((3, 1024), dtype=bool)
+    bloom_filters = generate_bloom_filters(list_of_list_of_strs, 1024, 10, out=out)
+    assert bloom_filters is out
+    for strs, bloom_filter in zip(list_of_list_of_strs, bloom_filters):
+        assert np.array_equal(bloom_filter, generate_bloom_filter(strs, 1024, 10))
+    assert not bloom_filters[1].any()
+
+    with pytest.raises(ValueError):
+        generate_bloom_filters(list_of_list_of_strs, 1024, 10, out=np.zeros((2, 1024), dtype=bool))
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    # 'b' is the least recently used item
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.info() == CacheInfo(hits=3, misses=1, evictions=1, maxsize=2, currsize=2)
+    cache.clear()
+    assert cache.info() == CacheInfo(hits=0, misses=0, evictions=0, maxsize=2, currsize=0)
+
+
+def test_bloom_filter_key():
+    """Test that block keys are canonical and can be turned back into positions."""
+    positions = flip_bloom_filter('0_Fred', 2048, 20)
+    key = bloom_filter_key(positions)
+    assert isinstance(key, bytes)
+    assert key == bloom_filter_key(sorted(positions, reverse=True))
+    assert key == bloom_filter_key(flip_bloom_filters(['0_Fred'], 2048, 20)[0])
+    assert len(key) == 4 * len(positions)
+    assert block_key_positions(key).tolist() == sorted(positions)
+
+
+def test_bloom_filter_keys():
+    """Test that block keys of many rows match the key of every row."""
+    indices = flip_bloom_filters(['0_Fred', '1_Lindsay', '0_Fred', 'a'], 50, 20)
+    keys = bloom_filter_keys(indices)
+    assert keys == [bloom_filter_key(row.tolist()) for row in indices]
+    assert keys[0] == keys[2]
+    assert bloom_filter_keys(np.empty((0, 20), dtype=np.int64)) == []
@@ -1,4 +1,8 @@
-from blocklib import assess_blocks_2party, generate_blocks, generate_candidate_blocks
+import itertools
+import random
+
+from blocklib import CompactReversedIndex, assess_blocks, assess_blocks_2party, generate_blocks, \
+    generate_candidate_blocks
 import pytest
 
 
@@ -69,3 +73,50 @@ def test_assess_blocks_2party():
 
     with pytest.raises(ValueError):
         assess_blocks_2party([{}, {}], [[], []])
+
+
+def brute_force_assessment(blocks, entities):
+    """Reference implementation over all pairs of parties with Python sets."""
+    comparisons, found, true_matches, all_comparisons = 0, 0, 0, 0
+    for i, j in itertools.combinations(range(len(blocks)), 2):
+        all_comparisons += len(entities[i]) * len(entities[j])
+        true_matches += len(set(entities[i]) & set(entities[j]))
+        matches = set()
+        for key in set(blocks[i]) & set(blocks[j]):
+            comparisons += len(blocks[i][key]) * len(blocks[j][key])
+            matches |= {entities[i][r] for r in blocks[i][key]} & {entities[j][r] for r in blocks[j][key]}
+        found += len(matches)
+    return comparisons, all_comparisons, true_matches, found
+
+
+@pytest.mark.parametrize('num_parties', [2, 3])
+def test_assess_blocks(num_parties):
+    rng = random.Random(0)
+    entities = [[rng.randrange(300) for _ in range(200)] for _ in range(num_parties)]
+    blocks = [{key: sorted(rng.sample(range(200), rng.randrange(1, 10))) for key in rng.sample(range(100), 60)}
+              for _ in range(num_parties)]
+    comparisons, all_comparisons, true_matches, found = brute_force_assessment(blocks, entities)
+
+    assessment = assess_blocks(blocks, entities)
+    assert assessment['num_comparisons'] == comparisons
+    assert assessment['num_all_comparisons'] == all_comparisons
+    assert assessment['num_true_matches'] == true_matches
+    assert assessment['num_found_matches'] == found
+    assert assessment['rr'] == 1 - comparisons / all_comparisons
+    assert assessment['pc'] == found / true_matches
+    assert assessment['pq'] == found / comparisons
+    pc, pq = assessment['pc'], assessment['pq']
+    assert assessment['f_measure'] == pytest.approx(2 * pc * pq / (pc + pq))
+
+    assert assess_blocks(blocks, entities, n_jobs=2) == assessment
+    compact_blocks = [CompactReversedIndex.from_dict(b) for b in blocks]
+    assert assess_blocks(compact_blocks, entities) == assessment
+    # entity ids given as mapping from record id to entity id
+    entity_maps = [dict(enumerate(e)) for e in entities]
+    assert assess_blocks(blocks, entity_maps) == assessment
+
+    if num_parties == 2:
+        assert assess_blocks_2party(blocks, entities) == (assessment['rr'], assessment['pc'])
+    else:
+        with pytest.raises(ValueError):
+            assess_blocks_2party(blocks, entities)
@@ -0,0 +1,147 @@
+import random
+
+import pytest
+
+from blocklib import generate_candidate_blocks, load_candidate_blocks, save_candidate_blocks
+from blocklib.incremental import IncrementalLambdaFoldIndex, IncrementalPSigIndex
+
+rnd = random.Random(0)
+header = ['ID', 'firstname', 'lastname', 'suburb']
+data = [('id{}'.format(i), rnd.choice(['Joyce', 'Fred', 'Lindsay', 'Ann', 'Bob', 'Max']),
+         rnd.choice(['Wang', 'Hsu', 'Shan', 'Yu', 'Zhang', 'Jone']), rnd.choice(['Ashfield', 'Burwood', '']))
+        for i in range(300)]
+
+
+def psig_schema(filter_config):
+    return {'type': 'p-sig', 'version': 1, 'config': {
+        "blocking-features": ['firstname', 'lastname'],
+        "record-id-col": 0,
+        "filter": filter_config,
+        "blocking-filter": {"type": "bloom filter", "number-hash-functions": 4, "bf-len": 2048},
+        "signatureSpecs": [
+            [{"type": "feature-value", "feature": 'firstname'}, {"type": "feature-value", "feature": 'lastname'}],
+            [{"type": "characters-at", "feature": 'lastname', "config": {"pos": [0]}},
+             {"type": "feature-value", "feature": 'suburb'}],
+        ],
+        "null-sentinel": ""
+    }}
+
+
+def sorted_blocks(blocks):
+    return {key: sorted(rec_ids) for key, rec_ids in blocks.items()}
+
+
+@pytest.mark.parametrize('filter_config', [{"type": "ratio", "max": 0.05, "min": 0.02},
+                                           {"type": "count", "max": 12, "min": 3}])
+def test_incremental_psig(filter_config):
+    schema = psig_schema(filter_config)
+    index = IncrementalPSigIndex(schema['config'], header=header)
+    current = []
+    for start in range(0, len(data), 60):
+        delta = data[start:start + 60]
+        removed = [r for r in current if rnd.random() < 0.2]
+        current = [r for r in current if r not in removed] + delta
+
+        previous = dict(index.reversed_index)
+        index.add_records(delta)
+        result, diff = index.remove_records([r[0] for r in removed])
+
+        expected = generate_candidate_blocks(current, schema, header=header)
+        assert sorted_blocks(result.reversed_index) == sorted_blocks(expected.blocks)
+        assert result.stats == expected.stats
+    assert index.num_records == len(current)
+
+
+def test_incremental_psig_wide_filter_bounds():
+    # only the block sizes that occur are checked against the moving filter bounds
+    schema = psig_schema({"type": "count", "max": 10 ** 9, "min": 1})
+    index = IncrementalPSigIndex(schema['config'], header=header)
+    result, _ = index.add_records(data[:1])
+    assert sorted_blocks(result.reversed_index) == sorted_blocks(
+        generate_candidate_blocks(data[:1], schema, header=header).blocks)
+
+
+def test_incremental_psig_diff():
+    schema = psig_schema({"type": "count", "max": 100, "min": 0})
+    index = IncrementalPSigIndex(schema['config'], header=header)
+    records = [('a', 'Joyce', 'Wang', ''), ('b', 'Fred', 'Yu', '')]
+    result, diff = index.add_records(records)
+    assert len(diff.added) == 2 and not diff.changed and not diff.removed
+    assert sorted(diff.added.values()) == [['a'], ['b']]
+
+    _, diff = index.add_records([('c', 'Joyce', 'Wang', '')])
+    assert list(diff.changed.values()) == [['a', 'c']] and not diff.added
+
+    _, diff = index.remove_records(['b'])
+    assert len(diff.removed) == 1 and len(diff) == 1
+
+    with pytest.raises(ValueError, match=r"\['a'\] are already in the index"):
+        index.add_records([('a', 'Max', 'Yu', '')])
+    with pytest.raises(ValueError, match=r"\['d'\] occur more than once"):
+        index.add_records([('d', 'Max', 'Yu', ''), ('d', 'Ann', 'Hsu', '')])
+    assert index.num_records == 2
+    with pytest.raises(KeyError):
+        index.remove_records(['b'])
+
+
+def test_incremental_psig_columnar():
+    pd = pytest.importorskip('pandas')
+    schema = psig_schema({"type": "count", "max": 12, "min": 3})
+    index = IncrementalPSigIndex(schema['config'])
+    index.add_records(pd.DataFrame(data[:150], columns=header))
+    result, _ = index.add_records(pd.DataFrame(data[150:], columns=header))
+    expected = generate_candidate_blocks(data, schema, header=header)
+    assert sorted_blocks(result.reversed_index) == sorted_blocks(expected.blocks)
+    assert index.state.blocking_features_index == expected.state.blocking_features_index == [1, 2]
+
+
+lambda_schema = {'type': 'lambda-fold', 'version': 1, 'config': {
+    "blocking-features": [1, 2],
+    "Lambda": 5,
+    "bf-len": 2000,
+    "num-hash-funcs": 10,
+    "K": 20,
+    "random_state": 0,
+    "record-id-col": 0,
+    "input-clks": False
+}}
+
+
+def test_incremental_lambda_fold():
+    index = IncrementalLambdaFoldIndex(lambda_schema['config'])
+    index.add_records(data[:100])
+    result, diff = index.add_records(data[100:])
+    assert len(diff) > 0
+    assert result.reversed_index == generate_candidate_blocks(data, lambda_schema).blocks
+
+    removed = ['id{}'.format(i) for i in range(0, 300, 3)]
+    result, diff = index.remove_records(removed)
+    remaining = [r for r in data if r[0] not in removed]
+    expected = generate_candidate_blocks(remaining, lambda_schema)
+    assert result.reversed_index == expected.blocks
+    assert result.stats == expected.stats
+    assert set(diff.removed).isdisjoint(result.reversed_index)
+    with pytest.raises(KeyError):
+        index.remove_records(['id0'])
+    with pytest.raises(ValueError, match=r"\['id1'\] are already in the index"):
+        index.add_records([data[1]])
+    with pytest.raises(ValueError, match=r"\['id0'\] occur more than once"):
+        index.add_records([data[0], data[0]])
+
+
+def test_incremental_lambda_fold_later_session(tmp_path):
+    candidate_obj = generate_candidate_blocks(data[:200], lambda_schema)
+    assert len(candidate_obj.state.sampled_positions) == 5
+    save_candidate_blocks(str(tmp_path), candidate_obj)
+
+    loaded = load_candidate_blocks(str(tmp_path))
+    assert loaded.state.sampled_positions == candidate_obj.state.sampled_positions
+    index = IncrementalLambdaFoldIndex.from_candidate_blocks(loaded)
+    result, _ = index.add_records(data[200:])
+    expected = generate_candidate_blocks(data, lambda_schema)
+    assert result.reversed_index == expected.blocks
+    assert result.stats == expected.stats
+
+    with pytest.raises(TypeError):
+        IncrementalLambdaFoldIndex.from_candidate_blocks(
+            generate_candidate_blocks(data, psig_schema({"type": "count", "max": 12, "min": 3}), header=header))
@@ -147,3 +147,57 @@ class TestLambdaFold(unittest.TestCase):
         # above 3 cases should give exactly same results
         assert reversed_index1 == reversed_index2
         assert reversed_index2 == reversed_index3
+
+    def test_build_reversed_index_n_jobs(self):
+        """Test that a parallel build gives the same result as a serial one."""
+        config = {
+            "blocking-features": [1, 2],
+            "Lambda": 5,
+            "bf-len": 2000,
+            "num-hash-funcs": 10,
+            "K": 5,
+            "random_state": 0,
+            "input-clks": False
+        }
+        data = [[i, name, surname] for i, (name, surname) in enumerate(
+            [('Joyce', 'Wang'), ('Joyce', 'Hsu'), ('Fred', 'Yu'), ('Fred', 'Zhang'), ('Lindsay', 'Jone')])]
+        serial = PPRLIndexLambdaFold(config).build_reversed_index(data)
+        parallel = PPRLIndexLambdaFold(config).build_reversed_index(data, n_jobs=2)
+        assert parallel == serial
+        assert list(parallel.reversed_index.items()) == list(serial.reversed_index.items())
+
+        clk_filepath = Path(__file__).parent / 'data' / 'small_clk.json'
+        with clk_filepath.open() as f:
+            clks = json.load(f)['clks']
+        config['input-clks'] = True
+        serial = PPRLIndexLambdaFold(config).build_reversed_index(clks)
+        parallel = PPRLIndexLambdaFold(config).build_reversed_index(clks, n_jobs=3)
+        assert parallel == serial
+
+    def test_sampled_positions(self):
+        """Test that the sampled positions are stored and reused from the config."""
+        config = {
+            "blocking-features": [1, 2],
+            "Lambda": 3,
+            "bf-len": 2000,
+            "num-hash-funcs": 10,
+            "K": 4,
+            "random_state": 0,
+            "input-clks": False
+        }
+        data = [[0, 'Joyce', 'Wang'], [1, 'Joyce', 'Hsu'], [2, 'Fred', 'Yu']]
+        lambda_fold_index = PPRLIndexLambdaFold(config)
+        expected = lambda_fold_index.build_reversed_index(data)
+        sampled_positions = lambda_fold_index.sampled_positions
+        assert len(sampled_positions) == 3 and all(len(p) == 4 for p in sampled_positions)
+        assert lambda_fold_index.config.dict(by_alias=True)['sampled-positions'] == sampled_positions
+
+        # positions from the config are used as they are, whatever the random state
+        config_with_positions = dict(config, random_state=1, **{'sampled-positions': sampled_positions})
+        assert PPRLIndexLambdaFold(config_with_positions).build_reversed_index(data) == expected
+
+        for invalid in ([[1, 2, 3, 4]] * 2, [[1, 2, 3]] * 3, [[1, 1, 2, 3]] * 3, [[-1, 2, 3, 4]] * 3):
+            with self.assertRaises(ValueError):
+                PPRLIndexLambdaFold(dict(config, **{'sampled-positions': invalid}))
+        with self.assertRaises(ValueError):
+            PPRLIndexLambdaFold(dict(config, **{'sampled-positions': [[1, 2, 3, 2000]] * 3})).build_reversed_index(data)
@@ -1,5 +1,9 @@
 import unittest
-from blocklib import PPRLIndexPSignature, flip_bloom_filter
+
+import numpy as np
+import pytest
+from blocklib import PPRLIndexPSignature, flip_bloom_filter, bloom_filter_key
+from blocklib import columnar
 
 data = [('id1', 'Joyce', 'Wang', 'Ashfield'),
         ('id2', 'Joyce', 'Hsu', 'Burwood'),
@@ -9,6 +13,13 @@ data = [('id1', 'Joyce', 'Wang', 'Ashfield'),
         ('id6', 'Lindsay', 'Jone', 'Narwee')]
 
 
+class NotConverted(list):
+    """A column that fails when it is converted to a NumPy array."""
+
+    def __array__(self, *args, **kwargs):
+        raise AssertionError('The column should not be converted')
+
+
 class TestPSig(unittest.TestCase):
 
     def test_config(self):
@@ -83,9 +94,9 @@ class TestPSig(unittest.TestCase):
         }
         psig = PPRLIndexPSignature(config)
         reversed_index_result = psig.build_reversed_index(data)
-        bf_set = tuple(flip_bloom_filter("0_Fred", config['blocking-filter']['bf-len'],
-                                         config['blocking-filter']['number-hash-functions']))
-        assert reversed_index_result.reversed_index == {str(bf_set): ['id4', 'id5']}
+        bf_set = bloom_filter_key(flip_bloom_filter("0_Fred", config['blocking-filter']['bf-len'],
+                                                    config['blocking-filter']['number-hash-functions']))
+        assert reversed_index_result.reversed_index == {bf_set: ['id4', 'id5']}
         stats = reversed_index_result.stats
         assert len(stats) >= 9
         assert stats['num_of_blocks'] == 1
@@ -120,12 +131,12 @@ class TestPSig(unittest.TestCase):
 
         psig = PPRLIndexPSignature(config)
         reversed_index_result = psig.build_reversed_index(data, header=header)
-        bf_set = tuple(flip_bloom_filter(
+        bf_set = bloom_filter_key(flip_bloom_filter(
             "0_Fred",
              config['blocking-filter']['bf-len'],
              config['blocking-filter']['number-hash-functions']
          ))
-        assert reversed_index_result.reversed_index == {str(bf_set): ['id4', 'id5']}
+        assert reversed_index_result.reversed_index == {bf_set: ['id4', 'id5']}
 
         # test if results with column name and column index are the same
         config_index = {
@@ -233,3 +244,201 @@ class TestPSig(unittest.TestCase):
         assert reversed_index1_result == reversed_index2_result
         assert reversed_index2_result == reversed_index3_result
 
+    def test_build_reversed_index_columnar(self):
+        """Test that columnar input gives the same result as the rows."""
+        global data
+        header = ['ID', 'firstname', 'lastname', 'suburb']
+        config = {
+            "blocking-features": ['firstname', 'lastname'],
+            "record-id-col": 0,
+            "filter": {
+                "type": "ratio",
+                "max": 0.5,
+                "min": 0.0,
+            },
+            "blocking-filter": {
+                "type": "bloom filter",
+                "number-hash-functions": 20,
+                "bf-len": 2048,
+            },
+            "signatureSpecs": [
+                [
+                    {"type": "feature-value", "feature": 'firstname'},
+                    {"type": "characters-at", "feature": 'lastname', "config": {"pos": [0, "-2:"]}},
+                ],
+                [
+                    {"type": "characters-at", "feature": 'suburb', "config": {"pos": [":3"]}},
+                ],
+                [
+                    {"type": "metaphone", "feature": 'lastname'},
+                ]
+            ]
+        }
+        row_index = PPRLIndexPSignature(config)
+        expected = row_index.build_reversed_index(data, header=header)
+        columns = {name: np.array([row[i] for row in data]) for i, name in enumerate(header)}
+        columnar_index = PPRLIndexPSignature(config)
+        result = columnar_index.build_reversed_index(columns)
+        assert result == expected
+        assert list(result.reversed_index.items()) == list(expected.reversed_index.items())
+        # both paths leave the index in the same state
+        assert columnar_index.blocking_features_index == [1, 2]
+        assert vars(columnar_index) == vars(row_index)
+
+        # columns that are not referenced by the configuration are not converted
+        columns = {name: [row[i] for row in data] for i, name in enumerate(header)}
+        columns['notes'] = NotConverted(['note'] * len(data))
+        assert PPRLIndexPSignature(config).build_reversed_index(columns) == expected
+
+        pd = pytest.importorskip('pandas')
+        df = pd.DataFrame(data, columns=header)
+        assert PPRLIndexPSignature(config).build_reversed_index(df) == expected
+
+    def test_build_reversed_index_columnar_null(self):
+        """Test NULL values and missing features in columnar input."""
+        header = ['ID', 'firstname', 'lastname']
+        rows = [('id1', 'Joyce', None),
+                ('id2', 'Joyce', ''),
+                ('id3', None, 'Wang'),
+                ('id4', 'Fred', 'Yu')]
+        config = {
+            "blocking-features": [1, 2],
+            "record-id-col": 0,
+            "null-sentinel": None,
+            "filter": {
+                "type": "count",
+                "max": 10,
+                "min": 1,
+            },
+            "blocking-filter": {
+                "type": "bloom filter",
+                "number-hash-functions": 20,
+                "bf-len": 2048,
+            },
+            "signatureSpecs": [
+                [
+                    {"type": "feature-value", "feature": 1},
+                    {"type": "characters-at", "feature": 2, "config": {"pos": [0]}},
+                ]
+            ]
+        }
+        expected = PPRLIndexPSignature(config).build_reversed_index(rows)
+        columns = {name: np.array([row[i] for row in rows], dtype=object) for i, name in enumerate(header)}
+        assert PPRLIndexPSignature(config).build_reversed_index(columns) == expected
+        # 'id2' has an empty lastname, so the characters-at part is left out of the signature
+        bf_set = bloom_filter_key(flip_bloom_filter("0_Joyce", 2048, 20))
+        assert expected.reversed_index[bf_set] == ['id2']
+
+    def test_build_reversed_index_n_jobs(self):
+        """Test that a parallel build gives the same result as a serial one."""
+        global data
+        config = {
+            "blocking-features": [1, 2],
+            "record-id-col": 0,
+            "filter": {
+                "type": "ratio",
+                "max": 0.5,
+                "min": 0.0,
+            },
+            "blocking-filter": {
+                "type": "bloom filter",
+                "number-hash-functions": 20,
+                "bf-len": 2048,
+            },
+            "signatureSpecs": [
+                [
+                    {"type": "feature-value", "feature": 1}
+                ],
+                [
+                    {"type": "characters-at", "feature": 2, "config": {"pos": [0]}},
+                ]
+            ]
+        }
+        serial = PPRLIndexPSignature(config).build_reversed_index(data)
+        parallel = PPRLIndexPSignature(config).build_reversed_index(data, n_jobs=4)
+        assert parallel == serial
+        assert list(parallel.reversed_index.items()) == list(serial.reversed_index.items())
+
+    def test_build_reversed_index_two_pass(self):
+        """Test that counting the signatures first gives the same result."""
+        global data
+        config = {
+            "blocking-features": [1, 2],
+            "record-id-col": 0,
+            "filter": {
+                "type": "count",
+                "max": 2,
+                "min": 1,
+            },
+            "blocking-filter": {
+                "type": "bloom filter",
+                "number-hash-functions": 20,
+                "bf-len": 2048,
+            },
+            "signatureSpecs": [
+                [
+                    {"type": "feature-value", "feature": 1}
+                ],
+                [
+                    {"type": "characters-at", "feature": 2, "config": {"pos": [0]}},
+                ]
+            ]
+        }
+        expected = PPRLIndexPSignature(config).build_reversed_index(data)
+        for n_jobs in (1, 2):
+            two_pass = PPRLIndexPSignature(config).build_reversed_index(data, n_jobs=n_jobs, two_pass=True)
+            assert two_pass == expected
+            assert list(two_pass.reversed_index.items()) == list(expected.reversed_index.items())
+
+        detailed = PPRLIndexPSignature(config).build_reversed_index(data, detailed_stats=True)
+        assert detailed.stats['sum_of_squared_sizes'] == sum(len(v) ** 2 for v in expected.reversed_index.values())
+        for stats in detailed.stats['statistics_per_strategy']:
+            assert 'percentiles' in stats and 'histogram' in stats
+
+        columns = {str(i): np.array([row[i] for row in data]) for i in range(len(data[0]))}
+        two_pass = PPRLIndexPSignature(config).build_reversed_index(columns, two_pass=True)
+        assert two_pass == PPRLIndexPSignature(config).build_reversed_index(columns)
+        assert two_pass == expected
+
+
+@pytest.mark.parametrize('two_pass', [False, True])
+def test_build_reversed_index_columnar_chunks(monkeypatch, two_pass):
+    """Test that generating the signatures in chunks of rows gives the same result."""
+    config = {
+        "blocking-features": [1, 2],
+        "record-id-col": 0,
+        "filter": {"type": "count", "max": 2, "min": 1},
+        "blocking-filter": {"type": "bloom filter", "number-hash-functions": 20, "bf-len": 2048},
+        "signatureSpecs": [
+            [{"type": "feature-value", "feature": 1}],
+            [{"type": "characters-at", "feature": 2, "config": {"pos": [0, "-2:"]}}],
+        ]
+    }
+    rows = data + [('id7', 'Fred', 'W' * 500, 'Ashfield')]
+    expected = PPRLIndexPSignature(config).build_reversed_index(rows)
+    # 'Joyce' has 3 records in different chunks and is filtered out
+    monkeypatch.setattr(columnar, 'CHUNK_ROWS', 2)
+    columns = {str(i): np.array([row[i] for row in rows], dtype=object) for i in range(len(rows[0]))}
+    result = PPRLIndexPSignature(config).build_reversed_index(columns, two_pass=two_pass)
+    assert result == expected
+    assert list(result.reversed_index.items()) == list(expected.reversed_index.items())
+
+
+def test_build_reversed_index_columnar_same_signature():
+    """Test that different feature values joining to the same signature share a block."""
+    config = {
+        "blocking-features": [1, 2],
+        "record-id-col": 0,
+        "filter": {"type": "count", "max": 10, "min": 1},
+        "blocking-filter": {"type": "bloom filter", "number-hash-functions": 20, "bf-len": 2048},
+        "signatureSpecs": [
+            [{"type": "feature-value", "feature": 1},
+             {"type": "characters-at", "feature": 2, "config": {"pos": [":3"]}}],
+        ]
+    }
+    rows = [('id1', 'a_b', 'c'), ('id2', 'a', 'b_c'), ('id3', 'a', 'b_cd')]
+    expected = PPRLIndexPSignature(config).build_reversed_index(rows)
+    columns = {str(i): np.array([row[i] for row in rows]) for i in range(3)}
+    result = PPRLIndexPSignature(config).build_reversed_index(columns)
+    assert list(result.reversed_index.values()) == [['id1', 'id2', 'id3']]
+    assert list(result.reversed_index.items()) == list(expected.reversed_index.items())
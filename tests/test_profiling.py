@@ -0,0 +1,54 @@
+import io
+import logging
+
+import pytest
+
+from blocklib import StageProfiler, generate_blocks, generate_candidate_blocks
+
+
+def stage_names(records):
+    return [record['stage'] for record in records]
+
+
+def test_candidate_blocks_profile(two_party_data, psig_schema, lambda_schema):
+    data1, _ = two_party_data
+    expected = generate_candidate_blocks(data1, psig_schema)
+    assert 'profile' not in expected.stats
+
+    result = generate_candidate_blocks(data1, psig_schema, profile=True, compact=True)
+    assert stage_names(result.stats['profile']) == [
+        'validation', 'header_mapping', 'signature_generation', 'filter', 'strategy_stats', 'bloom_filter_keys',
+        'stats', 'compact']
+    for record in result.stats['profile']:
+        assert record['wall_time'] >= 0 and record['cpu_time'] >= 0 and record['peak_memory'] >= 0
+    assert result.blocks.to_dict() == expected.blocks
+
+    output = io.StringIO()
+    result.print_summary_statistics(output)
+    assert 'signature_generation: ' in output.getvalue()
+
+    result = generate_candidate_blocks(data1, lambda_schema, profile=True)
+    assert stage_names(result.stats['profile']) == ['validation', 'header_mapping', 'lambda_tables', 'stats']
+
+
+def test_profiler_callback_and_logging(caplog, two_party_data, psig_schema):
+    records = []
+    profiler = StageProfiler(trace_memory=False, callback=records.append, log_level=logging.INFO)
+    with caplog.at_level(logging.INFO):
+        result = generate_candidate_blocks(two_party_data[0], psig_schema, profile=profiler)
+    assert records == result.stats['profile']
+    assert all(record['peak_memory'] is None for record in records)
+    assert 'bloom_filter_keys: ' in caplog.text
+
+
+@pytest.mark.parametrize('blocking_schema, stages', [
+    ('psig_schema', ['candidate_filter', 'has_matches', 'key_intersection']),
+    ('lambda_schema', ['key_intersection']),
+], indirect=['blocking_schema'])
+def test_generate_blocks_profile(two_party_data, blocking_schema, stages):
+    candidate_objs = [generate_candidate_blocks(data, blocking_schema) for data in two_party_data]
+    expected = generate_blocks(candidate_objs, K=2)
+
+    stats = {}  # type: dict
+    assert generate_blocks(candidate_objs, K=2, profile=True, stats=stats) == expected
+    assert stage_names(stats['profile']) == stages
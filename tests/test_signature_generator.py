@@ -5,6 +5,7 @@ from pydantic import ValidationError
 from pydantic.tools import parse_obj_as
 
 from blocklib import generate_signatures
+from blocklib.signature_generator import compile_signature_strategies
 from blocklib.validation import PSigSignatureModel
 from blocklib.validation.psig_validation import PSigCharsAtSignatureSpec, PSigMetaphoneSignatureSpec, \
     PSigFeatureValueSignatureSpec
@@ -117,6 +118,37 @@ class TestPSig:
         signatures = generate_signatures(signature_strats, dtuple, "dummy")
         assert len(signatures) > 0
 
+    def test_generate_signatures_stringify(self):
+        """Test that only referenced features are converted to strings, once per record."""
+        class Counted:
+            conversions = 0
+
+            def __str__(self):
+                Counted.conversions += 1
+                return '2134'
+
+        class NotConverted:
+            def __str__(self):
+                raise AssertionError('unreferenced feature converted to a string')
+
+        signature_strats = parse_obj_as(
+            List[PSigSignatureModel],
+            [
+                [
+                    {'type': 'feature-value', 'feature': 0},
+                    {'type': 'feature-value', 'feature': 1},
+                ],
+                [
+                    {'type': 'characters-at', 'feature': 1, 'config': {'pos': [0]}},
+                    {'type': 'feature-value', 'feature': 2},
+                ]
+            ]
+        )
+        dtuple = ('Joyce', Counted(), 3.5, NotConverted())
+        signatures = generate_signatures(signature_strats, dtuple, "")
+        assert signatures == [(0, '0_Joyce_2134'), (1, '1_2_3.5')]
+        assert Counted.conversions == 1
+
     def test_invalid_signature_type(self):
         with pytest.raises(ValidationError) as e:
             parse_obj_as(
@@ -141,3 +173,35 @@ class TestPSig:
             feature_to_index = {'name': 0}
             generate_signatures(signatures, dtuple, "", feature_to_index)
             assert e == 'Feature name is not in the dataset'
+
+    def test_compile_signature_strategies(self):
+        """Test that a compiled plan matches generate_signatures record by record."""
+        header = ['firstname', 'lastname', 'postcode']
+        signature_strats = parse_obj_as(
+            List[PSigSignatureModel],
+            [
+                [
+                    {'type': 'feature-value', 'feature': 'firstname'},
+                    {'type': 'characters-at', 'feature': 'lastname', 'config': {'pos': [0, ':2', '-2:']}},
+                ],
+                [
+                    {'type': 'metaphone', 'feature': 'lastname'},
+                    {'type': 'feature-value', 'feature': 2},
+                ]
+            ]
+        )
+        feature_to_index = {name: i for i, name in enumerate(header)}
+        generate = compile_signature_strategies(signature_strats, "", feature_to_index)
+        records = [('Joyce', 'Wang', 2134), ('Fred', '', 2000), ('', 'Yu', 2134)]
+        for dtuple in records:
+            assert generate(dtuple) == generate_signatures(signature_strats, dtuple, "", feature_to_index)
+        assert generate(records[0]) == [(0, '0_Joyce_WWang'), (1, '1_ANKFNK_2134')]
+
+        # positions are validated when the plan is compiled
+        invalid_strats = [
+            [
+                PSigCharsAtSignatureSpec(**{'type': 'characters-at', 'feature': 0, 'config': {'pos': [':']}})
+            ]
+        ]
+        with pytest.raises(ValueError):
+            compile_signature_strategies(invalid_strats, "")
@@ -1,4 +1,7 @@
+import random
 import time
+
+import numpy as np
 import pytest
 from blocklib.simmeasure import EditSim, DiceSim
 
@@ -53,4 +56,112 @@ def test_dicesim():
     s2 = 'Jo is'
     score_dice = sim.sim(s1, s2, cache=True)
     score_edit = EditSim({}).sim(s1, s2)
-    assert score_dice > score_edit
\ No newline at end of file
+    assert score_dice > score_edit
+
+
+def reference_edit_sim(str1, str2, min_threshold=None):
+    """The row by row dynamic program EditSim.sim used before the bit-parallel version."""
+    if (str1 == '') or (str2 == ''):
+        return 0.0
+    elif str1 == str2:
+        return 1.0
+    n, m = len(str1), len(str2)
+    max_len = max(n, m)
+    if min_threshold is not None:
+        w = 1.0 - float(abs(n - m)) / float(max_len)
+        if w < min_threshold:
+            return 0.0
+        max_dist = (1.0 - min_threshold) * max_len
+    if n > m:
+        str1, str2 = str2, str1
+        n, m = m, n
+    current = list(range(n + 1))
+    for i in range(1, m + 1):
+        previous = current
+        current = [i] + n * [0]
+        for j in range(1, n + 1):
+            substitute = previous[j - 1] + (str1[j - 1] != str2[i - 1])
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, substitute)
+        if (min_threshold is not None) and (min(current) > max_dist):
+            return 1.0 - float(max_dist + 1) / float(max_len)
+    return 1.0 - float(current[n]) / float(max_len)
+
+
+@pytest.mark.parametrize('min_threshold', [None, 0.0, 0.5, 0.7, 0.9, 1.0])
+def test_editsim_matches_dynamic_program(min_threshold):
+    rng = random.Random(0)
+    config = {} if min_threshold is None else {'min_threshold': min_threshold}
+    sim = EditSim(config)
+    pairs = [('', 'abc'), ('abc', 'abc'), ('a' * 70, 'a' * 69 + 'b'), ('ab' * 40, 'ba' * 45)]
+    for _ in range(500):
+        length = rng.choice([1, 2, 5, 10, 63, 64, 65])
+        s1 = ''.join(rng.choice('abcé') for _ in range(rng.randint(1, length)))
+        s2 = ''.join(rng.choice('abcé') for _ in range(rng.randint(1, length + 3)))
+        pairs.append((s1, s2))
+    expected = [reference_edit_sim(s1, s2, min_threshold) for s1, s2 in pairs]
+    assert [sim.sim(s1, s2) for s1, s2 in pairs] == expected
+    sims = sim.sim_many(pairs)
+    assert isinstance(sims, np.ndarray)
+    assert sims.tolist() == expected
+    assert sim.sim_many([]).tolist() == []
+
+
+def test_dicesim_bounded_cache():
+    config = dict(ngram_len=2, ngram_padding=True, padding_start_char='^', padding_end_char='$',
+                  q_gram_cache_size=3, sim_cache_size=2)
+    sim = DiceSim(config)
+    uncached = DiceSim(config)
+    words = ['peter', 'pete', 'petra', 'anna', 'ann']
+    pairs = [(a, b) for a in words for b in words if a != b]
+    expected = [uncached.sim(a, b) for a, b in pairs]
+    assert [sim.sim(a, b, cache=True) for a, b in pairs] == expected
+    assert uncached.cache_info()['sim'].currsize == 0
+
+    info = sim.cache_info()
+    assert info['q_gram'].currsize == 3 and info['sim'].currsize == 2
+    assert info['q_gram'].evictions > 0 and info['sim'].evictions > 0
+
+    # the similarity is symmetric, the reversed pair is a cache hit
+    sim.sim_cache.clear()
+    assert sim.sim('anna', 'ann', cache=True) == sim.sim('ann', 'anna', cache=True)
+    assert sim.cache_info()['sim'].hits == 1
+
+
+def test_dicesim_cache_shared_by_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    config = dict(ngram_len=2, ngram_padding=False, padding_start_char='', padding_end_char='',
+                  q_gram_cache_size=8, sim_cache_size=16)
+    sim = DiceSim(config)
+    rng = random.Random(1)
+    pairs = [(''.join(rng.choice('abc') for _ in range(5)), ''.join(rng.choice('abc') for _ in range(6)))
+             for _ in range(2000)]
+    expected = [DiceSim(config).sim(a, b) for a, b in pairs]
+    with ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(lambda pair: sim.sim(*pair, cache=True), pairs)) == expected
+    info = sim.cache_info()['sim']
+    assert info.currsize <= 16 and info.hits + info.misses == sum(a != b for a, b in pairs)
+
+
+@pytest.mark.parametrize('ngram_padding', [True, False])
+def test_dicesim_sim_pairs_matches_sim(ngram_padding):
+    config = dict(ngram_len=2, ngram_padding=ngram_padding, padding_start_char='^', padding_end_char='$')
+    sim = DiceSim(config)
+    rng = random.Random(2)
+    strings_a = ['aaa', 'aaaa', 'abab', 'baba'] + [''.join(rng.choice('abcé') for _ in range(rng.randint(2, 9)))
+                                                  for _ in range(200)]
+    strings_b = strings_a[:50] + ['abcabc', 'aaa']
+    vectors_a, vectors_b = sim.encode(strings_a), sim.encode(strings_b)
+    assert len(vectors_a) == len(strings_a)
+    rows_a = np.array([rng.randrange(len(strings_a)) for _ in range(3000)] + [0, 1, 2])
+    rows_b = np.array([rng.randrange(len(strings_b)) for _ in range(3000)] + [len(strings_b) - 1, 0, 3])
+
+    expected = [sim.sim(strings_a[i], strings_b[j]) for i, j in zip(rows_a, rows_b)]
+    assert sim.sim_pairs(vectors_a, vectors_b, rows_a, rows_b).tolist() == expected
+    assert sim.sim_pairs(vectors_a, vectors_b, rows_a, rows_b, n_jobs=2).tolist() == expected
+    # pairs within one column
+    expected = [sim.sim(strings_a[i], strings_a[j]) for i, j in zip(rows_a, rows_a[::-1])]
+    assert sim.sim_pairs(vectors_a, vectors_a, rows_a, rows_a[::-1]).tolist() == expected
+
+    assert sim.sim_pairs(vectors_a, vectors_b, [], []).tolist() == []
+    with pytest.raises(ValueError):
+        sim.sim_pairs(vectors_a, vectors_b, [0, 1], [0])
@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pytest
+
+from blocklib import generate_blocks, generate_candidate_blocks, save_blocks, load_blocks, save_candidate_blocks, \
+    load_candidate_blocks
+from blocklib.storage import load_meta
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_candidate_blocks_roundtrip(two_party_data, blocking_schema, mmap, tmp_path):
+    candidate_objs = [generate_candidate_blocks(data, blocking_schema) for data in two_party_data]
+    loaded_objs = []
+    for i, candidate_obj in enumerate(candidate_objs):
+        save_candidate_blocks(str(tmp_path / str(i)), candidate_obj)
+        loaded = load_candidate_blocks(str(tmp_path / str(i)), mmap=mmap)
+        assert loaded.blocks.to_dict() == candidate_obj.blocks
+        assert loaded.stats == candidate_obj.stats
+        assert type(loaded.state) == type(candidate_obj.state)
+        assert loaded.state.config == candidate_obj.state.config
+        assert isinstance(loaded.blocks.record_ids, np.memmap) == mmap
+        loaded_objs.append(loaded)
+
+    expected = generate_blocks(candidate_objs, K=2)
+    assert [b.to_dict() for b in generate_blocks(loaded_objs, K=2)] == expected
+
+
+def test_blocks_roundtrip(tmp_path):
+    blocks = {b'\x01\x00\x00\x00': [3, 1], b'\x02\x00\x00\x00': [2]}
+    save_blocks(str(tmp_path), blocks)
+    meta = load_meta(str(tmp_path))
+    assert meta['key_type'] == 'bytes'
+    assert meta['num_blocks'] == 2 and meta['num_record_ids'] == 3
+    assert json.loads((tmp_path / 'keys.json').read_text()) == ['01000000', '02000000']
+    assert np.load(str(tmp_path / 'offsets.npy')).tolist() == [0, 2, 3]
+    assert load_blocks(str(tmp_path)).to_dict() == blocks
+
+    save_blocks(str(tmp_path), {'a': ['id1'], 'b': []})
+    assert load_blocks(str(tmp_path)).to_dict() == {'a': ['id1'], 'b': []}
+
+    with pytest.raises(ValueError):
+        load_candidate_blocks(str(tmp_path))
+    with pytest.raises(ValueError):
+        save_blocks(str(tmp_path), {'a': [1], b'b': [2]})
+    with pytest.raises(ValueError):
+        save_blocks(str(tmp_path), {'a': [1, 'id2']})
+
+    (tmp_path / 'meta.json').write_text(json.dumps({'format': 'blocklib-blocks', 'version': 99}))
+    with pytest.raises(ValueError):
+        load_blocks(str(tmp_path))
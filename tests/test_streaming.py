@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from blocklib import generate_candidate_blocks, generate_candidate_blocks_from_chunks
+from blocklib.streaming import SpillingPostings
+
+rnd = random.Random(42)
+data = [('id{}'.format(i), rnd.choice(['Joyce', 'Fred', 'Lindsay', 'Ann', 'Bob']),
+         rnd.choice(['Wang', 'Hsu', 'Shan', 'Yu', 'Zhang', 'Jone']), rnd.choice(['Ashfield', 'Burwood', '']))
+        for i in range(200)]
+header = ['ID', 'firstname', 'lastname', 'suburb']
+
+psig_schema = {'type': 'p-sig', 'version': 1, 'config': {
+    "blocking-features": ['firstname', 'lastname'],
+    "filter": {"type": "ratio", "max": 0.1, "min": 0.01},
+    "blocking-filter": {"type": "bloom filter", "number-hash-functions": 4, "bf-len": 2048},
+    "signatureSpecs": [
+        [{"type": "feature-value", "feature": 'firstname'}, {"type": "feature-value", "feature": 'lastname'}],
+        [{"type": "characters-at", "feature": 'lastname', "config": {"pos": [0]}},
+         {"type": "feature-value", "feature": 'suburb'}],
+    ],
+    "null-sentinel": ""
+}}
+
+
+def chunked(records, size):
+    return (records[i:i + size] for i in range(0, len(records), size))
+
+
+@pytest.mark.parametrize('max_postings_in_memory', [None, 1, 50])
+def test_psig_from_chunks(max_postings_in_memory, tmp_path):
+    expected = generate_candidate_blocks(data, psig_schema, header=header)
+    result = generate_candidate_blocks_from_chunks(chunked(data, 17), psig_schema, header=header,
+                                                   max_postings_in_memory=max_postings_in_memory,
+                                                   spill_dir=str(tmp_path))
+    assert result.blocks == expected.blocks
+    assert result.stats == expected.stats
+    # spilled runs are deleted
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_psig_from_columnar_chunks():
+    pd = pytest.importorskip('pandas')
+    expected = generate_candidate_blocks(data, psig_schema, header=header)
+    frames = (pd.DataFrame(chunk, columns=header) for chunk in chunked(data, 30))
+    result = generate_candidate_blocks_from_chunks(frames, psig_schema, max_postings_in_memory=20)
+    assert result.blocks == expected.blocks
+    assert result.state.blocking_features_index == expected.state.blocking_features_index
+
+
+def test_lambda_fold_from_chunks():
+    schema = {'type': 'lambda-fold', 'version': 1, 'config': {
+        "blocking-features": [1, 2],
+        "Lambda": 5,
+        "bf-len": 2000,
+        "num-hash-funcs": 10,
+        "K": 20,
+        "random_state": 0,
+        "record-id-col": 0,
+        "input-clks": False
+    }}
+    expected = generate_candidate_blocks(data, schema)
+    result = generate_candidate_blocks_from_chunks(chunked(data, 33), schema, max_postings_in_memory=100)
+    assert result.blocks == expected.blocks
+    assert result.stats == expected.stats
+
+
+def test_from_chunks_empty():
+    with pytest.raises(ValueError):
+        generate_candidate_blocks_from_chunks([], psig_schema, header=header)
+
+
+def test_spilling_postings():
+    postings = SpillingPostings(2, max_postings_in_memory=2)
+    postings.add([{'a': [0, 1]}, {'x': [0]}])
+    assert postings.num_runs == 1
+    postings.add([{'a': [2], 'b': [3]}, {}])
+    assert postings.num_runs == 1
+    assert postings.merge() == [{'a': [0, 1, 2], 'b': [3]}, {'x': [0]}]
+    assert postings.merge(keep=[{'a'}, set()]) == [{'a': [0, 1, 2]}, {}]
+    postings.close()
+
+    with pytest.raises(ValueError):
+        SpillingPostings(1, max_postings_in_memory=0)
@@ -1,4 +1,13 @@
-from blocklib.stats import reversed_index_per_strategy_stats, reversed_index_stats
+import base64
+
+import numpy as np
+import pytest
+
+from blocklib import CompactReversedIndex
+from blocklib.stats import block_size_counts_stats, block_size_stats, reversed_index_per_strategy_stats, \
+    reversed_index_stats
+from blocklib.utils import deserialize_bitarray, deserialize_filters_packed, group_by_first_occurrence, \
+    packed_bits, resolve_n_jobs, shard_bounds
 
 
 def test_reversed_index_per_strategy_stats_empty():
@@ -20,4 +29,65 @@ def test_reversed_index_stats():
     assert stats['med_size'] == 2
     assert stats['avg_size'] == 10/3
     assert stats['sum_of_blocks'] == 10
+    assert 'percentiles' not in stats
+
+
+def test_reversed_index_stats_detailed():
+    reversed_index = {'one': [1], 'two': [1, 2], 'three': [1, 2, 3, 4, 5, 6, 7], 'four': [2, 3]}
+    stats = reversed_index_stats(reversed_index, detailed=True)
+    assert stats['std_size'] == pytest.approx(np.std([1, 2, 7, 2], ddof=1))
+    assert stats['percentiles']['p50'] == 2.0
+    assert stats['percentiles']['p99'] == pytest.approx(6.85)
+    assert stats['histogram'] == {'bin_edges': [0, 1, 2, 4, 8], 'counts': [0, 1, 2, 1]}
+    assert stats['sum_of_squared_sizes'] == 1 + 4 + 49 + 4
+    assert all(type(v) in (int, float) for v in stats.values() if not isinstance(v, dict))
+    assert reversed_index_stats(CompactReversedIndex.from_dict(reversed_index), detailed=True) == stats
+
+    stats = reversed_index_stats({}, detailed=True)
+    assert stats['sum_of_squared_sizes'] == 0
+    assert stats['histogram'] == {'bin_edges': [0, 1], 'counts': [0]}
+
+
+@pytest.mark.parametrize('lengths', [[], [3], [1, 2], [5, 1, 2, 2], [7, 1, 2, 2, 9], [4] * 6 + [1, 30]])
+def test_block_size_counts_stats(lengths):
+    counts = {}
+    for size in lengths:
+        counts[size] = counts.get(size, 0) + 1
+    assert block_size_counts_stats(counts) == block_size_stats(np.array(lengths, dtype=np.int64))
+
+
+def test_shard_bounds():
+    assert shard_bounds(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert shard_bounds(2, 4) == [(0, 1), (1, 2)]
+    assert shard_bounds(0, 4) == [(0, 0)]
+
+
+def test_resolve_n_jobs():
+    assert resolve_n_jobs(3) == 3
+    assert resolve_n_jobs(-1) >= 1
+    with pytest.raises(ValueError):
+        resolve_n_jobs(0)
+
+
+def test_packed_bits():
+    bits = np.array([[1, 0, 0, 1, 1, 0, 1, 0, 1, 1],
+                     [0, 1, 1, 0, 0, 0, 0, 1, 0, 1]], dtype=bool)
+    packed = np.packbits(bits, axis=1)
+    indices = [9, 0, 3, 7]
+    assert np.array_equal(packed_bits(packed, indices), bits[:, indices])
+
+
+def test_deserialize_filters_packed():
+    filters = [base64.encodebytes(bytes([1, 255])).decode(), base64.encodebytes(bytes([128, 0])).decode()]
+    packed, bf_len = deserialize_filters_packed(filters)
+    assert bf_len == 16
+    for row, f in zip(packed, filters):
+        assert np.array_equal(np.unpackbits(row).astype(bool), np.array(deserialize_bitarray(f).tolist(), dtype=bool))
+
 
+def test_group_by_first_occurrence():
+    keys = np.array(['b', 'a', 'b', 'c', 'a', 'b'])
+    first, order, offsets = group_by_first_occurrence(keys)
+    groups = [order[offsets[g]:offsets[g + 1]].tolist() for g in range(len(first))]
+    assert keys[first].tolist() == ['b', 'a', 'c']
+    assert groups == [[0, 2, 5], [1, 4], [3]]